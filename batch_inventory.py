@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+"""
+Run read-only inventory jobs (like listing locations) across many orgs in parallel.
+
+Orgs are defined in a YML manifest:
+
+    # defaults for all orgs
+    concurrency: 10
+    jobs: [locations]
+    orgs:
+      - name: acme
+        # YML file with cached service app tokens, as written by service_app.py
+        tokens: acme_tokens.yml
+        # optional: environment variables with client id and secret of the service app to refresh the access token
+        client_id_env: ACME_CLIENT_ID
+        client_secret_env: ACME_CLIENT_SECRET
+      - name: globex
+        # environment variable with an access token
+        token_env: GLOBEX_TOKEN
+        concurrency: 5
+        jobs: [locations, call_queues]
+
+All orgs are processed concurrently on one event loop; each org has its own connection pool limited to `concurrency`
+concurrent requests. Results of all orgs are merged into one NDJSON output: each row has the org name and the job
+name in addition to the object attributes. Wall-clock time is determined by the slowest org.
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from collections.abc import AsyncIterator, Callable
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from os.path import dirname, join, abspath
+from typing import Optional, TextIO, Union
+
+from dotenv import load_dotenv
+from pydantic import BaseModel
+from wxc_sdk.as_api import AsWebexSimpleApi
+from wxc_sdk.integration import Integration
+from wxc_sdk.tokens import Tokens
+from yaml import safe_load
+
+from web_app.flask_app.token_manager import TokenManager
+
+log = logging.getLogger(__name__)
+
+# job name -> function returning an async iterator of objects
+JOBS: dict[str, Callable[[AsWebexSimpleApi], AsyncIterator[BaseModel]]] = {
+    'locations': lambda api: api.locations.list_gen(),
+    'call_queues': lambda api: api.telephony.callqueue.list_gen(),
+    'people': lambda api: api.people.list_gen(),
+    'devices': lambda api: api.devices.list_gen(),
+}
+
+
+@dataclass
+class OrgSpec:
+    """
+    Org from the manifest
+    """
+    name: str
+    tokens: Optional[str] = None
+    token_env: Optional[str] = None
+    client_id_env: Optional[str] = None
+    client_secret_env: Optional[str] = None
+    concurrency: int = 10
+    jobs: list[str] = field(default_factory=lambda: ['locations'])
+
+
+@dataclass
+class OrgResult:
+    """
+    Result of all jobs for one org
+    """
+    name: str
+    rows: dict[str, int] = field(default_factory=dict)
+    seconds: float = 0
+    error: Optional[str] = None
+
+
+def read_manifest(path: str) -> list[OrgSpec]:
+    """
+    Read manifest; relative token file paths are relative to the manifest
+    """
+    with open(path, mode='r') as f:
+        manifest = safe_load(f)
+    defaults = {k: v for k, v in manifest.items() if k in ('concurrency', 'jobs')}
+    orgs = []
+    for org in manifest['orgs']:
+        spec = OrgSpec(**(defaults | org))
+        if not (spec.tokens or spec.token_env):
+            raise ValueError(f'{spec.name}: tokens or token_env required')
+        if spec.tokens:
+            spec.tokens = join(dirname(abspath(path)), spec.tokens)
+        if unknown := set(spec.jobs) - set(JOBS):
+            raise ValueError(f'{spec.name}: unknown jobs: {", ".join(sorted(unknown))}')
+        orgs.append(spec)
+    return orgs
+
+
+def get_tokens(spec: OrgSpec) -> Union[str, Tokens]:
+    """
+    Get tokens for an org: access token from an environment variable or cached tokens from a YML file. Cached tokens
+    are refreshed if they expire within an hour and client id and secret are available. Refreshes take the same lock
+    as the web app and other scripts using the token file; see :class:`TokenManager`
+    """
+    if spec.token_env:
+        if not (access_token := os.getenv(spec.token_env)):
+            raise KeyError(f'environment variable {spec.token_env} not defined')
+        return access_token
+
+    def refresh() -> Tokens:
+        # called with the lock held: the tokens in the file are the latest tokens
+        if (tokens := manager.read_tokens_from_file()) is None:
+            raise KeyError(f'no tokens in {spec.tokens}')
+        if not (spec.client_id_env and spec.client_secret_env):
+            raise KeyError('access token expired and no client id and secret to refresh the token')
+        integration = Integration(client_id=os.getenv(spec.client_id_env),
+                                  client_secret=os.getenv(spec.client_secret_env),
+                                  scopes=[], redirect_url=None)
+        integration.refresh(tokens=tokens)
+        return tokens
+
+    manager = TokenManager(path=spec.tokens, get_new_tokens=refresh, refresh_margin=60 * 60)
+    return manager.get_tokens()
+
+
+async def run_org(spec: OrgSpec, output: TextIO) -> OrgResult:
+    """
+    Run all jobs for one org concurrently and write rows to the output as they come in
+    """
+    result = OrgResult(name=spec.name)
+    start = time.perf_counter()
+
+    async def run_job(api: AsWebexSimpleApi, job: str):
+        result.rows[job] = 0
+        async for obj in JOBS[job](api):
+            row = {'org': spec.name, 'job': job} | obj.model_dump(mode='json', by_alias=True, exclude_none=True)
+            # all writes happen on the event loop thread: rows of different orgs/jobs don't interleave
+            output.write(json.dumps(row, separators=(',', ':')))
+            output.write('\n')
+            result.rows[job] += 1
+
+    try:
+        # token refresh is blocking: run it in a thread so that other orgs can proceed
+        tokens = await asyncio.to_thread(get_tokens, spec)
+        async with AsWebexSimpleApi(tokens=tokens, concurrent_requests=spec.concurrency) as api:
+            await asyncio.gather(*[run_job(api, job) for job in spec.jobs])
+    except Exception as e:
+        log.error(f'{spec.name}: {e}')
+        result.error = f'{e}'
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+async def run_batch(orgs: list[OrgSpec], output: TextIO, max_orgs: int = 0) -> list[OrgResult]:
+    """
+    Run jobs for all orgs
+
+    :param orgs: orgs from the manifest
+    :param output: output for the merged NDJSON rows
+    :param max_orgs: maximum number of orgs processed at the same time; 0: no limit
+    """
+    sem = asyncio.Semaphore(max_orgs or len(orgs) or 1)
+
+    async def run_limited(spec: OrgSpec) -> OrgResult:
+        async with sem:
+            return await run_org(spec, output)
+
+    return await asyncio.gather(*[run_limited(spec) for spec in orgs])
+
+
+def main():
+    parser = ArgumentParser(description='Run read-only inventory jobs across orgs in parallel')
+    parser.add_argument('manifest', help='YML manifest with the orgs')
+    parser.add_argument('--output', '-o', help='output file for merged NDJSON rows; default: stdout')
+    parser.add_argument('--max-orgs', type=int, default=0,
+                        help='maximum number of orgs processed at the same time; default: no limit')
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.WARNING)
+    orgs = read_manifest(args.manifest)
+    start = time.perf_counter()
+    with open(args.output, mode='w') if args.output else nullcontext(sys.stdout) as output:
+        results = asyncio.run(run_batch(orgs, output, max_orgs=args.max_orgs))
+    elapsed = time.perf_counter() - start
+
+    # summary on stderr
+    for result in results:
+        details = [f'error: {result.error}' if result.error else 'ok']
+        details.extend(f'{job}: {count}' for job, count in result.rows.items())
+        details.append(f'{result.seconds:.2f} s')
+        print(f'{result.name}: {", ".join(details)}', file=sys.stderr)
+    slowest = max((r.seconds for r in results), default=0)
+    print(f'{len(results)} orgs in {elapsed:.2f} s (slowest org {slowest:.2f} s, '
+          f'sum of all orgs {sum(r.seconds for r in results):.2f} s)', file=sys.stderr)
+    if any(r.error for r in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+"""
+Export locations as NDJSON or CSV.
+
+Locations are read page by page, filtered and written as they come in; the full set of locations is never held in
+memory. Rows per second and page latencies are reported on stderr.
+"""
+import csv
+import logging
+import os
+import re
+import sys
+import time
+from argparse import ArgumentParser
+from collections.abc import Callable, Iterable
+from contextlib import nullcontext
+from typing import Optional, TextIO
+
+from dotenv import load_dotenv
+from requests import Response
+from wxc_sdk import WebexSimpleApi
+from wxc_sdk.locations import Location
+
+from web_app.flask_app.transport import default_transport
+
+CSV_FIELDS = ['id', 'name', 'address1', 'address2', 'city', 'state', 'postal_code', 'country', 'time_zone']
+
+
+class PageStats:
+    """
+    Collects page latencies of an API session and row counts
+    """
+
+    def __init__(self, verbose: bool = False):
+        self.verbose = verbose
+        self.start = time.perf_counter()
+        self.pages = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.read = 0
+        self.written = 0
+
+    def response_callback(self, response: Response, diff_ns: int):
+        """
+        Response callback registered with the REST session; each response is one page of locations
+        """
+        latency = diff_ns / 1e9
+        self.pages += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        if self.verbose:
+            print(f'page {self.pages}: {response.status_code} in {latency * 1000:.0f} ms, '
+                  f'{self.read} rows read, {self.written} rows written', file=sys.stderr)
+
+    def summary(self) -> str:
+        elapsed = time.perf_counter() - self.start
+        return (f'{self.written} of {self.read} locations written in {elapsed:.2f} s '
+                f'({self.read / elapsed:.0f} rows/s), {self.pages} pages, '
+                f'page latency avg {self.pages and self.latency_total / self.pages * 1000:.0f} ms, '
+                f'max {self.latency_max * 1000:.0f} ms')
+
+
+def location_filter(state: str = None, country: str = None, name: str = None) -> Callable[[Location], bool]:
+    """
+    Get a filter function for locations
+
+    :param state: state code; case-insensitive
+    :param country: ISO-3166 2-letter country code; case-insensitive
+    :param name: regular expression the location name has to match (search)
+    """
+    state = state and state.upper()
+    country = country and country.upper()
+    name_re = name and re.compile(name, flags=re.IGNORECASE)
+
+    def accept(location: Location) -> bool:
+        address = location.address
+        if state and (not address or (address.state or '').upper() != state):
+            return False
+        if country and (not address or (address.country or '').upper() != country):
+            return False
+        if name_re and not name_re.search(location.name or ''):
+            return False
+        return True
+
+    return accept
+
+
+def write_ndjson(locations: Iterable[Location], output: TextIO, stats: PageStats):
+    for location in locations:
+        output.write(location.model_dump_json(by_alias=True, exclude_none=True))
+        output.write('\n')
+        stats.written += 1
+
+
+def write_csv(locations: Iterable[Location], output: TextIO, stats: PageStats):
+    writer = csv.DictWriter(output, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    for location in locations:
+        address = location.address
+        writer.writerow({'id': location.location_id,
+                         'name': location.name,
+                         'address1': address and address.address1,
+                         'address2': address and address.address2,
+                         'city': address and address.city,
+                         'state': address and address.state,
+                         'postal_code': address and address.postal_code,
+                         'country': address and address.country,
+                         'time_zone': location.time_zone})
+        stats.written += 1
+
+
+def get_tokens(source: str):
+    """
+    Get tokens from the selected source
+    """
+    if source == 'service-app':
+        from service_app import get_tokens as get_service_app_tokens
+        return get_service_app_tokens()
+    if source == 'integration':
+        from list_locations_sdk_int_tokens import get_tokens as get_integration_tokens
+        return get_integration_tokens()
+    if not (access_token := os.getenv('WEBEX_TOKEN')):
+        raise KeyError('WEBEX_TOKEN environment variable not defined')
+    return access_token
+
+
+def export_locations(api: WebexSimpleApi, output: TextIO, output_format: str = 'ndjson',
+                     accept: Callable[[Location], bool] = None, page_size: Optional[int] = None,
+                     verbose: bool = False) -> PageStats:
+    """
+    Export locations
+
+    :param api: API to use
+    :param output: file to write to
+    :param output_format: 'ndjson' or 'csv'
+    :param accept: filter function
+    :param page_size: number of locations per page
+    :param verbose: report each page on stderr
+    :return: statistics
+    """
+    stats = PageStats(verbose=verbose)
+    callback_id = api.session.register_response_callback(stats.response_callback)
+    try:
+        params = {'max': page_size} if page_size else {}
+
+        def locations() -> Iterable[Location]:
+            # the SDK reads the next page only when the previous one has been consumed
+            for location in api.locations.list(**params):
+                stats.read += 1
+                if accept is None or accept(location):
+                    yield location
+
+        writer = write_csv if output_format == 'csv' else write_ndjson
+        writer(locations(), output, stats)
+    finally:
+        api.session.unregister_response_callback(callback_id)
+    return stats
+
+
+def main():
+    parser = ArgumentParser(description='Export locations as NDJSON or CSV')
+    parser.add_argument('--tokens', choices=['env', 'service-app', 'integration'], default='env',
+                        help='token source: WEBEX_TOKEN environment variable (default), cached service app tokens or '
+                             'cached integration tokens')
+    parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson', help='output format')
+    parser.add_argument('--output', '-o', help='output file; default: stdout')
+    parser.add_argument('--state', help='only export locations in this state')
+    parser.add_argument('--country', help='only export locations in this country (ISO-3166 2-letter code)')
+    parser.add_argument('--name', help='only export locations with a name matching this regular expression')
+    parser.add_argument('--page-size', type=int, help='number of locations per page')
+    parser.add_argument('--verbose', '-v', action='store_true', help='report each page on stderr')
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.WARNING)
+    tokens = get_tokens(args.tokens)
+    accept = location_filter(state=args.state, country=args.country, name=args.name)
+    with WebexSimpleApi(tokens=tokens) as api, \
+            (open(args.output, mode='w', newline='') if args.output else nullcontext(sys.stdout)) as output:
+        # pooled keep-alive connections of the shared transport: no new TLS handshake per page
+        default_transport().mount(api.session)
+        stats = export_locations(api, output, output_format=args.format, accept=accept, page_size=args.page_size,
+                                 verbose=args.verbose)
+    print(stats.summary(), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,37 +1,55 @@
 #!/usr/bin/env python
 """
 Demonstration of how to call a Webex API endpoint directly
+
+With --snapshot locations are read from the inventory snapshot of the web app instead; the snapshot has the locations
+in the same format as the API response
 """
+import json
 import os
+from argparse import ArgumentParser
 
-import requests
 from dotenv import load_dotenv
 
+from web_app.flask_app.inventory import open_snapshot
+from web_app.flask_app.transport import default_transport
+
 
 def main():
+    parser = ArgumentParser(description='List locations')
+    parser.add_argument('--snapshot', action='store_true',
+                        help='read locations from the inventory snapshot of the web app if there is a current one')
+    args = parser.parse_args()
+
     # load .env file
     load_dotenv()
 
     # after reading .env file all variables defined in the file are accessible as environment variables
     access_token = os.getenv('WEBEX_TOKEN')
 
-    url = 'https://webexapis.com/v1/locations'
-    with requests.Session() as session:
-        headers = {'Authorization': f'Bearer {access_token}'}
-        response = session.get(url=url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        print(f'{len(data["items"])} locations found')
-        for location in data['items']:
-            print(location)
-            print()
-
-        # look for locations in California
-        ca_locations = [location for location in data['items']
-                        if location['address']['state'] == 'CA']
+    store = open_snapshot(max_age=float(os.getenv('INVENTORY_MAX_AGE') or 3600)) if args.snapshot else None
+    if (rows := store and store.raw('locations')) is not None:
+        print(f'locations from inventory snapshot {store.path}')
+        data = {'items': [json.loads(row) for row in rows]}
+    else:
+        url = 'https://webexapis.com/v1/locations'
+        # session using the pooled keep-alive connections of the shared transport
+        with default_transport().session() as session:
+            headers = {'Authorization': f'Bearer {access_token}'}
+            response = session.get(url=url, headers=headers)
+            response.raise_for_status()
+            data = response.json()
+    print(f'{len(data["items"])} locations found')
+    for location in data['items']:
+        print(location)
         print()
-        print(f'{len(ca_locations)} locations in CA')
-        print(', '.join(loc['name'] for loc in ca_locations))
+
+    # look for locations in California
+    ca_locations = [location for location in data['items']
+                    if location['address']['state'] == 'CA']
+    print()
+    print(f'{len(ca_locations)} locations in CA')
+    print(', '.join(loc['name'] for loc in ca_locations))
 
 
 if __name__ == '__main__':
@@ -1,32 +1,47 @@
 #!/usr/bin/env python
 """
 Demonstration of how to call a Webex API endpoint using the SDK
+
+With --snapshot locations are read from the inventory snapshot of the web app instead
 """
 import os
-
+from argparse import ArgumentParser
 
 from dotenv import load_dotenv
 from wxc_sdk import WebexSimpleApi
 
+from web_app.flask_app.inventory import open_snapshot
+from web_app.flask_app.transport import default_transport
+
 
 def main():
+    parser = ArgumentParser(description='List locations')
+    parser.add_argument('--snapshot', action='store_true',
+                        help='read locations from the inventory snapshot of the web app if there is a current one')
+    args = parser.parse_args()
+
     load_dotenv()
 
     # after reading .env file all variables defined in the file are accessible as environment variables
     access_token = os.getenv('WEBEX_TOKEN')
 
-    with WebexSimpleApi(tokens=access_token) as api:
-        locations = list(api.locations.list())
-        print(f'{len(locations)} locations found')
-        for location in locations:
-            print(location)
-            print()
-
-        ca_locations = [location for location in locations
-                        if location.address.state == 'CA']
+    store = open_snapshot(max_age=float(os.getenv('INVENTORY_MAX_AGE') or 3600)) if args.snapshot else None
+    if (locations := store and store.locations()) is None:
+        with WebexSimpleApi(tokens=access_token) as api:
+            default_transport().mount(api.session)
+            locations = list(api.locations.list())
+    else:
+        print(f'locations from inventory snapshot {store.path}')
+    print(f'{len(locations)} locations found')
+    for location in locations:
+        print(location)
         print()
-        print(f'{len(ca_locations)} locations in CA')
-        print(', '.join(loc.name for loc in ca_locations))
+
+    ca_locations = [location for location in locations
+                    if location.address.state == 'CA']
+    print()
+    print(f'{len(ca_locations)} locations in CA')
+    print(', '.join(loc.name for loc in ca_locations))
 
 
 if __name__ == '__main__':
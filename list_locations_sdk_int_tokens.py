@@ -1,9 +1,12 @@
 #!/usr/bin/env python
 """
 Demonstration of how to call a Webex API endpoint using the SDK with cached integration tokens
+
+With --snapshot locations are read from the inventory snapshot of the web app instead
 """
 import os
-from os.path import splitext, basename, join, dirname
+from argparse import ArgumentParser
+from os.path import join, dirname
 
 from dotenv import load_dotenv
 
@@ -11,6 +14,9 @@ from wxc_sdk import WebexSimpleApi
 from wxc_sdk.integration import Integration
 from wxc_sdk.scopes import parse_scopes
 
+from web_app.flask_app.inventory import open_snapshot
+from web_app.flask_app.transport import default_transport
+
 
 def get_tokens():
     """
@@ -33,21 +39,31 @@ def get_tokens():
 
 
 def main():
-    load_dotenv()
-    tokens = get_tokens()
+    parser = ArgumentParser(description='List locations')
+    parser.add_argument('--snapshot', action='store_true',
+                        help='read locations from the inventory snapshot of the web app if there is a current one')
+    args = parser.parse_args()
 
-    with WebexSimpleApi(tokens=tokens) as api:
-        locations = list(api.locations.list())
-        print(f'{len(locations)} locations found')
-        for location in locations:
-            print(location)
-            print()
+    load_dotenv()
 
-        ca_locations = [location for location in locations
-                        if location.address.state == 'CA']
+    store = open_snapshot(max_age=float(os.getenv('INVENTORY_MAX_AGE') or 3600)) if args.snapshot else None
+    if (locations := store and store.locations()) is None:
+        # tokens are only needed if the locations are read from the API
+        with WebexSimpleApi(tokens=get_tokens()) as api:
+            default_transport().mount(api.session)
+            locations = list(api.locations.list())
+    else:
+        print(f'locations from inventory snapshot {store.path}')
+    print(f'{len(locations)} locations found')
+    for location in locations:
+        print(location)
         print()
-        print(f'{len(ca_locations)} locations in CA')
-        print(', '.join(loc.name for loc in ca_locations))
+
+    ca_locations = [location for location in locations
+                    if location.address.state == 'CA']
+    print()
+    print(f'{len(ca_locations)} locations in CA')
+    print(', '.join(loc.name for loc in ca_locations))
 
 
 if __name__ == '__main__':
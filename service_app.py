@@ -3,9 +3,12 @@
 Simple helper to work with service app tokens
 """
 import logging
+import os
+import tempfile
+from contextlib import contextmanager
 from json import dumps, loads
 from os import getenv
-from os.path import isfile, dirname, join
+from os.path import isfile, dirname, join, basename
 from typing import Optional
 
 from dotenv import load_dotenv
@@ -14,6 +17,12 @@ from wxc_sdk.integration import Integration
 from wxc_sdk.tokens import Tokens
 from yaml import safe_load, safe_dump
 
+try:
+    import fcntl
+except ImportError:
+    # no inter-process locking on Windows
+    fcntl = None
+
 __all__ = ['get_tokens']
 
 
@@ -24,6 +33,22 @@ def yml_path() -> str:
     return join(dirname(__file__), 'app_tokens.yml')
 
 
+@contextmanager
+def tokens_lock():
+    """
+    Exclusive lock on the token cache across processes; makes sure that only one process refreshes the tokens
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(f'{yml_path()}.lock', mode='a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
 def read_tokens_from_file() -> Optional[Tokens]:
     """
     Read service app tokens from YML file
@@ -43,10 +68,18 @@ def read_tokens_from_file() -> Optional[Tokens]:
 
 def write_tokens_to_file(tokens: Tokens):
     """
-    Write service app tokens to cache (YML file)
+    Write service app tokens to cache (YML file). Tokens are written to a temporary file which then atomically
+    replaces the cache
     """
-    with open(yml_path(), mode='w') as f:
-        safe_dump(tokens.model_dump(exclude_none=True), f)
+    path = yml_path()
+    fd, tmp_path = tempfile.mkstemp(dir=dirname(path), prefix=f'.{basename(path)}.')
+    try:
+        with os.fdopen(fd, mode='w') as f:
+            safe_dump(tokens.model_dump(exclude_none=True), f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
 
 
 def get_access_token() -> Tokens:
@@ -72,13 +105,13 @@ def get_tokens() -> Optional[Tokens]:
     """
     Get tokens from file .. or create a new access token using the refresh toen
     """
-    # try to read from file
-    tokens = read_tokens_from_file()
-    # .. or create new access token using refresh token
-    if tokens is None:
-        tokens = get_access_token()
-    if tokens.remaining < 24 * 60 * 60:
-        tokens = get_access_token()
+    # hold the lock while checking and refreshing: concurrent scripts don't all refresh at the same time
+    with tokens_lock():
+        # try to read from file
+        tokens = read_tokens_from_file()
+        # .. or create new access token using refresh token
+        if tokens is None or tokens.remaining < 24 * 60 * 60:
+            tokens = get_access_token()
     return tokens
 
 
@@ -1,13 +1,11 @@
 #!/usr/bin/env python3
-import logging
 import os
 
 from flask_app import create_app
+from flask_app.request_logging import configure_logging
 
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.DEBUG)
-    logging.getLogger('urllib3').setLevel(logging.INFO)
-    logging.getLogger('wxc_sdk.rest').setLevel(logging.INFO)
+    configure_logging(production=False)
     app = create_app()
     if os.path.exists('/proc/1/cgroup'):
         # in Docker
@@ -0,0 +1,3 @@
+"""
+Benchmarks of the portal API against an in-process stand-in for the Webex APIs
+"""
@@ -0,0 +1,337 @@
+"""
+In-process stand-in for the Webex APIs used by the portal.
+
+Serves a synthetic org (people, locations, phone numbers, devices, call queues with agents, call intercept and call
+waiting settings) on a local HTTP server. Latency, server errors and 429 responses can be injected and all calls are
+counted per endpoint.
+"""
+import json
+import logging
+import random
+import uuid
+from base64 import urlsafe_b64encode
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from flask import Flask, request
+from werkzeug.serving import make_server, BaseWSGIServer
+
+__all__ = ['Faults', 'MockWebex', 'webex_id']
+
+log = logging.getLogger(__name__)
+
+
+def webex_id(resource: str, i: int) -> str:
+    """
+    Id in the format of Webex ids: base64 encoded URI with a UUID; for example webex_id('PEOPLE', 1)
+    """
+    uri = f'ciscospark://us/{resource}/{uuid.UUID(int=i)}'
+    return urlsafe_b64encode(uri.encode()).decode().rstrip('=')
+
+
+@dataclass
+class Faults:
+    """
+    Faults injected into responses of the mock
+    """
+    #: latency added to each response in seconds
+    latency: float = 0.0
+    #: random additional latency of up to `jitter` seconds
+    jitter: float = 0.0
+    #: fraction of requests answered with a 500 error
+    error_rate: float = 0.0
+    #: fraction of requests answered with a 429 error
+    throttle_rate: float = 0.0
+    #: Retry-After header of 429 responses in seconds
+    retry_after: int = 1
+
+
+class MockWebex:
+    """
+    Stand-in for the Webex APIs used by the portal.
+
+    The org has `users` calling users spread across `locations` locations. Each user has a phone and a number and is
+    agent of `queues_per_user` of the `queues` call queues. Updates of call queues and user settings are kept in
+    memory.
+
+    Usage:
+
+        mock = MockWebex(users=100)
+        base = mock.start()
+        RestSession.BASE = base
+        ...
+        print(mock.counts())
+        mock.stop()
+    """
+
+    def __init__(self, users: int = 50, locations: int = 5, queues: int = 20, queues_per_user: int = 3,
+                 faults: Faults = None, seed: int = 0):
+        """
+        :param users: number of calling users
+        :param locations: number of locations
+        :param queues: number of call queues
+        :param queues_per_user: number of queues each user is agent of
+        :param faults: faults to inject; can be changed at any time
+        :param seed: seed for the random fault injection
+        """
+        self.faults = faults or Faults()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._calls: Counter[str] = Counter()
+        self._server: Optional[BaseWSGIServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+        org_id = webex_id('ORGANIZATION', 0)
+        self.locations = {location['id']: location
+                          for location in ({'id': webex_id('LOCATION', i),
+                                            'name': f'Location {i}',
+                                            'orgId': org_id,
+                                            'timeZone': 'America/Los_Angeles',
+                                            'address': {'address1': f'{i} Main Street',
+                                                        'city': 'San Jose',
+                                                        'state': 'CA',
+                                                        'postalCode': '95134',
+                                                        'country': 'US'}}
+                                           for i in range(locations))}
+        location_ids = list(self.locations)
+        self.people = {person['id']: person
+                       for person in ({'id': webex_id('PEOPLE', i),
+                                       'emails': [f'user{i}@example.com'],
+                                       'displayName': f'User {i}',
+                                       'firstName': 'User',
+                                       'lastName': f'{i}',
+                                       'orgId': org_id,
+                                       'type': 'person',
+                                       'locationId': location_ids[i % locations]}
+                                      for i in range(users))}
+        self.queues = {queue['id']: queue
+                       for queue in ({'id': webex_id('CALL_QUEUE', i),
+                                      'name': f'Queue {i}',
+                                      'locationId': location_ids[i % locations],
+                                      'locationName': self.locations[location_ids[i % locations]]['name'],
+                                      'extension': f'{1000 + i}',
+                                      'enabled': True,
+                                      'allowAgentJoinEnabled': i % 4 != 3,
+                                      'agents': []}
+                                     for i in range(queues))}
+        queue_ids = list(self.queues)
+        for i, person_id in enumerate(self.people):
+            for j in range(min(queues_per_user, queues)):
+                queue = self.queues[queue_ids[(i + j) % queues]]
+                queue['agents'].append({'id': person_id, 'type': 'PEOPLE', 'firstName': 'User', 'lastName': f'{i}',
+                                        'joinEnabled': j % 2 == 0})
+        self.call_intercept = {person_id: False for person_id in self.people}
+        self.call_waiting = {person_id: True for person_id in self.people}
+        self.connection_status = {person_id: 'connected' for person_id in self.people}
+        self.app = self._create_app()
+
+    def _create_app(self) -> Flask:
+        app = Flask(__name__)
+
+        @app.before_request
+        def inject_faults():
+            rule = request.url_rule.rule.removeprefix('/v1') if request.url_rule else request.path
+            with self._lock:
+                self._calls[f'{request.method} {rule}'] += 1
+            faults = self.faults
+            if faults.latency or faults.jitter:
+                time.sleep(faults.latency + self._random.uniform(0, faults.jitter))
+            roll = self._random.random()
+            if roll < faults.throttle_rate:
+                return self._error(429, 'Too many requests'), 429, {'Retry-After': str(faults.retry_after)}
+            if roll < faults.throttle_rate + faults.error_rate:
+                return self._error(500, 'Internal server error'), 500
+
+        @app.errorhandler(404)
+        def not_found(e):
+            return self._error(404, 'Not found'), 404
+
+        app.add_url_rule('/v1/people', view_func=self.list_people)
+        app.add_url_rule('/v1/locations', view_func=self.list_locations)
+        app.add_url_rule('/v1/locations/<location_id>', view_func=self.location_details)
+        app.add_url_rule('/v1/telephony/config/numbers', view_func=self.list_numbers)
+        app.add_url_rule('/v1/devices', view_func=self.list_devices)
+        app.add_url_rule('/v1/telephony/config/queues', view_func=self.list_queues)
+        app.add_url_rule('/v1/telephony/config/locations/<location_id>/queues/<queue_id>',
+                         view_func=self.queue_details, methods=['GET', 'PUT'])
+        app.add_url_rule('/v1/telephony/config/queues/agents/<agent_id>', view_func=self.agent_details)
+        app.add_url_rule('/v1/people/<person_id>/features/intercept', view_func=self.intercept,
+                         methods=['GET', 'PUT'])
+        app.add_url_rule('/v1/people/<person_id>/features/callWaiting', view_func=self.call_waiting_setting,
+                         methods=['GET', 'PUT'])
+        return app
+
+    @staticmethod
+    def _error(status: int, message: str) -> dict[str, Any]:
+        return {'message': message,
+                'errors': [{'description': message}],
+                'trackingId': f'MOCK_{status}_{time.monotonic_ns()}'}
+
+    @staticmethod
+    def _page(items: list[dict], key: str = 'items'):
+        """
+        Response with one page of a list; the next page is referenced in the Link header
+        """
+        start = int(request.args.get('start') or 0)
+        max_ = int(request.args.get('max') or 100)
+        headers = {}
+        if start + max_ < len(items):
+            args = request.args.to_dict() | {'start': start + max_, 'max': max_}
+            query = '&'.join(f'{k}={v}' for k, v in args.items())
+            headers['Link'] = f'<{request.base_url}?{query}>; rel="next"'
+        return {key: items[start:start + max_]}, 200, headers
+
+    @staticmethod
+    def _body() -> dict[str, Any]:
+        """
+        JSON body of a request. Some SDK methods send the body as a JSON encoded string
+        """
+        body = request.get_json()
+        return json.loads(body) if isinstance(body, str) else body
+
+    def list_people(self):
+        people = list(self.people.values())
+        if email := request.args.get('email'):
+            people = [p for p in people if email.lower() in p['emails']]
+        if request.args.get('callingData') != 'true':
+            people = [{k: v for k, v in p.items() if k != 'locationId'} for p in people]
+        return self._page(people)
+
+    def list_locations(self):
+        return self._page(list(self.locations.values()))
+
+    def location_details(self, location_id: str):
+        if (location := self.locations.get(location_id)) is None:
+            return self._error(404, 'Location not found'), 404
+        return location
+
+    def list_numbers(self):
+        numbers = []
+        owner_id = request.args.get('ownerId')
+        for i, person in enumerate(self.people.values()):
+            if owner_id and person['id'] != owner_id:
+                continue
+            location = self.locations[person['locationId']]
+            numbers.append({'phoneNumber': f'+1408555{i:04d}',
+                            'extension': f'{2000 + i}',
+                            'phoneNumberType': 'PRIMARY',
+                            'mainNumber': False,
+                            'tollFreeNumber': False,
+                            'state': 'ACTIVE',
+                            'location': {'id': location['id'], 'name': location['name']},
+                            'owner': {'id': person['id'], 'type': 'PEOPLE', 'firstName': person['firstName'],
+                                      'lastName': person['lastName']}})
+        return self._page(numbers, key='phoneNumbers')
+
+    def list_devices(self):
+        devices = []
+        person_id = request.args.get('personId')
+        for i, person in enumerate(self.people.values()):
+            if person_id and person['id'] != person_id:
+                continue
+            devices.append({'id': webex_id('DEVICE', i),
+                            'displayName': f'Phone of {person["displayName"]}',
+                            'personId': person['id'],
+                            'orgId': person['orgId'],
+                            'product': 'Cisco 8865',
+                            'productType': 'phone',
+                            'type': 'phone',
+                            'mac': f'0011223{i:05X}',
+                            'connectionStatus': self.connection_status[person['id']],
+                            'callingDeviceId': f'CALLING_DEVICE{i}',
+                            'webexDeviceId': f'WEBEX_DEVICE{i}',
+                            'sipUrls': [],
+                            'capabilities': [],
+                            'permissions': [],
+                            'tags': []})
+        return self._page(devices)
+
+    def list_queues(self):
+        if request.args.get('hasCxEssentials') == 'true':
+            return self._page([], key='queues')
+        return self._page([{k: v for k, v in queue.items() if k not in ('agents', 'allowAgentJoinEnabled')}
+                           for queue in self.queues.values()], key='queues')
+
+    def queue_details(self, location_id: str, queue_id: str):
+        queue = self.queues.get(queue_id)
+        if queue is None or queue['locationId'] != location_id:
+            return self._error(404, 'Call queue not found'), 404
+        if request.method == 'PUT':
+            body = self._body()
+            if (agents := body.get('agents')) is not None:
+                join_state = {agent['id']: agent.get('joinEnabled') for agent in agents}
+                with self._lock:
+                    for agent in queue['agents']:
+                        if join_state.get(agent['id']) is not None:
+                            agent['joinEnabled'] = join_state[agent['id']]
+            return '', 204
+        with self._lock:
+            return {k: v for k, v in queue.items() if k not in ('locationId', 'locationName')} | \
+                {'agents': [dict(agent) for agent in queue['agents']]}
+
+    def agent_details(self, agent_id: str):
+        if agent_id not in self.people:
+            return self._error(404, 'Agent not found'), 404
+        if request.args.get('hasCxEssentials') == 'true':
+            queues = []
+        else:
+            queues = [{'id': queue['id'],
+                       'name': queue['name'],
+                       'locationId': queue['locationId'],
+                       'locationName': queue['locationName'],
+                       'extension': queue['extension']}
+                      for queue in self.queues.values()
+                      if any(agent['id'] == agent_id for agent in queue['agents'])]
+        person = self.people[agent_id]
+        return {'agent': {'id': agent_id, 'firstName': person['firstName'], 'lastName': person['lastName']},
+                'queues': queues}
+
+    def intercept(self, person_id: str):
+        if person_id not in self.people:
+            return self._error(404, 'Person not found'), 404
+        if request.method == 'PUT':
+            self.call_intercept[person_id] = self._body()['enabled']
+            return '', 204
+        return {'enabled': self.call_intercept[person_id]}
+
+    def call_waiting_setting(self, person_id: str):
+        if person_id not in self.people:
+            return self._error(404, 'Person not found'), 404
+        if request.method == 'PUT':
+            self.call_waiting[person_id] = self._body()['enabled']
+            return '', 204
+        return {'enabled': self.call_waiting[person_id]}
+
+    def start(self) -> str:
+        """
+        Start the mock on a free local port
+
+        :return: base URL to be used instead of https://webexapis.com/v1
+        """
+        self._server = make_server('127.0.0.1', 0, self.app, threaded=True)
+        self._thread = threading.Thread(target=self._server.serve_forever, name='mock-webex', daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self._server.port}/v1'
+
+    def counts(self) -> dict[str, int]:
+        """
+        Number of calls per endpoint ("<method> <url rule>") since the last :meth:`reset_counts`
+        """
+        with self._lock:
+            return dict(self._calls)
+
+    def reset_counts(self):
+        with self._lock:
+            self._calls.clear()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Load test of the portal API endpoints against the in-process Webex stand-in.
+
+Run from the web_app directory:
+
+    python -m benchmark.run_benchmark --concurrency 20 --requests 500 --latency 0.05
+
+For each endpoint `--requests` requests are sent by `--concurrency` threads, each request on behalf of one of
+`--users` logged-in users (round-robin). Requests are sent through the Flask test client: the measured latencies
+include all of the portal's request handling but no HTTP overhead on the portal side. Calls from the portal to the
+Webex APIs are real HTTP requests to the stand-in.
+
+Reported per endpoint: p50/p95/p99 latency, throughput, errors and the number of upstream (Webex API) calls per
+endpoint of the stand-in. `--json` writes the results to a file to compare runs and catch regressions.
+"""
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from os.path import join
+from typing import Optional
+from unittest.mock import patch
+
+from flask.testing import FlaskClient
+from wxc_sdk.rest import RestSession
+from wxc_sdk.tokens import Tokens
+from yaml import safe_dump
+
+from .mock_webex import Faults, MockWebex
+
+ENDPOINTS = ['userinfo', 'userqueues', 'userphones', 'useroptions']
+
+
+@dataclass
+class EndpointResult:
+    """
+    Benchmark result for one endpoint
+    """
+    endpoint: str
+    requests: int
+    errors: int
+    seconds: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    throughput: float
+    upstream_calls: int
+    upstream: dict[str, int] = field(default_factory=dict)
+
+
+def percentiles(latencies: list[float]) -> tuple[float, float, float]:
+    """
+    p50, p95 and p99 of a list of latencies
+    """
+    if len(latencies) < 2:
+        latency = latencies[0] if latencies else 0.0
+        return latency, latency, latency
+    q = statistics.quantiles(latencies, n=100, method='inclusive')
+    return q[49], q[94], q[98]
+
+
+class PortalClients:
+    """
+    One test client per user, each with a session of the user.
+
+    Clients are created once and then shared by all threads: with round-robin selection of users a client is only
+    used by one thread at a time as long as there are more users than concurrent requests
+    """
+
+    def __init__(self, app, mock: MockWebex):
+        self.app = app
+        self.users = list(mock.people.values())
+        self._lock = threading.Lock()
+        self._clients: dict[int, FlaskClient] = {}
+
+    def client(self, i: int) -> FlaskClient:
+        user_index = i % len(self.users)
+        with self._lock:
+            if (client := self._clients.get(user_index)) is None:
+                person = self.users[user_index]
+                client = self.app.test_client()
+                with client.session_transaction() as session:
+                    session['user'] = {'person_id': person['id'],
+                                       'location_id': person['locationId'],
+                                       'display_name': person['displayName'],
+                                       'emails': person['emails']}
+                self._clients[user_index] = client
+        return client
+
+
+def run_endpoint(clients: PortalClients, mock: MockWebex, endpoint: str, requests: int,
+                 concurrency: int) -> EndpointResult:
+    """
+    Send requests to one endpoint and collect latencies and upstream calls
+    """
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def send(i: int):
+        nonlocal errors
+        client = clients.client(i)
+        start = time.perf_counter()
+        response = client.get(f'/api/{endpoint}')
+        latency = time.perf_counter() - start
+        data = response.get_json(silent=True)
+        failed = response.status_code != 200 or (isinstance(data, dict) and data.get('success') is False)
+        with lock:
+            latencies.append(latency)
+            errors += failed
+
+    mock.reset_counts()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='bench') as pool:
+        list(pool.map(send, range(requests)))
+    seconds = time.perf_counter() - start
+    upstream = mock.counts()
+    p50, p95, p99 = percentiles(latencies)
+    return EndpointResult(endpoint=endpoint, requests=requests, errors=errors, seconds=seconds,
+                          p50_ms=p50 * 1000, p95_ms=p95 * 1000, p99_ms=p99 * 1000,
+                          throughput=requests / seconds,
+                          upstream_calls=sum(upstream.values()), upstream=upstream)
+
+
+def print_results(results: list[EndpointResult], verbose: bool = False):
+    print(f'{"endpoint":<12} {"requests":>8} {"errors":>6} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} '
+          f'{"req/s":>8} {"upstream":>8} {"per req":>7}')
+    for r in results:
+        print(f'{r.endpoint:<12} {r.requests:>8} {r.errors:>6} {r.p50_ms:>8.1f} {r.p95_ms:>8.1f} {r.p99_ms:>8.1f} '
+              f'{r.throughput:>8.1f} {r.upstream_calls:>8} {r.upstream_calls / r.requests:>7.2f}')
+        if verbose:
+            for call, count in sorted(r.upstream.items()):
+                print(f'    {count:>6} {call}')
+
+
+def create_portal(mock: MockWebex, token_dir: str, backend: str = 'sync', cache_ttl: Optional[float] = None,
+                  queue_index: bool = False, rate_limit: float = 0, inventory: bool = False,
+                  single_flight: bool = True):
+    """
+    Create the portal app using the stand-in for all Webex API calls
+    """
+    base = mock.start()
+    RestSession.BASE = base
+    if backend == 'async':
+        # only the async backend loads the async SDK
+        from wxc_sdk.as_rest import AsRestSession
+        AsRestSession.BASE = base
+
+    # configuration for the benchmark; takes precedence over settings in .env
+    os.environ['API_BACKEND'] = backend
+    os.environ['WEBEX_RATE_LIMIT'] = str(rate_limit)
+    os.environ['QUEUE_INDEX_INTERVAL'] = '300' if queue_index else '0'
+    os.environ['USER_DIRECTORY_INTERVAL'] = '0'
+    os.environ['INVENTORY_INTERVAL'] = '900' if inventory else '0'
+    os.environ['SINGLE_FLIGHT'] = '1' if single_flight else '0'
+    # temporary snapshot database: the app's database is not touched
+    os.environ['INVENTORY_PATH'] = join(token_dir, 'inventory.db')
+    os.environ['SESSION_BACKEND'] = 'filesystem'
+    if cache_ttl is not None:
+        os.environ['CACHE_TTL'] = str(cache_ttl)
+
+    # valid tokens in a temporary token file: no token refresh and the app's token file is not touched
+    tokens = Tokens(access_token='benchmark', expires_in=14 * 24 * 60 * 60)
+    tokens.set_expiration()
+    token_path = join(token_dir, 'app_tokens.yml')
+    with open(token_path, mode='w') as f:
+        safe_dump(tokens.model_dump(mode='json', exclude_none=True), f)
+
+    from flask_app.app_with_tokens import AppWithTokens
+    from flask_app import create_app
+    with patch.object(AppWithTokens, 'yml_path', staticmethod(lambda: token_path)):
+        app = create_app()
+    if queue_index:
+        # wait for the first refresh cycle of the queue index
+        while app.queue_index.memberships(next(iter(mock.people))) is None:
+            time.sleep(0.1)
+    if inventory:
+        # wait for the first snapshot of all kinds
+        while not app.inventory.ready:
+            time.sleep(0.1)
+    return app
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark the portal API against a stand-in for the Webex APIs')
+    parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=ENDPOINTS, help='endpoints to test')
+    parser.add_argument('--requests', type=int, default=200, help='number of requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=10, help='number of concurrent requests')
+    parser.add_argument('--users', type=int, default=50, help='number of users sending requests')
+    parser.add_argument('--queues', type=int, default=20, help='number of call queues')
+    parser.add_argument('--queues-per-user', type=int, default=3, help='number of queues each user is agent of')
+    parser.add_argument('--latency', type=float, default=0.05, help='latency of Webex API calls in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random additional latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of Webex API calls failing with 500')
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help='fraction of Webex API calls failing with 429')
+    parser.add_argument('--backend', choices=['sync', 'async'], default='sync', help='API backend of the portal')
+    parser.add_argument('--cache-ttl', type=float, help='lifetime of cache entries; 0 disables caching')
+    parser.add_argument('--queue-index', action='store_true', help='answer queue requests from the queue index')
+    parser.add_argument('--inventory', action='store_true',
+                        help='answer user info and phone requests from the inventory snapshot')
+    parser.add_argument('--rate-limit', type=float, default=0,
+                        help='rate limit for Webex API calls in requests per second; default: no limit')
+    parser.add_argument('--no-single-flight', action='store_true',
+                        help="don't merge identical concurrent Webex API reads")
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--verbose', '-v', action='store_true',
+                        help='show upstream calls per Webex API endpoint and log errors')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    # don't log each request to the stand-in
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    if not args.verbose:
+        # failed requests are counted; don't log each error
+        logging.getLogger('flask_app').setLevel(logging.CRITICAL)
+
+    mock = MockWebex(users=args.users, queues=args.queues, queues_per_user=args.queues_per_user,
+                     faults=Faults(latency=args.latency, jitter=args.jitter))
+    with tempfile.TemporaryDirectory() as token_dir:
+        app = create_portal(mock, token_dir, backend=args.backend, cache_ttl=args.cache_ttl,
+                            queue_index=args.queue_index, rate_limit=args.rate_limit,
+                            inventory=args.inventory, single_flight=not args.no_single_flight)
+        # faults only apply to the measured requests, not to the initial load of the queue index
+        mock.faults.error_rate = args.error_rate
+        mock.faults.throttle_rate = args.throttle_rate
+        clients = PortalClients(app, mock)
+        results = [run_endpoint(clients, mock, endpoint, requests=args.requests, concurrency=args.concurrency)
+                   for endpoint in args.endpoints]
+        merged = app.single_flight.metrics()['merged'] if app.single_flight is not None else 0
+        mock.stop()
+
+    print(f'{args.users} users, concurrency {args.concurrency}, backend {args.backend}, '
+          f'upstream latency {args.latency * 1000:.0f} ms', file=sys.stderr)
+    print_results(results, verbose=args.verbose)
+    print(f'{merged} Webex API reads merged with identical reads in flight', file=sys.stderr)
+    if args.json:
+        with open(args.json, mode='w') as f:
+            json.dump({'args': vars(args), 'results': [asdict(r) for r in results]}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of response shaping and serialization.
+
+Run from the web_app directory:
+
+    python -m benchmark.serialization_benchmark --numbers 200 --queues 200
+
+Compares building and serializing the /api/userinfo and /api/userqueues responses of a user with many numbers and
+queues:
+    * before: model_dump(mode='json') of each number and json.dumps(); the default of flask_restx
+    * after: declared fields (Shape) and serialization with orjson
+"""
+import json
+import timeit
+from argparse import ArgumentParser
+from collections.abc import Callable
+
+from wxc_sdk.telephony import NumberListPhoneNumber
+
+from flask_app.api.sections import NUMBER
+from flask_app.serialization import dumps, orjson
+
+
+def sample_numbers(count: int) -> list[NumberListPhoneNumber]:
+    return [NumberListPhoneNumber.model_validate(
+        {'phoneNumber': f'+1408555{i:04d}',
+         'extension': f'{2000 + i}',
+         'routingPrefix': '8001',
+         'esn': f'8001{2000 + i}',
+         'phoneNumberType': 'PRIMARY' if i % 3 else 'ALTERNATE',
+         'mainNumber': False,
+         'tollFreeNumber': False,
+         'isServiceNumber': False,
+         'state': 'ACTIVE',
+         'location': {'id': f'LOCATION{i % 5}', 'name': f'Location {i % 5}'},
+         'owner': {'id': f'PERSON{i}', 'type': 'PEOPLE', 'firstName': 'User', 'lastName': f'{i}'}})
+        for i in range(count)]
+
+
+def sample_queue_rows(count: int) -> list[dict]:
+    return [{'name': f'Queue {i}',
+             'location': f'Location {i % 5}',
+             'extension': f'{1000 + i}',
+             'join_info': {'joined': i % 2 == 0,
+                           'location_and_queue_id': f'LOCATION{i % 5}.QUEUE{i}',
+                           'allow_join_enabled': i % 4 != 3}}
+            for i in range(count)]
+
+
+def measure(func: Callable[[], bytes], repeat: int) -> tuple[float, int]:
+    """
+    Best time per call in microseconds out of 5 runs and size of the result
+    """
+    number = max(1, repeat // 5)
+    best = min(timeit.repeat(func, number=number, repeat=5)) / number
+    return best * 1e6, len(func())
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark response shaping and serialization')
+    parser.add_argument('--numbers', type=int, default=200, help='number of phone numbers of the user')
+    parser.add_argument('--queues', type=int, default=200, help='number of queues the user is agent of')
+    parser.add_argument('--repeat', type=int, default=200, help='number of calls per measurement')
+    args = parser.parse_args()
+
+    numbers = sample_numbers(args.numbers)
+    rows = sample_queue_rows(args.queues)
+    cases = {
+        f'userinfo, {args.numbers} numbers': (
+            lambda: json.dumps({'numbers': [n.model_dump(mode='json') for n in numbers],
+                                'location_name': 'Location 0'}).encode('utf-8'),
+            lambda: dumps({'numbers': NUMBER.dump_list(numbers), 'location_name': 'Location 0'})),
+        f'userqueues, {args.queues} queues': (
+            lambda: json.dumps({'success': True, 'rows': rows}).encode('utf-8'),
+            lambda: dumps({'success': True, 'rows': rows}))}
+
+    print(f'encoder: {"orjson" if orjson is not None else "json (fallback, orjson not installed)"}')
+    print(f'{"response":<28} {"before us":>10} {"after us":>10} {"speedup":>8} {"before B":>9} {"after B":>9}')
+    for name, (before, after) in cases.items():
+        before_us, before_size = measure(before, args.repeat)
+        after_us, after_size = measure(after, args.repeat)
+        print(f'{name:<28} {before_us:>10.1f} {after_us:>10.1f} {before_us / after_us:>7.1f}x '
+              f'{before_size:>9} {after_size:>9}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Boot time of a portal worker.
+
+Run from the web_app directory:
+
+    python -m benchmark.startup_benchmark --runs 5
+
+Each run starts a fresh interpreter which creates the portal app using the stand-in for the Webex APIs and reports the
+time spent in each phase:
+    * import: importing the portal modules
+    * create_app: creating the app
+    * ready: starting background threads until /readyz reports ready; includes the warm-up with --warmup
+Import time is attributed to top-level packages using "python -X importtime".
+"""
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser, SUPPRESS
+from collections import defaultdict
+
+
+def child(warmup: bool):
+    """
+    One boot of the portal; prints the phase durations and the self import time per top-level package as JSON
+    """
+    start = time.perf_counter()
+    # the modules create_app() imports
+    for module in ('flask_app.app_with_tokens', 'flask_app.api', 'flask_app.routes'):
+        importlib.import_module(module)
+    phases = {'import': time.perf_counter() - start}
+
+    # imports of the benchmark are not measured
+    import tempfile
+    from benchmark.mock_webex import MockWebex
+    from benchmark.run_benchmark import create_portal
+
+    os.environ['WARMUP'] = '1' if warmup else '0'
+    mock = MockWebex(users=10)
+    with tempfile.TemporaryDirectory() as token_dir:
+        start = time.perf_counter()
+        app = create_portal(mock, token_dir)
+        phases['create_app'] = time.perf_counter() - start
+        start = time.perf_counter()
+        while not app.ready:
+            time.sleep(0.005)
+        phases['ready'] = time.perf_counter() - start
+        mock.stop()
+    print(json.dumps(phases))
+
+
+def import_profile(stderr: str) -> dict[str, float]:
+    """
+    Self import time per top-level package in seconds from the output of "python -X importtime"
+    """
+    result = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, _, name = line.removeprefix('import time:').split('|')
+        result[name.strip().split('.')[0]] += int(self_us) / 1e6
+    return result
+
+
+def main():
+    parser = ArgumentParser(description='Measure boot time of a portal worker')
+    parser.add_argument('--runs', type=int, default=5, help='number of boots')
+    parser.add_argument('--warmup', action='store_true', help='boot with warm-up (WARMUP=1)')
+    parser.add_argument('--top', type=int, default=10, help='number of packages in the import profile')
+    parser.add_argument('--child', action='store_true', help=SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.warmup)
+        return
+
+    phases = defaultdict(list)
+    imports = defaultdict(list)
+    for _ in range(args.runs):
+        cmd = [sys.executable, '-X', 'importtime', '-m', 'benchmark.startup_benchmark', '--child']
+        if args.warmup:
+            cmd.append('--warmup')
+        # the stand-in logs each request on stderr: only lines of the import profile are parsed
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        for phase, seconds in json.loads(result.stdout.strip().splitlines()[-1]).items():
+            phases[phase].append(seconds)
+        for package, seconds in import_profile(result.stderr).items():
+            imports[package].append(seconds)
+
+    print(f'{"phase":<12} {"median ms":>10} {"min ms":>8}')
+    for phase, values in phases.items():
+        print(f'{phase:<12} {statistics.median(values) * 1000:>10.0f} {min(values) * 1000:>8.0f}')
+    print()
+    print(f'{"package":<24} {"import ms":>10}')
+    medians = sorted(((statistics.median(values), package) for package, values in imports.items()), reverse=True)
+    for seconds, package in medians[:args.top]:
+        print(f'{package:<24} {seconds * 1000:>10.0f}')
+    print(f'{"total":<24} {sum(seconds for seconds, _ in medians) * 1000:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,34 @@
 import os
-from os.path import isdir, dirname, join, abspath
+from os.path import dirname, join, abspath
 
 from dotenv import load_dotenv
-from flask_session import Session
-
-from .app_with_tokens import AppWithTokens
 
 __all__ = ['create_app']
 
 
-def create_app():
+def create_app(production: bool = False, start_background: bool = True):
+    """
+    Create the Flask app
+
+    :param production: production mode: no template auto reload and SECRET_KEY has to be set so that all workers use
+        the same key to sign session cookies
+    :param start_background: start background threads. A pre-fork server has to start them in each worker after the
+        fork by calling :meth:`AppWithTokens.start_background`
+    """
     # load .env from one level up
     env_path = abspath(join(dirname(__file__), '..', '.env'))
     load_dotenv(env_path)
+
+    # modules using the Webex SDK are imported here and not when the package is imported: importing flask_app.assets
+    # or flask_app.request_logging doesn't pay for the SDK
+    from .app_with_tokens import AppWithTokens
+    from .request_logging import init_request_logging
+    from .sessions import init_session
+    from .tracing import init_tracing
+
     app = AppWithTokens(__name__, static_folder=None)
 
-    app.config['TEMPLATES_AUTO_RELOAD'] = True
+    app.config['TEMPLATES_AUTO_RELOAD'] = not production
 
     # client id and secret for Webex OIDC client
     app.config['WEBEX_CLIENT_ID'] = os.getenv('CLIENT_ID')
@@ -24,23 +37,30 @@ def create_app():
     # session lifetime: 10 min
     app.config['PERMANENT_SESSION_LIFETIME'] = 600
 
-    app.secret_key = os.urandom(50)
-    app.config['SESSION_TYPE'] = 'filesystem'
-    file_dir = 'sessions'
-    file_dir = abspath(join(dirname(__file__), '..', file_dir))
-    if not isdir(file_dir):
-        os.mkdir(file_dir)
-    app.config['SESSION_FILE_DIR'] = file_dir
+    if secret_key := os.getenv('SECRET_KEY'):
+        app.secret_key = secret_key
+    elif production:
+        raise KeyError('SECRET_KEY environment variable needs to be set in production mode')
+    else:
+        app.secret_key = os.urandom(50)
 
     from .routes import core, oauth
     from .api import apib
+    from .assets import init_assets
 
     app.register_blueprint(core, url_prefix='/')
     app.register_blueprint(apib, url_prefix='/api')
 
-    # add server side sessions to the app
-    sess = Session(app)
-    sess.init_app(app)
+    # add server side sessions to the app; see init_session() for the available session stores
+    app.session_store = init_session(app)
+    # static assets: fingerprinted and precompressed if built with "python -m flask_app.assets"
+    app.assets = init_assets(app)
+    # Server-Timing headers, a log line per request and optional metrics endpoint
+    init_tracing(app, app.tracer)
+    # sampled logging of request and response bodies
+    init_request_logging(app, production=production)
 
     oauth.init_app(app)
+    if start_background:
+        app.start_background()
     return app
@@ -1,21 +1,18 @@
 import logging
-from concurrent.futures import ThreadPoolExecutor
+import time
+from collections.abc import Callable
 from functools import partial, wraps
 from urllib.parse import urlparse
 
-from flask import session, current_app, Blueprint, request
+from flask import session, current_app, Blueprint, request, Response
 from flask_restx import Api, Resource, fields
-from werkzeug.exceptions import UnsupportedMediaType
-from wxc_sdk.devices import ProductType
-from wxc_sdk.locations import Location
-from wxc_sdk.people import Person
 from wxc_sdk.person_settings.call_intercept import InterceptSetting
-from wxc_sdk.rest import RestError
-from wxc_sdk.telephony import NumberListPhoneNumber
-from wxc_sdk.telephony.callqueue import CallQueue
-from wxc_sdk.telephony.callqueue.agents import CallQueueAgentQueue
-from wxc_sdk.telephony.hg_and_cq import Agent
 from ..app_with_tokens import AppWithTokens
+from ..membership_table import COLUMNS
+from ..queue_updates import JoinChange
+from ..serialization import output_json
+from ..sessions import SessionUser
+from . import sections
 
 __all__ = ["apib"]
 
@@ -30,22 +27,37 @@ api = Api(apib,
           doc='/docs',
           default='Frontend API',
           default_label='Frontend API')
+#: maximum time in seconds API requests wait for a service app access token
+TOKEN_WAIT = 10
+
+# responses of all resources are serialized by the fast JSON encoder
+api.representations['application/json'] = output_json
 
 
 @apib.before_request
-def before_request():
+def wait_for_tokens():
     """
-    Before request handler to log all requests
+    Workers start serving before the service app tokens are available: API requests wait for a usable access token
     """
-    log.debug(f'Request: {request.method} {request.url}')
-    if request.args:
-        log.debug(f'Request: Query parameters: {request.args}')
-    try:
-        json_data = request.get_json()
-    except UnsupportedMediaType:
-        json_data = None
-    if json_data is not None:
-        log.debug(f'Request: JSON payload: {json_data}')
+    ca: AppWithTokens = current_app
+    if not ca.token_manager.wait(timeout=TOKEN_WAIT):
+        log.warning(f'{request.path}: no service app access token after {TOKEN_WAIT} s')
+        return {'error': 'Service not available, try again later'}, 503
+
+
+@apib.after_request
+def conditional_get(response: Response) -> Response:
+    """
+    Conditional GET for all read endpoints: responses have an ETag with a hash of the body and requests with a
+    matching If-None-Match header get a 304 Not Modified without body. Responses are per user: shared caches must not
+    store them and browsers have to revalidate before each use
+    """
+    if request.method != 'GET' or response.status_code != 200 or response.is_streamed or not response.is_json:
+        return response
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.add_etag()
+    return response.make_conditional(request)
 
 
 def assert_user(func):
@@ -64,6 +76,25 @@ def assert_user(func):
     return wrapper
 
 
+def assert_admin(func):
+    """
+    Decorator to assert that a portal admin is logged in.
+    Returns 401 Unauthorized if no user is logged in and 403 Forbidden if the user is not an admin.
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        user = SessionUser.from_session()
+        if user is None:
+            return {'error': 'User not logged in'}, 401
+        ca: AppWithTokens = current_app
+        if not ca.is_admin(user):
+            return {'error': 'Admin privileges required'}, 403
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
 @api.route('/userinfo')
 class UserInfo(Resource):
     """
@@ -76,29 +107,11 @@ class UserInfo(Resource):
         """
         Get user information including location details and phone numbers for the logged-in user.
         Returns a JSON object with:
-            * numbers: List of phone numbers associated with the user, each represented as a JSON object
+            * numbers: List of phone numbers associated with the user, each with phone_number, extension,
+              phone_number_type and location.name
             * location_name: Name of the user's location
         """
-        user = session.get('user')
-        user: Person
-        ca: AppWithTokens = current_app
-        capi = ca.api
-        # get location details and number for user
-        log.debug(f'"/api/userinfo": getting location details and numbers')
-        tasks = [
-            lambda: capi.locations.details(location_id=user.location_id),
-            lambda: list(capi.telephony.phone_numbers(owner_id=user.person_id))
-        ]
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            location, numbers = list(executor.map(lambda f: f(), tasks))
-        location: Location
-        numbers: list[NumberListPhoneNumber]
-
-        # noinspection PyUnboundLocalVariable
-        numbers.sort(key=lambda n: n.phone_number_type, reverse=True)
-        # noinspection PyUnboundLocalVariable
-        return dict(numbers=[n.model_dump(mode='json') for n in numbers],
-                    location_name=location.name), 200
+        return sections.user_info(current_app, SessionUser.from_session()), 200
 
 
 @api.route('/userphones')
@@ -119,29 +132,7 @@ class UserPhones(Resource):
                 * mac: MAC address of the phone in colon-separated format
                 * connection_status: Connection status of the phone
         """
-
-        def mac_with_colons(mac: str) -> str:
-            octets = (mac[i:i + 2] for i in range(0, len(mac), 2))
-            return ':'.join(octets)
-
-        user = session.get('user')
-        user: Person
-        ca: AppWithTokens = current_app
-        path = urlparse(request.url).path
-        try:
-            log.debug(f'"{path}": getting user phones')
-            devices = list(ca.api.devices.list(person_id=user.person_id))
-        except RestError as e:
-            log.error(f'"{path}": getting user phones failed: {e}')
-            return {'success': False,
-                    'message': f'{e}'}
-        log.debug(f'"{path}": returning device data')
-        return {'success': True,
-                'rows': [{'model': device.product,
-                          'mac': mac_with_colons(device.mac),
-                          'status': device.connection_status}
-                         for device in devices
-                         if device.product_type == ProductType.phone]}
+        return sections.user_phones(current_app, SessionUser.from_session())
 
 
 @api.route('/userqueues')
@@ -173,78 +164,7 @@ class UserQueues(Resource):
                 * location_and_queue_id: location and queue id is in format "location_id.queue_id"
                 * allow_join_enabled: True if the user can join the queue
         """
-        user = session.get('user')
-        user: Person
-
-        def get_agent_queues(agent_id: str, has_cx_essentials: bool) -> list[CallQueueAgentQueue]:
-            """
-            get list of queues the user is agent of and catch 404 errors
-            :param agent_id: ID of the agent to get queues for
-            :param has_cx_essentials: True if the agent has CX essentials, False otherwise
-            :return: list of CallQueueAgentQueue objects
-            """
-            try:
-                detail = ca_api.telephony.callqueue.agents.details(id=agent_id, has_cx_essentials=has_cx_essentials,
-                                                                   max_=50)
-                return detail.queues
-            except RestError as e:
-                if e.response.status_code == 404:
-                    return []
-                raise
-
-        # get the current app
-        ca: AppWithTokens = current_app
-        ca_api = ca.api
-
-        # get the path for logging
-        path = urlparse(request.url).path
-
-        # get agent details w/ and w/o CX essentials
-        log.debug(f'"{path}": getting agent queues with and without customer assist')
-        tasks = [
-            lambda: get_agent_queues(agent_id=user.person_id, has_cx_essentials=False),
-            lambda: get_agent_queues(agent_id=user.person_id, has_cx_essentials=True)]
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            agent_queues, agent_queues_with_cx_essentials = list(executor.map(lambda f: f(), tasks))
-        agent_queues: list[CallQueueAgentQueue]
-        # noinspection PyUnboundLocalVariable
-        agent_queues.extend(agent_queues_with_cx_essentials)
-
-        # get details for the call queues the user is agent of
-        log.debug(f'"{path}": getting call queue details for {len(agent_queues)} queues the user is agent of')
-        tasks = [partial(ca_api.telephony.callqueue.details, location_id=agent_queue.location_id,
-                         queue_id=agent_queue.id)
-                 for agent_queue in agent_queues]
-        details = []
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            # run the tasks in parallel
-            details = list(executor.map(lambda f: f(), tasks))
-        details: list[CallQueue]
-
-        queues_with_user = [(queue, detail, agent)
-                            for detail, queue in zip(details, agent_queues)
-                            if (agent := next((agent
-                                               for agent in detail.agents
-                                               if agent.agent_id == user.person_id),
-                                              None))]
-        queues_with_user: list[tuple[CallQueueAgentQueue, CallQueue, Agent]]
-        log.debug(f'"{path}": returning user/queue information')
-        # each row in the table will contain:
-        #   * name: queue name
-        #   * location: location name
-        #   * extension: queue extension
-        #   * join_info:
-        #       * joined: True if the user is joined to the queue, False otherwise
-        #       * location_and_queue_id: location and queue id is in format "location_id.queue_id"
-        #       * allow_join_enabled: True if the user can join the queue
-        return {'success': True,
-                'rows': [{'name': queue.name,
-                          'location': queue.location_name,
-                          'extension': queue.extension,
-                          'join_info': {'joined': agent.join_enabled,
-                                        'location_and_queue_id': f'{queue.location_id}.{queue.id}',
-                                        'allow_join_enabled': detail.allow_agent_join_enabled}}
-                         for queue, detail, agent in queues_with_user]}
+        return sections.user_queues(current_app, SessionUser.from_session())
 
     # parameter type for the POST request
     # to update the user join state in a queue
@@ -261,12 +181,10 @@ class UserQueues(Resource):
         """
         Update agent join state for one queue.
         """
-        user = session.get('user')
-        user: Person
+        user = SessionUser.from_session()
 
         # get the current app
         ca: AppWithTokens = current_app
-        ca_api = ca.api
 
         # get the path for logging
         path = urlparse(request.url).path
@@ -275,21 +193,56 @@ class UserQueues(Resource):
         location_id, queue_id = api.payload['id'].split('.')
         joined = api.payload['checked']
 
-        # get queue info and update queue
-        log.debug(f'"{path}": getting call queue details')
-        detail = ca_api.telephony.callqueue.details(location_id=location_id, queue_id=queue_id)
+        # read-modify-write of the queue with verification; request bodies are logged by the sampled request logger
+        result, = ca.queue_updater.update(agent_id=user.person_id,
+                                          changes=[JoinChange(location_id=location_id, queue_id=queue_id,
+                                                              joined=joined)])
+        if not result.success:
+            log.error('"%s": update failed: %s', path, result.message)
+            return {'success': False, 'message': result.message}
+        return {'success': True}
 
-        # find agent to modify
-        agent = next(ag for ag in detail.agents if ag.agent_id == user.person_id)
 
-        # set the new join state
-        agent.join_enabled = joined
+@api.route('/userqueues/bulk')
+class UserQueuesBulk(Resource):
+    """
+    Endpoint to update the joined state of the user in multiple queues
+    """
 
-        # update the queue
-        log.debug(f'"{path}": updating call queue details for "{detail.name}"')
-        ca_api.telephony.callqueue.update(location_id=location_id, queue_id=queue_id, update=detail)
-        log.debug(f'"{path}": success')
-        return {'success': True}
+    PostUserQueuesBulk = api.model('PostUserQueuesBulk', {
+        'changes': fields.List(fields.Nested(UserQueues.PostUserQueues), required=True,
+                               description='Requested join states; the last change for a queue wins')
+    })
+
+    @staticmethod
+    @api.expect(PostUserQueuesBulk, validate=True)
+    @assert_user
+    def post():
+        """
+        Update agent join state for multiple queues. Queues are updated concurrently.
+        Returns a JSON object with:
+            * success: True if all changes were successful, False otherwise
+            * results: one entry per queue:
+                * id: location and queue id in format "location_id.queue_id"
+                * checked: requested join state
+                * success: True if the join state was updated successfully
+                * attempts: number of updates sent for the queue
+                * message: error message if the update failed
+        """
+        user = SessionUser.from_session()
+        ca: AppWithTokens = current_app
+        changes = []
+        for change in api.payload['changes']:
+            location_id, queue_id = change['id'].split('.')
+            changes.append(JoinChange(location_id=location_id, queue_id=queue_id, joined=change['checked']))
+        results = ca.queue_updater.update(agent_id=user.person_id, changes=changes)
+        return {'success': all(r.success for r in results),
+                'results': [{'id': f'{r.location_id}.{r.queue_id}',
+                             'checked': r.joined,
+                             'success': r.success,
+                             'attempts': r.attempts,
+                             'message': r.message}
+                            for r in results]}
 
 
 @api.route('/useroptions')
@@ -314,27 +267,7 @@ class UserOptions(Resource):
             * callIntercept: True if call intercept is enabled, False otherwise
             * callWaiting: True if call waiting is enabled, False otherwise
         """
-        user = session.get('user')
-        # if not user:
-        #     return {'error': 'User not logged in'}, 401
-        user: Person
-        ca: AppWithTokens = current_app
-        capi = ca.api
-        path = urlparse(request.url).path
-        log.debug(f'"{path} getting call intercept and call waiting status')
-        tasks = [
-            lambda: capi.person_settings.call_intercept.read(entity_id=user.person_id),
-            lambda: capi.person_settings.call_waiting.read(entity_id=user.person_id)
-        ]
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            call_intercept, call_waiting = list(executor.map(lambda f: f(), tasks))
-        call_intercept: InterceptSetting
-        call_waiting: bool
-        log.debug(f'"{path}": returning intercept and call waiting status')
-        # noinspection PyUnboundLocalVariable
-        return {'success': True,
-                'callIntercept': call_intercept.enabled,
-                'callWaiting': call_waiting}
+        return sections.user_options(current_app, SessionUser.from_session())
 
     PostUserOptions = api.model('PostUserOptions', {
         'id': fields.String(required=True, description='callIntercept or callWaiting'),
@@ -352,8 +285,7 @@ class UserOptions(Resource):
             * success: True if the operation was successful, False otherwise
             * message: error message if the operation failed
         """
-        user = session.get('user')
-        user: Person
+        user = SessionUser.from_session()
         ca: AppWithTokens = current_app
         capi = ca.api
         path = urlparse(request.url).path
@@ -363,10 +295,407 @@ class UserOptions(Resource):
             update = InterceptSetting(enabled=checked)
             log.debug(f'"{path}": updating call intercept: {checked}')
             capi.person_settings.call_intercept.configure(entity_id=user.person_id, intercept=update)
+            ca.cache.update(user.person_id, 'call_intercept',
+                            lambda intercept: intercept.model_copy(update={'enabled': checked}))
         elif checkbox_id == 'callWaiting':
             log.debug(f'"{path}": updating call waiting: {checked}')
             capi.person_settings.call_waiting.configure(entity_id=user.person_id, enabled=checked)
+            ca.cache.set(user.person_id, 'call_waiting', checked)
         else:
             return {'success': False, 'message': f'unexpected checkbox id "{checkbox_id}"'}
         log.debug(f'"{path}": return success')
         return {'success': True}
+
+
+def _dashboard_section(read: Callable[[AppWithTokens, SessionUser], dict], ca: AppWithTokens,
+                       user: SessionUser) -> dict:
+    """
+    Read data for one section of the dashboard and catch errors
+    """
+    start = time.perf_counter()
+    try:
+        data = read(ca, user)
+    except Exception as e:
+        log.error(f'dashboard: reading {read.__name__} failed: {e}')
+        section = {'success': False, 'message': f'{e}'}
+    else:
+        section = {'success': True, 'data': data}
+    section['time_ms'] = (time.perf_counter() - start) * 1000
+    return section
+
+
+@api.route('/dashboard')
+class Dashboard(Resource):
+    """
+    Data for all sections of the portal in one request
+    """
+
+    # section name -> function to read data for the section
+    SECTIONS = {'userinfo': sections.user_info,
+                'userphones': sections.user_phones,
+                'userqueues': sections.user_queues,
+                'useroptions': sections.user_options}
+
+    @staticmethod
+    @assert_user
+    def get():
+        """
+        Get data for all sections of the portal. The sections are read concurrently.
+        Returns a JSON object with:
+            * sections: one entry per section (userinfo, userphones, userqueues, useroptions). Each entry has:
+                * success: True if the data for the section could be read, False otherwise
+                * data: the response of the endpoint for the section; for example /api/userphones
+                * message: error message if reading the data failed
+                * time_ms: time to read the data for the section in milliseconds
+            * time_ms: time to read the data for all sections in milliseconds
+        """
+        start = time.perf_counter()
+        # sections are read in executor threads: these can't use the current_app proxy
+        ca: AppWithTokens = current_app._get_current_object()
+        user = SessionUser.from_session()
+        results = dict(zip(Dashboard.SECTIONS,
+                           ca.executor.map((partial(_dashboard_section, read, ca, user)
+                                            for read in Dashboard.SECTIONS.values()),
+                                           user_id=user.person_id)))
+        # live updates of the page start from these sections instead of reading them again
+        ca.live_updates.seed(user, {name: section['data'] for name, section in results.items() if section['success']})
+        return {'sections': results,
+                'time_ms': (time.perf_counter() - start) * 1000}
+
+
+@api.route('/events')
+class Events(Resource):
+    """
+    Live updates of the queue and phone tables as Server-Sent Events
+    """
+
+    @staticmethod
+    @assert_user
+    def get():
+        """
+        Stream of Server-Sent Events with updates of the queue and phone tables of the user:
+            * snapshot: data of all sections: {"userqueues": ..., "userphones": ...}. Each section is the response of
+              the endpoint for the section; for example /api/userqueues. Sent at the start of each stream
+            * diff: changed and removed rows per section: {"userqueues": {"upsert": [rows], "remove": [keys]}}. Keys
+              are the "location_and_queue_id" of queue rows and the "mac" of phone rows
+
+        With the query parameter seeded=1 the browser has just loaded the dashboard: the stream starts from the sections
+        of the dashboard and the first event is a diff.
+
+        Returns 503 if live updates are disabled or the maximum number of streams is reached.
+        """
+        ca: AppWithTokens = current_app
+        subscription = ca.live_updates.subscribe(SessionUser.from_session(),
+                                                 seeded=request.args.get('seeded') == '1')
+        if subscription is None:
+            return {'success': False, 'message': 'live updates not available'}, 503
+        # the stream is consumed after the request context has been torn down: use live_updates, not current_app
+        return Response(ca.live_updates.stream(subscription), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@api.route('/liveupdates')
+class LiveUpdatesStatus(Resource):
+    """
+    Status of live updates
+    """
+
+    @staticmethod
+    @assert_user
+    def get():
+        """
+        Get status of live updates.
+        Returns a JSON object with:
+            * streams: number of open streams
+            * users: number of users with open streams
+            * cycles: number of poll cycles
+            * events: number of events sent
+            * rejected: number of streams rejected because the maximum number of streams was reached
+            * last_cycle_duration: duration of the last poll cycle in seconds
+            * last_error: error of the last poll cycle, if any
+        """
+        ca: AppWithTokens = current_app
+        return ca.live_updates.status()
+
+
+@api.route('/admin/memberships')
+class AdminMemberships(Resource):
+    """
+    Org-wide table of the call queue memberships of all agents for admins; server-side processing for DataTables
+    """
+
+    @staticmethod
+    @assert_admin
+    def get():
+        """
+        Get one page of the membership table. Served from the call queue index without Webex API calls.
+
+        Query parameters are the server-side processing parameters of DataTables:
+            * draw: sequence number; echoed in the response
+            * start, length: first row and number of rows of the page; length -1 for all rows
+            * search[value]: only rows with all words in agent, queue, location or extension
+            * order[0][column], order[0][dir]: index of the column to sort by and "asc" or "desc"
+            * columns[i][data]: name of column i: agent, queue, location, extension, joined or allow_join
+
+        Returns a JSON object with:
+            * draw: draw parameter of the request
+            * recordsTotal: number of memberships
+            * recordsFiltered: number of memberships matching the search
+            * data: rows of the page; each row has agent, queue, location, extension, joined and allow_join
+            * error: set if the call queue index is not ready yet
+        """
+        args = request.args
+        draw = args.get('draw', 0, type=int)
+        order_index = args.get('order[0][column]', 0, type=int)
+        order_column = args.get(f'columns[{order_index}][data]', 'agent')
+        if order_column not in COLUMNS:
+            return {'error': f'unknown column "{order_column}"'}, 400
+        ca: AppWithTokens = current_app
+        page = ca.membership_table.query(start=args.get('start', 0, type=int),
+                                         length=args.get('length', 10, type=int),
+                                         search=args.get('search[value]', ''),
+                                         order_column=order_column,
+                                         descending=args.get('order[0][dir]') == 'desc')
+        if page is None:
+            return {'draw': draw, 'recordsTotal': 0, 'recordsFiltered': 0, 'data': [],
+                    'error': 'Call queue index is not ready yet. Try again later.'}
+        return {'draw': draw, 'recordsTotal': page['total'], 'recordsFiltered': page['filtered'],
+                'data': page['rows']}
+
+
+@api.route('/executor')
+class ExecutorMetrics(Resource):
+    """
+    Metrics of the executor used to fan out Webex API calls
+    """
+
+    @staticmethod
+    @assert_user
+    def get():
+        """
+        Get executor metrics.
+        Returns a JSON object with:
+            * workers: number of worker threads
+            * active: number of tasks currently executing
+            * queue_depth: number of tasks waiting for a worker
+            * queued_users: number of users with waiting tasks
+            * submitted, completed, failed: task counters
+            * wait_avg_ms, wait_max_ms: time tasks waited in the queue before execution started
+        """
+        ca: AppWithTokens = current_app
+        return ca.executor.metrics()
+
+
+@api.route('/cache')
+class CacheMetrics(Resource):
+    """
+    Metrics of the TTL cache for Webex API reads
+    """
+
+    @staticmethod
+    @assert_user
+    def get():
+        """
+        Get cache metrics.
+        Returns a JSON object with:
+            * entries: number of cached entries, including expired entries not yet removed
+            * hits: number of reads answered from the cache
+            * misses: number of reads without a valid entry
+            * evictions: number of entries removed because the cache was full (CACHE_MAX_ENTRIES)
+        """
+        ca: AppWithTokens = current_app
+        return ca.cache.stats()
+
+
+@api.route('/queueindex')
+class QueueIndex(Resource):
+    """
+    Status of the org-wide call queue index
+        * GET: get index status
+        * POST: force a full refresh of the index
+    """
+
+    @staticmethod
+    @assert_user
+    def get():
+        """
+        Get status of the call queue index.
+        Returns a JSON object with:
+            * ready: True if the index has been built
+            * refreshing: True if a refresh cycle is in progress
+            * age: seconds since the last refresh cycle
+            * full_refresh_age: seconds since the last full refresh
+            * oldest_queue_age: seconds since the details of the least recently refreshed queue have been read
+            * queues: number of queues
+            * agents: number of agents
+            * shared: True if the index is shared with other processes
+            * last_error: error of the last refresh cycle, if any
+        """
+        ca: AppWithTokens = current_app
+        return ca.queue_index.status()
+
+    @staticmethod
+    @assert_admin
+    def post():
+        """
+        Force a full refresh of the call queue index (portal admins only). The refresh is executed in the background.
+        """
+        ca: AppWithTokens = current_app
+        ca.queue_index.refresh(force=True)
+        return {'success': True}, 202
+
+
+@api.route('/inventory')
+class InventoryStatus(Resource):
+    """
+    Status of the inventory snapshot
+        * GET: get snapshot status
+        * POST: force a refresh of all kinds of objects
+    """
+
+    @staticmethod
+    @assert_user
+    def get():
+        """
+        Get status of the inventory snapshot.
+        Returns a JSON object with:
+            * enabled: False if the inventory is disabled
+            * refreshing: True if a refresh cycle is in progress
+            * snapshots: for locations, numbers, devices and queues: age, duration, rows, inserted, updated and
+              deleted objects of the last snapshot; null if there is no snapshot
+            * last_error: error of the last refresh cycle, if any
+        """
+        ca: AppWithTokens = current_app
+        if ca.inventory is None:
+            return {'enabled': False}
+        return {'enabled': True} | ca.inventory.status()
+
+    @staticmethod
+    @assert_admin
+    def post():
+        """
+        Force a refresh of the inventory snapshot (portal admins only). The refresh is executed in the background.
+        """
+        ca: AppWithTokens = current_app
+        if ca.inventory is None:
+            return {'success': False, 'message': 'inventory is disabled'}, 503
+        ca.inventory.refresh(force=True)
+        return {'success': True}, 202
+
+
+@api.route('/userdirectory')
+class UserDirectoryStatus(Resource):
+    """
+    Status of the directory of calling users used at login
+    """
+
+    @staticmethod
+    @assert_user
+    def get():
+        """
+        Get status of the user directory.
+        Returns a JSON object with:
+            * ready: True if the directory has been built
+            * refreshing: True if a refresh cycle is in progress
+            * age: seconds since the last refresh cycle
+            * last_refresh_duration: duration of the last refresh cycle in seconds
+            * users: number of users
+            * hits, misses: lookup counters
+            * shared: True if the directory is shared with other processes
+            * last_error: error of the last refresh cycle, if any
+        """
+        ca: AppWithTokens = current_app
+        return ca.user_directory.status()
+
+
+@api.route('/tokens')
+class TokenMetrics(Resource):
+    """
+    Metrics of the service app token management
+    """
+
+    @staticmethod
+    @assert_user
+    def get():
+        """
+        Get token metrics.
+        Returns a JSON object with:
+            * remaining: remaining lifetime of the access token in seconds
+            * refreshes: number of successful refreshes by this process
+            * adopted: number of times tokens refreshed by another process have been picked up
+            * failures: number of failed refreshes
+            * last_refresh_latency: duration of the last successful refresh in seconds
+            * last_error: error of the last failed refresh, if any
+        """
+        ca: AppWithTokens = current_app
+        return ca.token_manager.metrics()
+
+
+@api.route('/singleflight')
+class SingleFlightMetrics(Resource):
+    """
+    Metrics of the single-flight layer merging identical concurrent Webex API reads
+    """
+
+    @staticmethod
+    @assert_user
+    def get():
+        """
+        Get single-flight metrics.
+        Returns a JSON object with:
+            * enabled: False if merging is disabled (SINGLE_FLIGHT=0)
+            * reads: number of GET requests which could be merged
+            * upstream: number of these requests sent to Webex
+            * merged: number of requests answered with the result of an identical request in flight
+            * merge_ratio: merged / reads
+            * in_flight: number of requests in flight
+            * merged_by_endpoint: merged requests per Webex API endpoint; top 10
+        """
+        ca: AppWithTokens = current_app
+        if ca.single_flight is None:
+            return {'enabled': False}
+        return {'enabled': True} | ca.single_flight.metrics()
+
+
+@api.route('/transport')
+class TransportStatus(Resource):
+    """
+    Pooled connections of the shared HTTP transport
+    """
+
+    @staticmethod
+    @assert_user
+    def get():
+        """
+        Get pooled connections per host.
+        Returns a JSON object with an entry per host:
+            * idle: number of idle keep-alive connections
+            * connections: number of connections opened
+            * requests: number of requests sent
+        """
+        ca: AppWithTokens = current_app
+        return ca.transport.status()
+
+
+@api.route('/ratelimit')
+class RateLimitMetrics(Resource):
+    """
+    Metrics of the rate limiter for Webex API requests
+    """
+
+    @staticmethod
+    @assert_user
+    def get():
+        """
+        Get rate limiter metrics.
+        Returns a JSON object with:
+            * requests: number of requests
+            * delayed: number of requests which had to wait for the rate limit
+            * wait_avg_ms: average wait time of delayed requests
+            * throttled: number of 429 responses
+            * retried: number of requests retried after a 429 response
+            * dropped: number of requests given up after too many 429 responses
+            * paused: remaining time in seconds until requests are sent again after a 429 response
+        """
+        ca: AppWithTokens = current_app
+        return ca.rate_limiter.metrics()
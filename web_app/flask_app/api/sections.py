@@ -0,0 +1,284 @@
+"""
+Data for the sections (cards) of the portal.
+
+Each function returns the JSON response for one section and is used by the endpoint for that section and by the
+dashboard endpoint. The functions don't depend on a request context and can be executed in any thread.
+"""
+import asyncio
+import logging
+from functools import partial
+
+from wxc_sdk.devices import ProductType
+from wxc_sdk.locations import Location
+from wxc_sdk.person_settings.call_intercept import InterceptSetting
+from wxc_sdk.rest import RestError
+from wxc_sdk.telephony import NumberListPhoneNumber
+from wxc_sdk.telephony.callqueue import CallQueue
+from wxc_sdk.telephony.callqueue.agents import CallQueueAgentQueue
+from wxc_sdk.telephony.hg_and_cq import Agent
+
+from ..app_with_tokens import AppWithTokens
+from ..async_backend import as_cached
+from ..serialization import Shape
+from ..sessions import SessionUser
+
+__all__ = ['user_info', 'user_phones', 'user_queues', 'user_options']
+
+log = logging.getLogger(__name__)
+
+
+def rest_errors(ca: AppWithTokens) -> tuple[type[Exception], ...]:
+    """
+    Exceptions raised by failed Webex API calls; wxc_sdk.as_rest (and aiohttp) is only imported with the async backend
+    """
+    if ca.aio is None:
+        return RestError,
+    from wxc_sdk.as_rest import AsRestError
+    return RestError, AsRestError
+
+
+#: fields of phone numbers used by the frontend
+NUMBER = Shape('phone_number', 'extension', 'phone_number_type', location=Shape('name'))
+
+
+def user_info(ca: AppWithTokens, user: SessionUser) -> dict:
+    """
+    Location details and phone numbers of a user
+        * numbers: List of phone numbers associated with the user, each with phone_number, extension,
+          phone_number_type and location.name
+        * location_name: Name of the user's location
+    """
+    capi = ca.api
+    cache = ca.cache
+    # answer from the inventory snapshot if available. No numbers in the snapshot is a miss: the user might have been
+    # added after the last snapshot
+    location = numbers = None
+    if inventory := ca.inventory:
+        location = inventory.store.location(user.location_id)
+        numbers = inventory.store.numbers(owner_id=user.person_id)
+    if location is None or not numbers:
+        # not in the snapshot: get location details and number for user
+        if aio := ca.aio:
+            location, numbers = aio.gather(
+                as_cached(cache, user.location_id, 'location',
+                          lambda: aio.api.locations.details(location_id=user.location_id)),
+                as_cached(cache, user.person_id, 'numbers',
+                          lambda: aio.api.telephony.phone_numbers(owner_id=user.person_id)))
+        else:
+            tasks = [
+                lambda: cache.get_or_load(user.location_id, 'location',
+                                          lambda: capi.locations.details(location_id=user.location_id)),
+                lambda: cache.get_or_load(user.person_id, 'numbers',
+                                          lambda: list(capi.telephony.phone_numbers(owner_id=user.person_id)))
+            ]
+            location, numbers = ca.executor.map(tasks, user_id=user.person_id)
+    location: Location
+    numbers: list[NumberListPhoneNumber]
+
+    # cached list is shared: don't sort in place
+    numbers = sorted(numbers, key=lambda n: n.phone_number_type, reverse=True)
+    return dict(numbers=NUMBER.dump_list(numbers),
+                location_name=location.name)
+
+
+def user_phones(ca: AppWithTokens, user: SessionUser) -> dict:
+    """
+    Phones of a user
+        * success: True if the operation was successful
+        * rows: List of phone data rows. Each row in the table will contain:
+            * product: Product name of the phone
+            * mac: MAC address of the phone in colon-separated format
+            * connection_status: Connection status of the phone
+    """
+
+    def mac_with_colons(mac: str) -> str:
+        octets = (mac[i:i + 2] for i in range(0, len(mac), 2))
+        return ':'.join(octets)
+
+    # the connection status changes all the time: devices are read live (or from the cache, which is also updated by
+    # live updates). The inventory snapshot is only used if the live read fails and then without connection status
+    live = True
+    try:
+        if aio := ca.aio:
+            devices = aio.run(as_cached(ca.cache, user.person_id, 'devices',
+                                        lambda: aio.api.devices.list(person_id=user.person_id)))
+        else:
+            devices = ca.cache.get_or_load(user.person_id, 'devices',
+                                           lambda: list(ca.api.devices.list(person_id=user.person_id)))
+    except rest_errors(ca) as e:
+        log.error(f'user phones: getting user phones failed: {e}')
+        if not (ca.inventory and (devices := ca.inventory.store.devices(person_id=user.person_id))):
+            return {'success': False,
+                    'message': f'{e}'}
+        live = False
+    return {'success': True,
+            'rows': [{'model': device.product,
+                      'mac': mac_with_colons(device.mac),
+                      'status': device.connection_status if live else 'unknown'}
+                     for device in devices
+                     if device.product_type == ProductType.phone]}
+
+
+def user_queues(ca: AppWithTokens, user: SessionUser) -> dict:
+    """
+    Data for the table of queues for a user
+        * success: True if the operation was successful
+        * rows: List of queue data rows. Each row in the table will contain:
+            * name: queue name
+            * location: location name
+            * extension: queue extension
+            * join_info:
+                * joined: True if the user is joined to the queue, False otherwise
+                * location_and_queue_id: location and queue id is in format "location_id.queue_id"
+                * allow_join_enabled: True if the user can join the queue
+    """
+
+    def get_agent_queues(agent_id: str, has_cx_essentials: bool) -> list[CallQueueAgentQueue]:
+        """
+        get list of queues the user is agent of and catch 404 errors
+        :param agent_id: ID of the agent to get queues for
+        :param has_cx_essentials: True if the agent has CX essentials, False otherwise
+        :return: list of CallQueueAgentQueue objects
+        """
+        try:
+            detail = ca_api.telephony.callqueue.agents.details(id=agent_id, has_cx_essentials=has_cx_essentials,
+                                                               max_=50)
+            return detail.queues
+        except RestError as e:
+            if e.response.status_code == 404:
+                return []
+            raise
+
+    def get_all_agent_queues() -> list[CallQueueAgentQueue]:
+        """
+        get agent details w/ and w/o CX essentials
+        """
+        tasks = [
+            lambda: get_agent_queues(agent_id=user.person_id, has_cx_essentials=False),
+            lambda: get_agent_queues(agent_id=user.person_id, has_cx_essentials=True)]
+        queues, queues_with_cx_essentials = ca.executor.map(tasks, user_id=user.person_id)
+        return queues + queues_with_cx_essentials
+
+    def get_queue_details(agent_queue: CallQueueAgentQueue) -> CallQueue:
+        return cache.get_or_load(agent_queue.id, 'queue_details',
+                                 partial(ca_api.telephony.callqueue.details,
+                                         location_id=agent_queue.location_id,
+                                         queue_id=agent_queue.id))
+
+    async def as_get_agent_queues(has_cx_essentials: bool) -> list[CallQueueAgentQueue]:
+        """
+        async variant of get_agent_queues()
+        """
+        from wxc_sdk.as_rest import AsRestError
+
+        try:
+            detail = await aio.api.telephony.callqueue.agents.details(id=user.person_id,
+                                                                      has_cx_essentials=has_cx_essentials,
+                                                                      max_=50)
+            return detail.queues
+        except AsRestError as e:
+            if e.status == 404:
+                return []
+            raise
+
+    async def as_get_user_queues() -> tuple[list[CallQueueAgentQueue], list[CallQueue]]:
+        """
+        async variant of getting agent queues and queue details
+        """
+
+        async def get_all_queues() -> list[CallQueueAgentQueue]:
+            queues, queues_with_cx_essentials = await asyncio.gather(as_get_agent_queues(False),
+                                                                     as_get_agent_queues(True))
+            return queues + queues_with_cx_essentials
+
+        queues = await as_cached(cache, user.person_id, 'agent_queues', get_all_queues)
+        queue_details = await asyncio.gather(
+            *[as_cached(cache, queue.id, 'queue_details',
+                        partial(aio.api.telephony.callqueue.details, location_id=queue.location_id,
+                                queue_id=queue.id))
+              for queue in queues])
+        return queues, queue_details
+
+    ca_api = ca.api
+    cache = ca.cache
+
+    # answer from the org-wide queue index if available
+    memberships = ca.queue_index.memberships(user.person_id)
+    if memberships is not None:
+        return {'success': True,
+                'rows': [{'name': m.queue.name,
+                          'location': m.queue.location_name,
+                          'extension': m.queue.extension,
+                          'join_info': {'joined': m.join_enabled,
+                                        'location_and_queue_id': f'{m.queue.location_id}.{m.queue.id}',
+                                        'allow_join_enabled': m.allow_agent_join_enabled}}
+                         for m in sorted(memberships, key=lambda m: m.queue.name or '')]}
+
+    # index not ready (yet): get queues and queue details for the user
+    if aio := ca.aio:
+        agent_queues, details = aio.run(as_get_user_queues())
+    else:
+        agent_queues = cache.get_or_load(user.person_id, 'agent_queues', get_all_agent_queues)
+
+        # get details for the call queues the user is agent of
+        tasks = [partial(get_queue_details, agent_queue)
+                 for agent_queue in agent_queues]
+        # run the tasks in parallel
+        details = ca.executor.map(tasks, user_id=user.person_id)
+    agent_queues: list[CallQueueAgentQueue]
+    details: list[CallQueue]
+
+    queues_with_user = [(queue, detail, agent)
+                        for detail, queue in zip(details, agent_queues)
+                        if (agent := next((agent
+                                           for agent in detail.agents
+                                           if agent.agent_id == user.person_id),
+                                          None))]
+    queues_with_user: list[tuple[CallQueueAgentQueue, CallQueue, Agent]]
+    # each row in the table will contain:
+    #   * name: queue name
+    #   * location: location name
+    #   * extension: queue extension
+    #   * join_info:
+    #       * joined: True if the user is joined to the queue, False otherwise
+    #       * location_and_queue_id: location and queue id is in format "location_id.queue_id"
+    #       * allow_join_enabled: True if the user can join the queue
+    return {'success': True,
+            'rows': [{'name': queue.name,
+                      'location': queue.location_name,
+                      'extension': queue.extension,
+                      'join_info': {'joined': agent.join_enabled,
+                                    'location_and_queue_id': f'{queue.location_id}.{queue.id}',
+                                    'allow_join_enabled': detail.allow_agent_join_enabled}}
+                     for queue, detail, agent in queues_with_user]}
+
+
+def user_options(ca: AppWithTokens, user: SessionUser) -> dict:
+    """
+    User options (call intercept and call waiting)
+        * success: True if the operation was successful
+        * callIntercept: True if call intercept is enabled, False otherwise
+        * callWaiting: True if call waiting is enabled, False otherwise
+    """
+    capi = ca.api
+    cache = ca.cache
+    if aio := ca.aio:
+        as_settings = aio.api.person_settings
+        call_intercept, call_waiting = aio.gather(
+            as_cached(cache, user.person_id, 'call_intercept',
+                      lambda: as_settings.call_intercept.read(entity_id=user.person_id)),
+            as_cached(cache, user.person_id, 'call_waiting',
+                      lambda: as_settings.call_waiting.read(entity_id=user.person_id)))
+    else:
+        tasks = [
+            lambda: cache.get_or_load(user.person_id, 'call_intercept',
+                                      lambda: capi.person_settings.call_intercept.read(entity_id=user.person_id)),
+            lambda: cache.get_or_load(user.person_id, 'call_waiting',
+                                      lambda: capi.person_settings.call_waiting.read(entity_id=user.person_id))
+        ]
+        call_intercept, call_waiting = ca.executor.map(tasks, user_id=user.person_id)
+    call_intercept: InterceptSetting
+    call_waiting: bool
+    return {'success': True,
+            'callIntercept': call_intercept.enabled,
+            'callWaiting': call_waiting}
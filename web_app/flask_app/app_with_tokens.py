@@ -1,12 +1,29 @@
+import atexit
 import os
-from os.path import abspath, join, dirname, isfile
+from os.path import abspath, join, dirname
 from typing import Optional
 
 from flask import Flask
 from wxc_sdk import WebexSimpleApi
 from wxc_sdk.integration import Integration
 from wxc_sdk.tokens import Tokens
-from yaml import safe_load, safe_dump
+
+from .async_backend import AsyncBackend
+from .cache import TTLCache
+from .executor import FanOutExecutor
+from .inventory import Inventory, InventoryStore
+from .live_updates import LiveUpdates
+from .membership_table import MembershipTable
+from .queue_index import CallQueueIndex
+from .queue_updates import QueueJoinUpdater
+from .rate_limit import RateLimiter
+from .sessions import SessionUser, SweepingFileSystemCache
+from .single_flight import SingleFlight
+from .token_manager import TokenManager
+from .tracing import Tracer
+from .transport import Transport, default_transport
+from .user_directory import UserDirectory
+from .warmup import WarmUp
 
 __all__ = ['AppWithTokens']
 
@@ -19,54 +36,216 @@ class AppWithTokens(Flask):
         * SERVICE_APP_REFRESH_TOKEN
         * SERVICE_APP_CLIENT_ID
         * SERVICE_APP_CLIENT_SECRET
+
+    Tokens are cached in app_tokens.yml and refreshed in the background by a :class:`TokenManager` when the remaining
+    lifetime drops below TOKEN_REFRESH_MARGIN seconds (default: one day). Creating the app doesn't wait for tokens;
+    portal API requests wait for a usable token.
+
+    Also owns an executor used by all requests to fan out Webex API calls and a cache for Webex API reads. These
+    environment variables can be used to tune them:
+        * FANOUT_MAX_WORKERS: size of the executor, default 20
+        * CACHE_TTL: lifetime of cache entries in seconds, default 60
+        * CACHE_MAX_ENTRIES: maximum number of cache entries, default 10000
+
+    An index of all call queues of the org is maintained in the background:
+        * QUEUE_INDEX_INTERVAL: time between refresh cycles in seconds, default 300. 0 disables the index
+        * QUEUE_INDEX_BATCH_SIZE: number of queues re-read in each refresh cycle, default 50
+
+    A snapshot of the org inventory (locations, phone numbers, devices, call queues) is kept in a local SQLite database
+    shared by all worker processes; see :class:`Inventory`. User info is answered from the snapshot; the phones of a
+    user are only read from the snapshot (without connection status) if reading them from the Webex API fails:
+        * INVENTORY_INTERVAL: time between refreshes of the snapshot in seconds, default 900. 0 disables the inventory
+        * INVENTORY_MAX_AGE: snapshots older than this many seconds are not used, default 3600
+        * INVENTORY_PATH: path of the database, default: inventory.db next to the token file
+
+    The database is also used to share the queue index and the user directory between worker processes: in each cycle
+    only one process reads all call queues and lists all people. With the inventory disabled each worker process
+    builds its own queue index and user directory from the Webex APIs.
+
+    All Webex API requests sent with the service app token go through a :class:`RateLimiter`:
+        * WEBEX_RATE_LIMIT: sustained number of requests per second, default 10. 0 disables the limit
+        * WEBEX_RATE_BURST: maximum burst of requests, default 20
+        * WEBEX_MAX_RETRIES: maximum number of retries after 429 responses, default 3
+
+    Identical concurrent Webex API reads are merged into one request by a :class:`SingleFlight` layer:
+        * SINGLE_FLIGHT: 0 disables merging, default 1
+
+    A directory of calling users is used to look up users at login:
+        * USER_DIRECTORY_INTERVAL: time between refreshes of the directory in seconds, default 900. 0 disables the
+          directory
+
+    Join states of agents are updated by a :class:`QueueJoinUpdater`:
+        * QUEUE_UPDATE_PARALLELISM: maximum number of queues updated concurrently for a bulk update, default 8
+
+    Changes of the queue and phone tables are pushed to open portal pages by :class:`LiveUpdates`:
+        * LIVE_UPDATE_INTERVAL: time between poll cycles in seconds, default 15. 0 disables live updates
+        * LIVE_UPDATE_MAX_STREAMS: maximum number of concurrent event streams per process. Each stream occupies a server
+          thread: the default is three quarters of the threads per worker (GUNICORN_THREADS, default 8), which leaves
+          a quarter of the threads for regular requests
+        * LIVE_UPDATE_MAX_AGE: event streams are closed after this many seconds and the browser reconnects, default
+          600
+
+    Admins get an org-wide table of all call queue memberships served from the queue index by a
+    :class:`MembershipTable`:
+        * PORTAL_ADMINS: comma-separated list of email addresses of admins. Empty: no admins
+
+    Workers can warm up before they report ready (/readyz); see :class:`WarmUp`:
+        * WARMUP: 1 enables the warm-up, default 0
+        * WARMUP_TIMEOUT: maximum duration of the warm-up in seconds, default 60
+        * WARMUP_CONNECTIONS: number of connections to the Webex APIs opened by the warm-up, default 4
+
+    The Webex API, token refreshes and the OIDC client used for login share the pooled keep-alive connections of one
+    :class:`Transport`; see :func:`default_transport` for the settings (HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE,
+    HTTP_POOL_BLOCK).
+
+    All Webex API requests are recorded by a :class:`Tracer`; see :func:`init_tracing` for how traces are surfaced.
+
+    API_BACKEND selects how the portal API fans out Webex API calls:
+        * sync (default): blocking API calls on the executor
+        * async: coroutines on an asyncio event loop; see :class:`AsyncBackend`
+
+    Background threads (token refresh, queue index, inventory, user directory, async backend, live updates, session
+    sweeps) are only started by :meth:`start_background`. With a pre-fork server this has to be called in each worker
+    after the fork. Threads reading from the Webex APIs wait for an access token before their first cycle and retry
+    failed cycles with a backoff starting at 10 seconds instead of waiting for the next regular cycle.
     """
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.tokens = self.get_tokens()
-        self.api = WebexSimpleApi(tokens=self.tokens)
+        self.token_manager = TokenManager(path=self.yml_path(), get_new_tokens=self.get_access_token,
+                                          refresh_margin=float(os.getenv('TOKEN_REFRESH_MARGIN') or 24 * 60 * 60))
+        # API instances use this tokens instance; the token manager updates it in place. Only tokens from the token
+        # file are used here: no Webex API calls before the worker can serve the static and login pages. Missing or
+        # expired tokens are obtained by the token manager in the background
+        self.token_manager.load()
+        self.tokens = self.token_manager.tokens
+        max_workers = int(os.getenv('FANOUT_MAX_WORKERS') or 20)
+        # pooled connections shared by the Webex API, token refreshes and the OIDC client used for login
+        self.transport: Transport = default_transport()
+        # allow for as many concurrent requests as we have workers
+        self.api = WebexSimpleApi(tokens=self.tokens, concurrent_requests=max_workers)
+        self.transport.mount(self.api.session)
+        # the tracer records each attempt: install before the rate limiter
+        self.tracer = Tracer()
+        self.tracer.install(self.api)
+        self.rate_limiter = RateLimiter(rate=float(os.getenv('WEBEX_RATE_LIMIT') or 10),
+                                        burst=int(os.getenv('WEBEX_RATE_BURST') or 20),
+                                        max_retries=int(os.getenv('WEBEX_MAX_RETRIES') or 3))
+        self.rate_limiter.install(self.api)
+        # merged reads neither take rate limiter tokens nor are traced as upstream calls: install last
+        self.single_flight: Optional[SingleFlight] = None
+        if (os.getenv('SINGLE_FLIGHT') or '1').lower() not in ('0', 'false', 'no'):
+            self.single_flight = SingleFlight()
+            self.single_flight.install(self.api)
+        self.executor = FanOutExecutor(max_workers=max_workers)
+        atexit.register(self.executor.shutdown, wait=False)
+        self.aio: Optional[AsyncBackend] = None
+        self.cache = TTLCache(ttl=float(os.getenv('CACHE_TTL') or 60),
+                              max_entries=int(os.getenv('CACHE_MAX_ENTRIES') or 10000))
+        inventory_interval = float(os.getenv('INVENTORY_INTERVAL') or 900)
+        self.inventory: Optional[Inventory] = None
+        # with the inventory the queue index and the user directory are shared by all worker processes through the
+        # inventory database; they use their data no matter how old it is
+        shared_store: Optional[InventoryStore] = None
+        if inventory_interval > 0:
+            self.inventory = Inventory(api=self.api,
+                                       store=InventoryStore(max_age=float(os.getenv('INVENTORY_MAX_AGE') or 3600)),
+                                       interval=inventory_interval, wait_for_token=self.token_manager.wait)
+            shared_store = InventoryStore(path=self.inventory.store.path)
+        self.queue_index = CallQueueIndex(api=self.api, executor=self.executor,
+                                          interval=float(os.getenv('QUEUE_INDEX_INTERVAL') or 300),
+                                          batch_size=int(os.getenv('QUEUE_INDEX_BATCH_SIZE') or 50),
+                                          wait_for_token=self.token_manager.wait, store=shared_store,
+                                          cache=self.cache)
+        self.user_directory = UserDirectory(api=self.api,
+                                            interval=float(os.getenv('USER_DIRECTORY_INTERVAL') or 900),
+                                            wait_for_token=self.token_manager.wait, store=shared_store)
+        self.queue_updater = QueueJoinUpdater(api=self.api, executor=self.executor, queue_index=self.queue_index,
+                                              parallelism=int(os.getenv('QUEUE_UPDATE_PARALLELISM') or 8))
+        self.live_updates = LiveUpdates(app=self, interval=float(os.getenv('LIVE_UPDATE_INTERVAL') or 15),
+                                        max_streams=int(os.getenv('LIVE_UPDATE_MAX_STREAMS') or
+                                                        max(1, int(os.getenv('GUNICORN_THREADS') or 8) * 3 // 4)),
+                                        max_age=float(os.getenv('LIVE_UPDATE_MAX_AGE') or 600))
+        self.membership_table = MembershipTable(queue_index=self.queue_index)
+        self.warmup: Optional[WarmUp] = None
+        if (os.getenv('WARMUP') or '0').lower() not in ('0', 'false', 'no'):
+            self.warmup = WarmUp(app=self, timeout=float(os.getenv('WARMUP_TIMEOUT') or 60),
+                                 connections=int(os.getenv('WARMUP_CONNECTIONS') or 4))
+        self.admins = {email.strip().lower() for email in (os.getenv('PORTAL_ADMINS') or '').split(',')
+                       if email.strip()}
+        # file system session store; set by create_app()
+        self.session_store: Optional[SweepingFileSystemCache] = None
+        self.background_started = False
+
+    def start_background(self):
+        """
+        Start background threads: token refresh, queue index, inventory and user directory maintenance, the event loop
+        of the async backend, the poller for live updates, sweeps of expired sessions and the warm-up
+        """
+        if self.background_started:
+            return
+        self.background_started = True
+        self.token_manager.start()
+        if (os.getenv('API_BACKEND') or 'sync').lower() == 'async':
+            self.aio = AsyncBackend(tokens=self.tokens, concurrent_requests=self.executor.max_workers)
+            self.tracer.install(self.aio.api)
+            self.rate_limiter.install(self.aio.api)
+            if self.single_flight is not None:
+                self.single_flight.install(self.aio.api)
+            atexit.register(self.aio.close)
+        if self.queue_index.interval > 0:
+            self.queue_index.start()
+        if self.inventory is not None:
+            self.inventory.start()
+        if self.user_directory.interval > 0:
+            self.user_directory.start()
+        if self.live_updates.interval > 0:
+            self.live_updates.start()
+        if self.session_store is not None:
+            self.session_store.start()
+        if self.warmup is not None:
+            self.warmup.start()
+
+    @property
+    def ready(self) -> bool:
+        """
+        Ready to serve requests: background threads are running, we have a valid access token and the warm-up (if
+        enabled) is done
+        """
+        return (self.background_started and self.tokens is not None and self.tokens.remaining > 0 and
+                (self.warmup is None or self.warmup.done))
+
+    def is_admin(self, user: Optional[SessionUser]) -> bool:
+        """
+        Check if a user is a portal admin: one of the user's email addresses is in PORTAL_ADMINS
+        """
+        return user is not None and any(email.lower() in self.admins for email in user.emails)
 
     @staticmethod
     def yml_path() -> str:
         path = abspath(join(dirname(__file__), '../..', 'app_tokens.yml'))
         return path
 
-    def read_tokens_from_file(self) -> Optional[Tokens]:
-        path = self.yml_path()
-        if not isfile(path):
-            return None
-        # noinspection PyBroadException
-        try:
-            with open(path, mode='r') as f:
-                data = safe_load(f)
-            tokens = Tokens.model_validate(data)
-        except Exception:
-            return None
-        return tokens
-
-    def write_tokens_to_file(self, tokens: Tokens):
-        with open(self.yml_path(), mode='w') as f:
-            safe_dump(tokens.model_dump(mode='json', exclude_none=True), f)
-
     def get_access_token(self) -> Tokens:
-        tokens = Tokens(refresh_token=os.getenv('SERVICE_APP_REFRESH_TOKEN'))
+        """
+        Get new tokens from Webex using the service app refresh token
+        """
         integration = Integration(client_id=os.getenv('SERVICE_APP_CLIENT_ID'),
                                   client_secret=os.getenv('SERVICE_APP_CLIENT_SECRET'),
                                   scopes=[], redirect_url=None)
-        integration.refresh(tokens=tokens)
-        self.write_tokens_to_file(tokens)
+        # same request as Integration.refresh() but on a pooled connection of the shared transport
+        data = {'grant_type': 'refresh_token',
+                'client_id': integration.client_id,
+                'client_secret': integration.client_secret,
+                'refresh_token': os.getenv('SERVICE_APP_REFRESH_TOKEN')}
+        with self.transport.session() as session, session.post(url=integration.token_service, data=data) as response:
+            response.raise_for_status()
+            tokens = Tokens.model_validate(response.json())
+        tokens.set_expiration()
         return tokens
 
     def get_tokens(self) -> Optional[Tokens]:
         """
-        Get tokens
+        Get tokens: from the token file or by refreshing them if the remaining lifetime is less than the refresh margin
         """
-        # try to read from a file
-        tokens = self.read_tokens_from_file()
-        # .. or create a new access token using refresh token
-        if tokens is None:
-            tokens = self.get_access_token()
-        # get a new access token if the remaining lifetime is less than a day
-        if tokens.remaining < 24 * 60 * 60:
-            tokens = self.get_access_token()
-        return tokens
+        return self.token_manager.get_tokens()
@@ -0,0 +1,264 @@
+"""
+Static assets: build step with fingerprinting and precompression, and serving of the built assets.
+
+Build the assets (done in the Docker image; run from the web_app directory):
+
+    python -m flask_app.assets
+
+The build writes a copy of each file in static/ to static_build/ with a content hash in the file name, for example
+js/datatables.3f2a9c1b0d.js. References in CSS files (url(...)) and source map references in JS files are rewritten to
+the fingerprinted names. Compressible files get precompressed .gz variants and .br variants if the "brotli" package is
+installed. The portal modules in static/js/portal are bundled into one script; the bundle is minified if the "rjsmin"
+package is installed. manifest.json maps original to fingerprinted names.
+
+Without a build (development) assets are served from static/ and revalidated by the browser on each use.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+import sys
+from os.path import abspath, dirname, isfile, join
+from functools import wraps
+from typing import Optional
+
+from flask import Flask, Response, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:
+    # no brotli variants
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:
+    # portal bundle is not minified
+    rjsmin = None
+
+__all__ = ['PORTAL_MODULES', 'PORTAL_BUNDLE', 'build_assets', 'Assets', 'init_assets']
+
+log = logging.getLogger(__name__)
+
+SOURCE_DIR = abspath(join(dirname(__file__), 'static'))
+BUILD_DIR = abspath(join(dirname(__file__), 'static_build'))
+MANIFEST = 'manifest.json'
+
+#: portal modules in load order
+PORTAL_MODULES = ['js/portal/conditional_get.js',
+                  'js/portal/user_info.js',
+                  'js/portal/user_phones.js',
+                  'js/portal/user_queues.js',
+                  'js/portal/user_options.js',
+                  'js/portal/dashboard.js',
+                  'js/portal/live_updates.js']
+PORTAL_BUNDLE = 'js/portal.bundle.js'
+
+COMPRESSIBLE = {'.css', '.eot', '.js', '.json', '.map', '.svg', '.ttf'}
+
+#: lifetime of fingerprinted assets: one year
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# url(...) in CSS; quoted or unquoted
+_CSS_URL_RE = re.compile(r'url\(\s*([\'"]?)(.*?)\1\s*\)')
+_SOURCE_MAP_RE = re.compile(r'^//# sourceMappingURL=(\S+)', flags=re.MULTILINE)
+
+
+def _fingerprinted_name(path: str, data: bytes) -> str:
+    digest = hashlib.sha256(data).hexdigest()[:10]
+    stem, ext = posixpath.splitext(path)
+    return f'{stem}.{digest}{ext}'
+
+
+def _rewrite_references(path: str, data: bytes, manifest: dict[str, str]) -> bytes:
+    """
+    Rewrite relative references in CSS and JS files to fingerprinted names
+    """
+    base = posixpath.dirname(path)
+
+    def fingerprinted(ref: str) -> Optional[str]:
+        if ref.startswith(('data:', 'http:', 'https:', '//', '/')):
+            return None
+        # keep query and fragment; for example "fa-solid-900.eot?#iefix"
+        ref_path, suffix = re.match(r'([^?#]*)(.*)', ref).groups()
+        target = manifest.get(posixpath.normpath(posixpath.join(base, ref_path)))
+        if target is None:
+            return None
+        return f'{posixpath.relpath(target, base or ".")}{suffix}'
+
+    def replace_css_url(match: re.Match) -> str:
+        quote, ref = match.groups()
+        new_ref = fingerprinted(ref)
+        return match.group(0) if new_ref is None else f'url({quote}{new_ref}{quote})'
+
+    def replace_source_map(match: re.Match) -> str:
+        new_ref = fingerprinted(match.group(1))
+        return match.group(0) if new_ref is None else f'//# sourceMappingURL={new_ref}'
+
+    if path.endswith('.css'):
+        return _CSS_URL_RE.sub(replace_css_url, data.decode('utf-8')).encode('utf-8')
+    if path.endswith('.js'):
+        return _SOURCE_MAP_RE.sub(replace_source_map, data.decode('utf-8')).encode('utf-8')
+    return data
+
+
+def _write(build_dir: str, path: str, data: bytes) -> list[str]:
+    """
+    Write a built asset and its precompressed variants
+
+    :return: names of the files written
+    """
+    written = [path]
+    full_path = join(build_dir, *path.split('/'))
+    os.makedirs(dirname(full_path), exist_ok=True)
+    with open(full_path, mode='wb') as f:
+        f.write(data)
+    if posixpath.splitext(path)[1] not in COMPRESSIBLE:
+        return written
+    variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(data, quality=11)))
+    for ext, compressed in variants:
+        # only keep variants which save at least 10%
+        if len(compressed) < len(data) * 0.9:
+            with open(f'{full_path}{ext}', mode='wb') as f:
+                f.write(compressed)
+            written.append(f'{path}{ext}')
+    return written
+
+
+def build_assets(source_dir: str = SOURCE_DIR, build_dir: str = BUILD_DIR) -> dict[str, str]:
+    """
+    Build fingerprinted and precompressed assets
+
+    :param source_dir: directory with the static assets
+    :param build_dir: output directory; existing content is removed
+    :return: manifest: original name -> fingerprinted name
+    """
+    sources: dict[str, bytes] = {}
+    for root, _, files in os.walk(source_dir):
+        for file in files:
+            full_path = join(root, file)
+            with open(full_path, mode='rb') as f:
+                sources[os.path.relpath(full_path, source_dir).replace(os.sep, '/')] = f.read()
+
+    bundle = '\n;\n'.join(sources[module].decode('utf-8') for module in PORTAL_MODULES)
+    if rjsmin is not None:
+        bundle = rjsmin.jsmin(bundle)
+    sources[PORTAL_BUNDLE] = bundle.encode('utf-8')
+
+    shutil.rmtree(build_dir, ignore_errors=True)
+    manifest: dict[str, str] = {}
+    written = 0
+    # referenced files first: CSS files reference fonts and images, JS files reference source maps
+    for path in sorted(sources, key=lambda p: (p.endswith('.css') or p.endswith('.js'), p)):
+        data = _rewrite_references(path, sources[path], manifest)
+        manifest[path] = _fingerprinted_name(path, data)
+        written += len(_write(build_dir, manifest[path], data))
+    with open(join(build_dir, MANIFEST), mode='w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    log.info(f'built {len(manifest)} assets, {written} files in {build_dir}')
+    return manifest
+
+
+class Assets:
+    """
+    Serves static assets.
+
+        * fingerprinted assets from the build directory are cached by browsers for a year ("immutable"). If the
+          browser accepts it a precompressed variant is sent
+        * assets without a build are served from the source directory and revalidated by the browser on each use
+    """
+
+    def __init__(self, source_dir: str = SOURCE_DIR, build_dir: str = BUILD_DIR):
+        self.source_dir = source_dir
+        self.build_dir = build_dir
+        self.manifest: dict[str, str] = {}
+        manifest_path = join(build_dir, MANIFEST)
+        if isfile(manifest_path):
+            with open(manifest_path, mode='r') as f:
+                self.manifest = json.load(f)
+        self._fingerprinted = set(self.manifest.values())
+        # names of the precompressed variants
+        self._variants: set[str] = set()
+        for root, _, files in os.walk(build_dir):
+            for file in files:
+                if file.endswith(('.gz', '.br')):
+                    self._variants.add(os.path.relpath(join(root, file), build_dir).replace(os.sep, '/'))
+
+    def url(self, path: str) -> str:
+        """
+        URL of an asset; relative to the page like all URLs in the templates
+
+        :param path: path relative to the static directory; for example "js/datatables.js"
+        """
+        return f'static/{self.manifest.get(path, path)}'
+
+    def portal_scripts(self) -> list[str]:
+        """
+        URLs of the portal scripts: the bundle if assets have been built, else the individual modules
+        """
+        if PORTAL_BUNDLE in self.manifest:
+            return [self.url(PORTAL_BUNDLE)]
+        return [self.url(module) for module in PORTAL_MODULES]
+
+    def send(self, filename: str) -> Response:
+        """
+        View function for /static/<filename>
+        """
+        if filename not in self._fingerprinted:
+            response = send_from_directory(self.source_dir, filename, max_age=0)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        for encoding, ext in (('br', '.br'), ('gzip', '.gz')):
+            if request.accept_encodings[encoding] and f'{filename}{ext}' in self._variants:
+                mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                response = send_from_directory(self.build_dir, f'{filename}{ext}', mimetype=mimetype,
+                                               max_age=IMMUTABLE_MAX_AGE)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(self.build_dir, filename, max_age=IMMUTABLE_MAX_AGE)
+        response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+def init_assets(app: Flask) -> Assets:
+    """
+    Serve static assets at /static and add asset_url() and portal_scripts() to the template globals. Has to be called
+    after the session interface has been set up: requests for static assets don't load or save the session
+
+    :param app: Flask app; has to be created without static folder
+    :return: assets
+    """
+    assets = Assets()
+    if not assets.manifest:
+        log.info('no asset build found: serving assets from the static folder')
+    app.add_url_rule('/static/<path:filename>', endpoint='static', view_func=assets.send)
+
+    interface = app.session_interface
+    open_session = interface.open_session
+
+    @wraps(open_session)
+    def open_session_unless_static(app_: Flask, request_):
+        # assets are the same for all users: no session I/O and no "Vary: Cookie". The session is opened before the
+        # URL is matched: check the path
+        if request_.path.startswith('/static/'):
+            return interface.make_null_session(app_)
+        return open_session(app_, request_)
+
+    interface.open_session = open_session_unless_static
+    app.jinja_env.globals['asset_url'] = assets.url
+    app.jinja_env.globals['portal_scripts'] = assets.portal_scripts
+    return assets
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    build_assets()
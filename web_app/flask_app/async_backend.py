@@ -0,0 +1,100 @@
+"""
+asyncio backend for the portal API
+"""
+import asyncio
+import logging
+import threading
+from collections.abc import Awaitable, Callable, Hashable
+from typing import TYPE_CHECKING, Any
+
+from wxc_sdk.tokens import Tokens
+
+from .cache import TTLCache
+
+if TYPE_CHECKING:
+    from wxc_sdk.as_api import AsWebexSimpleApi
+
+__all__ = ['AsyncBackend', 'as_cached']
+
+log = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class AsyncBackend:
+    """
+    Async variant of the Webex API used by the portal API.
+
+    An :class:`wxc_sdk.as_api.AsWebexSimpleApi` instance lives on an event loop running in a dedicated thread. All
+    Webex API calls share the connection pool of that single client. Request handlers running in (synchronous) request
+    threads use :meth:`run` and :meth:`gather` to execute coroutines on the loop and wait for the results; outstanding
+    Webex API calls don't tie up any threads.
+    """
+
+    def __init__(self, tokens: Tokens, concurrent_requests: int = 20):
+        """
+        :param tokens: tokens to be used by the API
+        :param concurrent_requests: maximum number of concurrent Webex API requests
+        """
+        # imported here: the async API and aiohttp are only needed if the async backend is used
+        from wxc_sdk import as_api
+
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name='async-backend', daemon=True)
+        self._thread.start()
+
+        async def create_api() -> 'AsWebexSimpleApi':
+            # the aiohttp client session has to be created on the loop it's used on
+            return as_api.AsWebexSimpleApi(tokens=tokens, concurrent_requests=concurrent_requests)
+
+        self.api: 'AsWebexSimpleApi' = self.run(create_api())
+
+    def run(self, coro: Awaitable, timeout: float = None) -> Any:
+        """
+        Execute a coroutine on the backend loop and wait for the result
+
+        :param coro: coroutine to execute
+        :param timeout: maximum time to wait for the result
+        :return: result of the coroutine
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout=timeout)
+
+    def gather(self, *coros: Awaitable, timeout: float = None) -> list[Any]:
+        """
+        Execute coroutines concurrently on the backend loop and wait for all results
+
+        :param coros: coroutines to execute
+        :param timeout: maximum time to wait for the results
+        :return: list of results in the order of the coroutines
+        """
+
+        async def gather():
+            return await asyncio.gather(*coros)
+
+        return self.run(gather(), timeout=timeout)
+
+    def close(self):
+        """
+        Close the API client and stop the loop
+        """
+        if not self.loop.is_running():
+            return
+        self.run(self.api.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+
+async def as_cached(cache: TTLCache, owner_id: Hashable, resource: str, load: Callable[[], Awaitable]) -> Any:
+    """
+    Async variant of :meth:`TTLCache.get_or_load`
+
+    :param cache: cache to use
+    :param owner_id: person id or id of a shared object
+    :param resource: name of the cached resource
+    :param load: coroutine function to get the value if it's not cached
+    """
+    value = cache.get(owner_id, resource, default=_MISSING)
+    if value is _MISSING:
+        value = await load()
+        cache.set(owner_id, resource, value)
+    return value
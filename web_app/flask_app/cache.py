@@ -0,0 +1,132 @@
+"""
+TTL cache for Webex API reads shared by all API resources
+"""
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Any
+
+__all__ = ['TTLCache']
+
+_MISSING = object()
+
+CacheKey = tuple[Hashable, str]
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with a time-to-live for each entry.
+
+    Entries are keyed by (owner id, resource). The owner id typically is the id of the person the data belongs to
+    (like the person's devices or call waiting setting), but can also be the id of an object shared by multiple
+    users, like a call queue or a location.
+    """
+
+    def __init__(self, ttl: float = 60, max_entries: int = 10000):
+        """
+        :param ttl: lifetime of cache entries in seconds
+        :param max_entries: maximum number of entries; least recently used entries get evicted first
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # key -> (expiry, value). Order is LRU order: least recently used first
+        self._entries: OrderedDict[CacheKey, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, owner_id: Hashable, resource: str, default: Any = None) -> Any:
+        """
+        Get a cached value
+
+        :param owner_id: person id or id of a shared object
+        :param resource: name of the cached resource
+        :param default: returned if there is no (valid) entry
+        """
+        key = (owner_id, resource)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, owner_id: Hashable, resource: str, value: Any):
+        """
+        Add or replace a cache entry
+
+        :param owner_id: person id or id of a shared object
+        :param resource: name of the cached resource
+        :param value: value to cache
+        """
+        key = (owner_id, resource)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, owner_id: Hashable, resource: str, loader: Callable[[], Any]) -> Any:
+        """
+        Get a cached value; call the loader and cache the result on a miss
+
+        :param owner_id: person id or id of a shared object
+        :param resource: name of the cached resource
+        :param loader: callable to get the value if it's not cached
+        """
+        value = self.get(owner_id, resource, default=_MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(owner_id, resource, value)
+        return value
+
+    def update(self, owner_id: Hashable, resource: str, func: Callable[[Any], Any]):
+        """
+        Write-through of a partial update: replace a cached value by func(value). Nothing happens if the value is not
+        cached. The entry's lifetime is not extended
+
+        :param owner_id: person id or id of a shared object
+        :param resource: name of the cached resource
+        :param func: gets called with the cached value and returns the updated value
+        """
+        key = (owner_id, resource)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            self._entries[key] = (entry[0], func(entry[1]))
+
+    def invalidate(self, owner_id: Hashable, resource: str = None):
+        """
+        Remove cache entries
+
+        :param owner_id: person id or id of a shared object
+        :param resource: name of the resource to remove. If None, then all entries of the owner are removed
+        """
+        with self._lock:
+            if resource is not None:
+                self._entries.pop((owner_id, resource), None)
+                return
+            for key in [key for key in self._entries if key[0] == owner_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        """
+        Cache statistics: entries, hits, misses, evictions
+        """
+        with self._lock:
+            return {'entries': len(self._entries),
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions}
@@ -0,0 +1,223 @@
+"""
+App-lifetime executor for fan-out of Webex API calls
+"""
+import contextvars
+import logging
+import threading
+import time
+from collections import deque, OrderedDict
+from collections.abc import Callable, Iterable
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, Optional
+
+__all__ = ['FanOutExecutor']
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(eq=False)
+class _WorkItem:
+    future: Future
+    fn: Callable[[], Any]
+    user_id: str
+    queued: float = field(default_factory=time.perf_counter)
+
+
+class FanOutExecutor:
+    """
+    Bounded thread pool shared by all requests of an app.
+
+        * a fixed number of worker threads puts a global cap on the number of concurrent Webex API calls
+        * work items are queued per user and workers pick the next item round-robin across users. A user with many
+          queues can't starve other users
+        * queue depth and wait time are tracked and available via :meth:`metrics`
+        * tasks are executed in a copy of the context of the submitting thread. Context variables (like the priority of
+          Webex API requests) are inherited by the tasks
+
+    Tasks executed by the executor can use :meth:`map` to fan out further: a worker thread calling :meth:`map` runs
+    work items of that call which have not been picked up by other workers yet itself instead of only waiting for
+    them. Nested fan-out thus can't deadlock when all workers are busy. Tasks must not block on futures returned by
+    :meth:`submit`.
+    """
+
+    def __init__(self, max_workers: int = 20, name: str = 'fan-out'):
+        """
+        :param max_workers: maximum number of worker threads = maximum number of concurrent tasks
+        :param name: prefix for worker thread names
+        """
+        if max_workers <= 0:
+            raise ValueError('max_workers must be greater than 0')
+        self.max_workers = max_workers
+        self.name = name
+        self._cond = threading.Condition()
+        # one FIFO per user. Users are served round-robin in the order of this dict
+        self._queues: OrderedDict[str, deque[_WorkItem]] = OrderedDict()
+        self._threads: list[threading.Thread] = []
+        self._idle = 0
+        self._active = 0
+        self._shutdown = False
+        self._local = threading.local()
+
+        # metrics
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def submit(self, fn: Callable[..., Any], *args, user_id: str = None, **kwargs) -> Future:
+        """
+        Schedule a callable
+
+        :param fn: callable to execute
+        :param args: positional arguments for fn
+        :param user_id: user on behalf of whom the task is executed; used to schedule work fairly across users
+        :param kwargs: keyword arguments for fn
+        :return: future for the result of the call
+        """
+        return self._submit(lambda: fn(*args, **kwargs), user_id=user_id).future
+
+    def _submit(self, fn: Callable[[], Any], user_id: Optional[str]) -> _WorkItem:
+        item = _WorkItem(future=Future(), fn=partial(contextvars.copy_context().run, fn), user_id=user_id or '')
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError('cannot schedule new tasks after shutdown')
+            self._queues.setdefault(item.user_id, deque()).append(item)
+            self._submitted += 1
+            if not self._idle and len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._worker, name=f'{self.name}-{len(self._threads)}',
+                                          daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._cond.notify()
+        return item
+
+    def map(self, tasks: Iterable[Callable[[], Any]], user_id: str = None, timeout: float = None) -> list[Any]:
+        """
+        Execute a number of parameterless callables concurrently and return the results in order.
+
+        The first exception raised by a task is re-raised
+
+        :param tasks: callables to execute
+        :param user_id: user on behalf of whom the tasks are executed
+        :param timeout: maximum time to wait for each result
+        :return: list of results
+        """
+        items = [self._submit(task, user_id=user_id) for task in tasks]
+        try:
+            if getattr(self._local, 'worker', False):
+                # nested fan-out: help instead of blocking a worker
+                for item in items:
+                    if self._steal(item):
+                        self._execute(item)
+            return [item.future.result(timeout=timeout) for item in items]
+        finally:
+            # don't waste workers on results nobody is waiting for anymore
+            for item in items:
+                item.future.cancel()
+
+    def _steal(self, item: _WorkItem) -> bool:
+        """
+        Remove a work item from the queue if it hasn't been picked up by a worker yet
+
+        :return: True if the item has been removed
+        """
+        with self._cond:
+            queue = self._queues.get(item.user_id)
+            if queue is None or item not in queue:
+                return False
+            queue.remove(item)
+            if not queue:
+                del self._queues[item.user_id]
+            self._start(item)
+            return True
+
+    def _next_item(self) -> Optional[_WorkItem]:
+        """
+        Get next work item; round-robin across users. Has to be called with the lock held
+        """
+        while not self._queues:
+            if self._shutdown:
+                return None
+            self._idle += 1
+            self._cond.wait()
+            self._idle -= 1
+        user_id, queue = next(iter(self._queues.items()))
+        item = queue.popleft()
+        if queue:
+            # user has more work: move to the end of the line
+            self._queues.move_to_end(user_id)
+        else:
+            del self._queues[user_id]
+        return item
+
+    def _start(self, item: _WorkItem):
+        """
+        Account for a work item taken from the queue. Has to be called with the lock held
+        """
+        wait = time.perf_counter() - item.queued
+        self._wait_total += wait
+        self._wait_max = max(self._wait_max, wait)
+        self._active += 1
+
+    def _execute(self, item: _WorkItem):
+        failed = False
+        if item.future.set_running_or_notify_cancel():
+            try:
+                result = item.fn()
+            except BaseException as e:
+                failed = True
+                item.future.set_exception(e)
+            else:
+                item.future.set_result(result)
+        with self._cond:
+            self._active -= 1
+            self._completed += 1
+            self._failed += failed
+
+    def _worker(self):
+        self._local.worker = True
+        while True:
+            with self._cond:
+                item = self._next_item()
+                if item is None:
+                    return
+                self._start(item)
+            self._execute(item)
+
+    def metrics(self) -> dict[str, Any]:
+        """
+        Current executor metrics:
+            * workers: number of worker threads
+            * active: number of tasks currently executing
+            * queue_depth: number of tasks waiting for a worker
+            * queued_users: number of users with waiting tasks
+            * submitted, completed, failed: task counters
+            * wait_avg_ms, wait_max_ms: time tasks waited in the queue before execution started
+        """
+        with self._cond:
+            started = self._completed + self._active
+            return {'workers': len(self._threads),
+                    'active': self._active,
+                    'queue_depth': sum(len(q) for q in self._queues.values()),
+                    'queued_users': len(self._queues),
+                    'submitted': self._submitted,
+                    'completed': self._completed,
+                    'failed': self._failed,
+                    'wait_avg_ms': started and self._wait_total / started * 1000,
+                    'wait_max_ms': self._wait_max * 1000}
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stop accepting new tasks and let workers terminate once all queued tasks are done
+
+        :param wait: wait for worker threads to terminate
+        """
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
@@ -0,0 +1,437 @@
+"""
+Snapshot of the org inventory (locations, phone numbers, devices, call queues) in a local SQLite database. The database
+also holds the call queue details of the queue index and the people of the user directory
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from os.path import abspath, dirname, isfile, join
+from typing import Any, Optional
+
+from pydantic import BaseModel
+from wxc_sdk import WebexSimpleApi
+from wxc_sdk.devices import Device
+from wxc_sdk.locations import Location
+from wxc_sdk.people import Person
+from wxc_sdk.telephony import NumberListPhoneNumber
+from wxc_sdk.telephony.callqueue import CallQueue
+
+from .rate_limit import background_priority, retry_delay
+
+__all__ = ['default_path', 'open_snapshot', 'QueueDetails', 'InventoryStore', 'Inventory']
+
+log = logging.getLogger(__name__)
+
+
+def default_path() -> str:
+    """
+    Path of the snapshot database: INVENTORY_PATH or inventory.db next to the service app token file
+    """
+    return os.getenv('INVENTORY_PATH') or abspath(join(dirname(__file__), '../..', 'inventory.db'))
+
+
+@dataclass(frozen=True)
+class _Kind:
+    """
+    One kind of inventory objects and how they are stored
+    """
+    #: table name
+    name: str
+    model: type[BaseModel]
+    #: unique key of an object
+    key: Callable[[Any], str]
+    #: indexed column -> value of the column for an object
+    columns: dict[str, Callable[[Any], Optional[str]]]
+
+
+class QueueDetails(BaseModel):
+    """
+    Call queue as kept by the queue index
+    """
+    #: the call queue as returned by the call queue list
+    queue: CallQueue
+    #: call queue details with the agents
+    detail: CallQueue
+    #: time the details have been read
+    refreshed: float
+
+
+def _number_key(number: NumberListPhoneNumber) -> str:
+    # extension-only numbers don't have a phone number
+    return f'{number.location and number.location.id}/{number.phone_number or ""}/{number.extension or ""}'
+
+
+KINDS: dict[str, _Kind] = {kind.name: kind for kind in (
+    _Kind('locations', Location, lambda loc: loc.location_id, {}),
+    _Kind('numbers', NumberListPhoneNumber, _number_key,
+          {'owner_id': lambda number: number.owner and number.owner.owner_id,
+           'location_id': lambda number: number.location and number.location.id}),
+    _Kind('devices', Device, lambda device: device.device_id,
+          {'person_id': lambda device: device.person_id,
+           'location_id': lambda device: device.location_id or device.workspace_location_id,
+           'mac': lambda device: device.mac and device.mac.upper()}),
+    _Kind('queues', CallQueue, lambda queue: queue.id,
+          {'location_id': lambda queue: queue.location_id}),
+    # written by the queue index and the user directory; not pulled by the inventory
+    _Kind('queue_details', QueueDetails, lambda details: details.queue.id,
+          {'location_id': lambda details: details.queue.location_id}),
+    _Kind('people', Person, lambda person: person.person_id,
+          {'email': lambda person: person.emails[0].lower() if person.emails else None}))}
+
+# kind -> list of all objects of the org; kinds pulled by the inventory
+SOURCES: dict[str, Callable[[WebexSimpleApi], Iterable[BaseModel]]] = {
+    'locations': lambda api: api.locations.list(),
+    'numbers': lambda api: api.telephony.phone_numbers(),
+    'devices': lambda api: api.devices.list(),
+    # call queues with and without Customer Experience Essentials are listed separately
+    'queues': lambda api: (queue
+                           for has_cx_essentials in (False, True)
+                           for queue in api.telephony.callqueue.list(has_cx_essentials=has_cx_essentials))}
+
+
+class InventoryStore:
+    """
+    SQLite database with the latest snapshot of each kind of inventory objects.
+
+    Objects are stored as JSON in the format of the Webex API with indexed columns for lookups by person id, location
+    id and MAC address. The database can be shared by multiple processes: readers never block while a snapshot is
+    written (WAL journal) and :meth:`claim` makes sure that only one process at a time pulls a new snapshot.
+
+    Read methods return None if there is no snapshot of the kind or if the snapshot is older than `max_age`.
+    """
+
+    def __init__(self, path: str = None, max_age: float = None):
+        """
+        :param path: path of the database; default: :func:`default_path`
+        :param max_age: maximum age of snapshots in seconds; None: no limit
+        """
+        self.path = path or default_path()
+        self.max_age = max_age
+        self._local = threading.local()
+        with self._transaction() as conn:
+            for kind in KINDS.values():
+                columns = ''.join(f', {column} TEXT' for column in kind.columns)
+                conn.execute(f'CREATE TABLE IF NOT EXISTS {kind.name} (key TEXT PRIMARY KEY{columns}, '
+                             f'data TEXT NOT NULL)')
+                for column in kind.columns:
+                    conn.execute(f'CREATE INDEX IF NOT EXISTS {kind.name}_{column} ON {kind.name} ({column})')
+            conn.execute('CREATE TABLE IF NOT EXISTS snapshots (kind TEXT PRIMARY KEY, refreshed REAL, '
+                         'duration REAL, rows INTEGER, inserted INTEGER, updated INTEGER, deleted INTEGER, '
+                         'claimed_until REAL)')
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Connection of the current thread
+        """
+        if (conn := getattr(self._local, 'conn', None)) is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Write transaction; the write lock is taken immediately
+        """
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def age(self, kind: str) -> Optional[float]:
+        """
+        Age of the snapshot of a kind in seconds; None if there is no snapshot
+        """
+        row = self._connection().execute('SELECT refreshed FROM snapshots WHERE kind = ?', (kind,)).fetchone()
+        return row and row[0] and time.time() - row[0]
+
+    def claim(self, kind: str, min_age: float, timeout: float = 600) -> bool:
+        """
+        Claim the refresh of a kind for this process
+
+        :param kind: kind of objects
+        :param min_age: no refresh if the snapshot is younger than this; for example refreshed by another process
+        :param timeout: the claim expires after this many seconds if no snapshot is written
+        :return: True if the caller has to pull a new snapshot and call :meth:`write` or :meth:`release`
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute('SELECT refreshed, claimed_until FROM snapshots WHERE kind = ?', (kind,)).fetchone()
+            if row:
+                refreshed, claimed_until = row
+                if refreshed and now - refreshed < min_age or claimed_until and claimed_until > now:
+                    return False
+            conn.execute('INSERT INTO snapshots (kind, claimed_until) VALUES (?, ?) '
+                         'ON CONFLICT (kind) DO UPDATE SET claimed_until = excluded.claimed_until',
+                         (kind, now + timeout))
+        return True
+
+    def release(self, kind: str):
+        """
+        Release a claim without writing a snapshot; for example after a failed pull
+        """
+        with self._transaction() as conn:
+            conn.execute('UPDATE snapshots SET claimed_until = NULL WHERE kind = ?', (kind,))
+
+    def write(self, kind: str, objects: Iterable[BaseModel], duration: float = None) -> dict[str, int]:
+        """
+        Replace the snapshot of a kind. Only new, changed and removed objects are written
+
+        :param kind: kind of objects
+        :param objects: all objects of the kind
+        :param duration: time it took to pull the objects in seconds
+        :return: number of rows, inserted, updated and deleted objects
+        """
+        spec = KINDS[kind]
+        new = {}
+        for obj in objects:
+            new[spec.key(obj)] = ([column(obj) for column in spec.columns.values()] +
+                                  [obj.model_dump_json(by_alias=True, exclude_none=True)])
+        with self._transaction() as conn:
+            old = dict(conn.execute(f'SELECT key, data FROM {kind}'))
+            upsert = [(key, *values) for key, values in new.items() if old.get(key) != values[-1]]
+            delete = [(key,) for key in old if key not in new]
+            conn.executemany(self._upsert_statement(kind), upsert)
+            conn.executemany(f'DELETE FROM {kind} WHERE key = ?', delete)
+            counts = {'rows': len(new), 'inserted': sum(1 for key, *_ in upsert if key not in old),
+                      'deleted': len(delete)}
+            counts['updated'] = len(upsert) - counts['inserted']
+            conn.execute('INSERT OR REPLACE INTO snapshots '
+                         '(kind, refreshed, duration, rows, inserted, updated, deleted, claimed_until) '
+                         'VALUES (?, ?, ?, ?, ?, ?, ?, NULL)',
+                         (kind, time.time(), duration, counts['rows'], counts['inserted'], counts['updated'],
+                          counts['deleted']))
+        return counts
+
+    def put(self, kind: str, objects: Iterable[BaseModel]):
+        """
+        Insert or replace single objects of a kind without replacing the snapshot; for example after an update. The
+        age of the snapshot doesn't change
+
+        :param kind: kind of objects
+        :param objects: objects to write
+        """
+        spec = KINDS[kind]
+        rows = [(spec.key(obj), *[column(obj) for column in spec.columns.values()],
+                 obj.model_dump_json(by_alias=True, exclude_none=True))
+                for obj in objects]
+        with self._transaction() as conn:
+            conn.executemany(self._upsert_statement(kind), rows)
+
+    @staticmethod
+    def _upsert_statement(kind: str) -> str:
+        columns = ['key', *KINDS[kind].columns, 'data']
+        return f'INSERT OR REPLACE INTO {kind} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})'
+
+    def data_version(self) -> int:
+        """
+        Changes whenever another connection (of this or another process) commits a change to the database; cheap
+        check for changes before reading
+        """
+        return self._connection().execute('PRAGMA data_version').fetchone()[0]
+
+    def raw(self, kind: str, **filters: Optional[str]) -> Optional[list[str]]:
+        """
+        Objects of a kind as JSON strings in the format of the Webex API
+
+        :param kind: kind of objects
+        :param filters: indexed column -> value; for example person_id='...'
+        :return: JSON strings; None if there is no current snapshot of the kind
+        """
+        spec = KINDS[kind]
+        if (age := self.age(kind)) is None or self.max_age is not None and age > self.max_age:
+            return None
+        if unknown := set(filters) - set(spec.columns) - {'key'}:
+            raise ValueError(f'{kind}: unknown filters: {", ".join(sorted(unknown))}')
+        where = ' AND '.join(f'{column} = ?' for column in filters)
+        query = f'SELECT data FROM {kind}{where and f" WHERE {where}"}'
+        return [data for data, in self._connection().execute(query, tuple(filters.values()))]
+
+    def _objects(self, kind: str, **filters: Optional[str]) -> Optional[list]:
+        if (rows := self.raw(kind, **filters)) is None:
+            return None
+        model = KINDS[kind].model
+        return [model.model_validate_json(data) for data in rows]
+
+    def locations(self) -> Optional[list[Location]]:
+        return self._objects('locations')
+
+    def location(self, location_id: str) -> Optional[Location]:
+        """
+        One location; None if there is no current snapshot or the location is not in the snapshot
+        """
+        return next(iter(self._objects('locations', key=location_id) or []), None)
+
+    def numbers(self, owner_id: str = None, location_id: str = None) -> Optional[list[NumberListPhoneNumber]]:
+        return self._objects('numbers', **_filters(owner_id=owner_id, location_id=location_id))
+
+    def devices(self, person_id: str = None, location_id: str = None,
+                mac: str = None) -> Optional[list[Device]]:
+        return self._objects('devices', **_filters(person_id=person_id, location_id=location_id,
+                                                   mac=mac and mac.replace(':', '').upper()))
+
+    def queues(self, location_id: str = None) -> Optional[list[CallQueue]]:
+        return self._objects('queues', **_filters(location_id=location_id))
+
+    def queue_details(self) -> Optional[list[QueueDetails]]:
+        return self._objects('queue_details')
+
+    def people(self) -> Optional[list[Person]]:
+        return self._objects('people')
+
+    def snapshots(self) -> dict[str, dict[str, Any]]:
+        """
+        Kind -> snapshot information: age, duration, rows, inserted, updated, deleted
+        """
+        result = {kind: None for kind in KINDS}
+        now = time.time()
+        for kind, refreshed, *counts in self._connection().execute(
+                'SELECT kind, refreshed, duration, rows, inserted, updated, deleted FROM snapshots'):
+            if refreshed is not None:
+                result[kind] = {'age': now - refreshed} | dict(zip(('duration', 'rows', 'inserted', 'updated',
+                                                                    'deleted'), counts))
+        return result
+
+
+def open_snapshot(path: str = None, max_age: float = None) -> Optional[InventoryStore]:
+    """
+    Open an existing snapshot database; for readers like scripts
+
+    :param path: path of the database; default: :func:`default_path`
+    :param max_age: maximum age of snapshots in seconds; None: no limit
+    :return: store; None if there is no database
+    """
+    path = path or default_path()
+    if not isfile(path):
+        return None
+    return InventoryStore(path, max_age=max_age)
+
+
+def _filters(**filters: Optional[str]) -> dict[str, str]:
+    return {column: value for column, value in filters.items() if value is not None}
+
+
+class Inventory:
+    """
+    Maintains the inventory snapshot of the org in an :class:`InventoryStore`.
+
+    A background thread pulls a new snapshot of each kind every `interval` seconds:
+        * each kind is pulled with one paginated list request for the whole org
+        * only objects which changed since the previous snapshot are written; readers see either the previous or the
+          new snapshot of a kind
+        * the database is shared by all worker processes. A kind refreshed by another process within `interval`
+          seconds is not pulled again
+        * the snapshot survives restarts: after a restart lookups are answered from the database right away
+
+    Lookups are local database queries; see the read methods of :class:`InventoryStore`.
+    """
+
+    def __init__(self, api: WebexSimpleApi, store: InventoryStore, interval: float = 900,
+                 wait_for_token: Callable[[], Any] = None):
+        """
+        :param api: API used to list the inventory
+        :param store: database for the snapshots
+        :param interval: time between refresh cycles in seconds
+        :param wait_for_token: called before the first refresh cycle; blocks until the API has an access token
+        """
+        self.api = api
+        self.store = store
+        self.interval = interval
+        self.wait_for_token = wait_for_token
+        self._wakeup = threading.Event()
+        self._force = False
+        self._thread: Optional[threading.Thread] = None
+        self.refreshing = False
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        """
+        Start background maintenance of the snapshot
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='inventory', daemon=True)
+            self._thread.start()
+
+    def refresh(self, force: bool = False):
+        """
+        Trigger a refresh cycle
+
+        :param force: pull all kinds, even if they have been refreshed recently
+        """
+        self._force = self._force or force
+        self._wakeup.set()
+
+    @property
+    def ready(self) -> bool:
+        """
+        True if there is a snapshot of each kind pulled by the inventory
+        """
+        snapshots = self.store.snapshots()
+        return all(snapshots[kind] for kind in SOURCES)
+
+    def status(self) -> dict[str, Any]:
+        """
+        Inventory status:
+            * refreshing: True if a refresh cycle is in progress
+            * snapshots: kind -> age, duration, rows, inserted, updated and deleted objects of the last snapshot; None
+              if there is no snapshot of the kind
+            * last_error: error of the last refresh cycle, if any
+        """
+        return {'refreshing': self.refreshing,
+                'snapshots': self.store.snapshots(),
+                'last_error': self.last_error}
+
+    def _refresh_kind(self, kind: str, force: bool):
+        # claim with a slightly shorter minimum age: no skipped cycle if timers of two processes are not aligned
+        if not self.store.claim(kind, min_age=0 if force else self.interval * 0.9):
+            log.debug(f'inventory: {kind} refreshed recently, skipping')
+            return
+        start = time.perf_counter()
+        try:
+            objects = list(SOURCES[kind](self.api))
+        except BaseException:
+            self.store.release(kind)
+            raise
+        counts = self.store.write(kind, objects, duration=time.perf_counter() - start)
+        log.debug(f'inventory: {kind} refreshed in {time.perf_counter() - start:.3f} s, {counts}')
+
+    def _refresh_cycle(self):
+        force, self._force = self._force, False
+        errors = []
+        for kind in SOURCES:
+            try:
+                self._refresh_kind(kind, force)
+            except Exception as e:
+                log.error(f'inventory: refreshing {kind} failed: {e}')
+                errors.append(f'{kind}: {e}')
+        self.last_error = '; '.join(errors) or None
+
+    def _run(self):
+        if self.wait_for_token is not None:
+            self.wait_for_token()
+        failures = 0
+        while True:
+            self.refreshing = True
+            try:
+                with background_priority():
+                    self._refresh_cycle()
+            except Exception as e:
+                log.error(f'inventory: refresh failed: {e}')
+                self.last_error = f'{e}'
+            finally:
+                self.refreshing = False
+            # failed kinds are retried early; kinds refreshed successfully are skipped by the claim until they are due
+            failures = failures + 1 if self.last_error else 0
+            self._wakeup.wait(timeout=retry_delay(failures, self.interval))
+            self._wakeup.clear()
@@ -0,0 +1,331 @@
+"""
+Live updates of the queue and phone tables pushed to the browser as Server-Sent Events
+"""
+import logging
+import threading
+import time
+from collections.abc import Callable, Iterator
+from functools import partial
+from queue import Empty, SimpleQueue
+from typing import Any, Optional
+
+from flask import Flask
+from wxc_sdk.devices import Device
+from wxc_sdk.rest import RestError
+from wxc_sdk.telephony.callqueue import CallQueue
+
+from .rate_limit import background_priority
+from .serialization import dumps
+from .sessions import SessionUser
+
+__all__ = ['Subscription', 'LiveUpdates']
+
+log = logging.getLogger(__name__)
+
+# section name -> key of a row in the section's table
+ROW_KEYS: dict[str, Callable[[dict], str]] = {
+    'userqueues': lambda row: row['join_info']['location_and_queue_id'],
+    'userphones': lambda row: row['mac']}
+
+
+class Subscription:
+    """
+    One event stream: the events for the stream and the rows the browser has seen so far
+    """
+
+    def __init__(self, user: SessionUser):
+        self.user = user
+        self.events: SimpleQueue[tuple[str, dict]] = SimpleQueue()
+        self._lock = threading.Lock()
+        # section name -> row key -> row; None until the snapshot has been sent
+        self._rows: Optional[dict[str, dict[str, dict]]] = None
+
+    def seed(self, sections: dict[str, dict]):
+        """
+        Start from sections the browser already has, for example from the dashboard: no snapshot is sent and the
+        first event is a diff
+
+        :param sections: section name -> response of the endpoint for the section
+        """
+        with self._lock:
+            self._rows = {name: {ROW_KEYS[name](row): row for row in section.get('rows', [])}
+                          for name, section in sections.items() if section.get('success')}
+
+    def publish(self, sections: dict[str, dict]):
+        """
+        Queue events for the current state of the sections: a snapshot for the first call and after that only
+        changed and removed rows. Sections which couldn't be read are skipped in diffs
+
+        :param sections: section name -> response of the endpoint for the section; for example /api/userqueues
+        """
+        with self._lock:
+            if self._rows is None:
+                self._rows = {name: {ROW_KEYS[name](row): row for row in section.get('rows', [])}
+                              for name, section in sections.items() if section.get('success')}
+                self.events.put(('snapshot', sections))
+                return
+            diff = {}
+            for name, section in sections.items():
+                if not section.get('success'):
+                    continue
+                old = self._rows.get(name, {})
+                new = {ROW_KEYS[name](row): row for row in section['rows']}
+                upsert = [row for key, row in new.items() if old.get(key) != row]
+                remove = [key for key in old if key not in new]
+                self._rows[name] = new
+                if upsert or remove:
+                    diff[name] = {'upsert': upsert, 'remove': remove}
+            if diff:
+                self.events.put(('diff', diff))
+
+    @property
+    def started(self) -> bool:
+        """
+        True if the browser has the rows of the sections: a snapshot has been queued or the subscription was seeded
+        """
+        with self._lock:
+            return self._rows is not None
+
+    def keys(self, section: str) -> set[str]:
+        """
+        Keys of the rows of a section the browser has seen
+        """
+        with self._lock:
+            return set((self._rows or {}).get(section, {}))
+
+
+class LiveUpdates:
+    """
+    Pushes changes of the queue and phone tables to all open portal pages.
+
+    A background thread polls the Webex APIs every `interval` seconds on behalf of all subscribers of the process;
+    there are no Webex API calls while there are no subscribers:
+        * devices of each subscribed user are read once per cycle, no matter how many streams the user has open
+        * details of each call queue subscribers are agents of are read once per cycle, no matter how many
+          subscribers are agents of the queue. Details are written through to the cache and the queue index
+        * the tables of each user are then built from the refreshed cache and the queue index. Each subscriber gets
+          only the rows which changed since the last event on the subscriber's stream
+
+    Each stream occupies a server thread: at most `max_streams` streams are served concurrently. Streams are closed
+    after `max_age` seconds; the browser reconnects and gets a new snapshot.
+
+    A page which has just loaded the dashboard doesn't need a snapshot: the dashboard passes the sections it served to
+    :meth:`seed` and the first stream of the user within `seed_ttl` seconds starts diffing from these sections instead
+    of reading them again.
+    """
+
+    def __init__(self, app: Flask, interval: float = 15, max_streams: int = 6, max_age: float = 600,
+                 keepalive: float = 20, seed_ttl: float = 30):
+        """
+        :param app: the portal app (:class:`AppWithTokens`)
+        :param interval: time between poll cycles in seconds
+        :param max_streams: maximum number of concurrent streams
+        :param max_age: streams are closed after this many seconds
+        :param keepalive: a comment is sent on idle streams every `keepalive` seconds
+        :param seed_ttl: sections passed to :meth:`seed` are used by streams opened within this many seconds
+        """
+        self.app = app
+        self.interval = interval
+        self.max_streams = max_streams
+        self.max_age = max_age
+        self.keepalive = keepalive
+        self.seed_ttl = seed_ttl
+        self._lock = threading.Lock()
+        self._subscriptions: list[Subscription] = []
+        # person id -> (expiry, sections) of the last dashboard of the user
+        self._seeds: dict[str, tuple[float, dict[str, dict]]] = {}
+        self._thread: Optional[threading.Thread] = None
+        self.cycles = 0
+        self.events = 0
+        self.rejected = 0
+        self.seeded = 0
+        self.last_cycle_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        """
+        Start the background poller
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='live-updates', daemon=True)
+            self._thread.start()
+
+    def seed(self, user: SessionUser, sections: dict[str, dict]):
+        """
+        Sections just sent to the browser of a user; for example by the dashboard
+
+        :param sections: section name -> response of the endpoint for the section
+        """
+        if self._thread is None:
+            return
+        now = time.monotonic()
+        sections = {name: section for name, section in sections.items() if name in ROW_KEYS}
+        with self._lock:
+            # drop expired seeds of users who never opened a stream
+            for person_id in [p for p, (expiry, _) in self._seeds.items() if expiry < now]:
+                del self._seeds[person_id]
+            self._seeds[user.person_id] = (now + self.seed_ttl, sections)
+
+    def subscribe(self, user: SessionUser, seeded: bool = False) -> Optional[Subscription]:
+        """
+        Subscribe to updates for a user
+
+        :param seeded: the browser has the sections passed to :meth:`seed`; the stream starts from these if they
+            haven't expired yet
+        :return: subscription; None if live updates are disabled or the maximum number of streams is reached
+        """
+        with self._lock:
+            if self._thread is None or len(self._subscriptions) >= self.max_streams:
+                self.rejected += 1
+                return None
+            subscription = Subscription(user)
+            # each seed is used once: reconnects get a snapshot as they might have missed events
+            seed = self._seeds.pop(user.person_id, None) if seeded else None
+            if seed is not None and seed[0] >= time.monotonic():
+                subscription.seed(seed[1])
+                self.seeded += 1
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def stream(self, subscription: Subscription) -> Iterator[str]:
+        """
+        Event stream of a subscription in the Server-Sent Events format. The first event is a snapshot of all
+        sections unless the subscription has been seeded. The subscription is removed when the stream is closed
+        """
+        try:
+            yield 'retry: 5000\n\n'
+            if not subscription.started:
+                subscription.publish(self.read_sections(subscription.user))
+            deadline = time.monotonic() + self.max_age
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    event, data = subscription.events.get(timeout=min(self.keepalive, remaining))
+                except Empty:
+                    # keep proxies from closing an idle connection; also detects closed connections
+                    yield ': keepalive\n\n'
+                    continue
+                self.events += 1
+                yield f'event: {event}\ndata: {dumps(data).decode()}\n\n'
+        finally:
+            self.unsubscribe(subscription)
+
+    def read_sections(self, user: SessionUser) -> dict[str, dict]:
+        """
+        Current data of the queue and phone sections of a user
+        """
+        from .api import sections
+
+        result = {}
+        for name, read in (('userqueues', sections.user_queues), ('userphones', sections.user_phones)):
+            try:
+                result[name] = read(self.app, user)
+            except Exception as e:
+                log.warning(f'live updates: reading {name} for {user.display_name} failed: {e}')
+                result[name] = {'success': False, 'message': f'{e}'}
+        return result
+
+    def status(self) -> dict[str, Any]:
+        """
+        Status of live updates:
+            * streams: number of open streams
+            * users: number of users with open streams
+            * cycles: number of poll cycles
+            * events: number of events sent
+            * rejected: number of streams rejected because the maximum number of streams was reached
+            * seeded: number of streams which started from the dashboard instead of a snapshot
+            * last_cycle_duration: duration of the last poll cycle in seconds
+            * last_error: error of the last poll cycle, if any
+        """
+        with self._lock:
+            streams = len(self._subscriptions)
+            users = len({s.user.person_id for s in self._subscriptions})
+        return {'streams': streams,
+                'users': users,
+                'cycles': self.cycles,
+                'events': self.events,
+                'rejected': self.rejected,
+                'seeded': self.seeded,
+                'last_cycle_duration': self.last_cycle_duration,
+                'last_error': self.last_error}
+
+    def _refresh_phones(self, person_ids: set[str]):
+        """
+        Read the devices of the subscribed users and update the cache
+        """
+
+        def read(person_id: str) -> list[Device]:
+            return list(self.app.api.devices.list(person_id=person_id))
+
+        person_ids = list(person_ids)
+        devices = self.app.executor.map((partial(read, person_id) for person_id in person_ids),
+                                        user_id='live-updates')
+        for person_id, person_devices in zip(person_ids, devices):
+            self.app.cache.set(person_id, 'devices', person_devices)
+
+    def _refresh_queues(self, queue_ids: set[str]):
+        """
+        Read details of call queues and write them through to the cache and the queue index
+
+        :param queue_ids: location and queue ids in format "location_id.queue_id"
+        """
+
+        def read(location_and_queue_id: str) -> Optional[tuple[str, CallQueue]]:
+            location_id, queue_id = location_and_queue_id.split('.')
+            try:
+                return location_id, self.app.api.telephony.callqueue.details(location_id=location_id,
+                                                                             queue_id=queue_id)
+            except RestError as e:
+                if e.response.status_code == 404:
+                    return None
+                raise
+
+        results = self.app.executor.map((partial(read, queue_id) for queue_id in queue_ids), user_id='live-updates')
+        for result in results:
+            if result is None:
+                continue
+            location_id, detail = result
+            if self.app.queue_index.ready:
+                # also updates the cache and the indexes of other processes
+                self.app.queue_index.update_queue(location_id, detail)
+            else:
+                self.app.cache.set(detail.id, 'queue_details', detail)
+
+    def _poll_cycle(self):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        if not subscriptions:
+            return
+        start = time.perf_counter()
+        users = {s.user.person_id: s.user for s in subscriptions}
+        # queues currently shown to any subscriber
+        queue_ids = set().union(*(s.keys('userqueues') for s in subscriptions))
+        self._refresh_phones(set(users))
+        self._refresh_queues(queue_ids)
+        for person_id, user in users.items():
+            sections = self.read_sections(user)
+            for subscription in subscriptions:
+                if subscription.user.person_id == person_id:
+                    subscription.publish(sections)
+        self.cycles += 1
+        self.last_cycle_duration = time.perf_counter() - start
+        log.debug(f'live updates: poll cycle done in {self.last_cycle_duration:.3f} s, {len(users)} users, '
+                  f'{len(subscriptions)} streams, {len(queue_ids)} queues')
+
+    def _run(self):
+        # no poll cycles failing for lack of an access token right after a cold start
+        self.app.token_manager.wait()
+        while True:
+            try:
+                with background_priority():
+                    self._poll_cycle()
+            except Exception as e:
+                log.error(f'live updates: poll cycle failed: {e}')
+                self.last_error = f'{e}'
+            else:
+                self.last_error = None
+            time.sleep(self.interval)
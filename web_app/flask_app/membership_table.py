@@ -0,0 +1,131 @@
+"""
+Org-wide table of the call queue memberships of all agents with paging, sorting and filtering on the server
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+from .queue_index import CallQueueIndex, QueueMembership
+
+__all__ = ['COLUMNS', 'MembershipTable']
+
+#: columns of the table; all columns are sortable, the text columns are searchable
+COLUMNS = ('agent', 'queue', 'location', 'extension', 'joined', 'allow_join')
+_TEXT_COLUMNS = ('agent', 'queue', 'location', 'extension')
+
+
+class _Table:
+    """
+    Rows for one version of the queue index with sort orders and search results computed on first use
+    """
+
+    def __init__(self, version: int, memberships: list[tuple[str, str, QueueMembership]], max_cached_searches: int):
+        self.version = version
+        self.rows = [{'agent': agent_name,
+                      'queue': m.queue.name or '',
+                      'location': m.queue.location_name or '',
+                      'extension': m.queue.extension or '',
+                      'joined': m.join_enabled,
+                      'allow_join': m.allow_agent_join_enabled}
+                     for _, agent_name, m in memberships]
+        self._search_keys = ['\t'.join(row[column] for column in _TEXT_COLUMNS).lower() for row in self.rows]
+        self._max_cached_searches = max_cached_searches
+        self._lock = threading.Lock()
+        # column -> row indices in ascending order
+        self._orders: dict[str, list[int]] = {}
+        # (search, column) -> matching row indices in ascending order; LRU
+        self._searches: OrderedDict[tuple[str, str], list[int]] = OrderedDict()
+
+    def _order(self, column: str) -> list[int]:
+        # caller holds the lock
+        if (order := self._orders.get(column)) is None:
+            rows = self.rows
+
+            def key(i: int) -> tuple:
+                value = rows[i][column]
+                # ties are sorted by agent and queue
+                return (value.lower() if isinstance(value, str) else value,
+                        rows[i]['agent'].lower(), rows[i]['queue'].lower())
+
+            order = sorted(range(len(rows)), key=key)
+            self._orders[column] = order
+        return order
+
+    def select(self, search: str, column: str) -> list[int]:
+        """
+        Indices of the rows matching all words of the search string in ascending order of the column
+        """
+        with self._lock:
+            order = self._order(column)
+            words = search.lower().split()
+            if not words:
+                return order
+            cache_key = (' '.join(words), column)
+            if (selected := self._searches.get(cache_key)) is None:
+                keys = self._search_keys
+                selected = [i for i in order if all(word in keys[i] for word in words)]
+                self._searches[cache_key] = selected
+                while len(self._searches) > self._max_cached_searches:
+                    self._searches.popitem(last=False)
+            else:
+                self._searches.move_to_end(cache_key)
+            return selected
+
+
+class MembershipTable:
+    """
+    Memberships of all agents in all call queues, served from the :class:`CallQueueIndex`; no Webex API calls.
+
+    Rows are built when the table is queried after a change of the index. For each column the sort order is computed
+    on first use and results of the most recent searches are kept until the next change: paging through a sorted and
+    filtered table only slices precomputed lists.
+    """
+
+    def __init__(self, queue_index: CallQueueIndex, max_cached_searches: int = 32):
+        """
+        :param queue_index: the index the table is built from
+        :param max_cached_searches: number of search results kept
+        """
+        self.queue_index = queue_index
+        self.max_cached_searches = max_cached_searches
+        self._lock = threading.Lock()
+        self._table: Optional[_Table] = None
+
+    def _current(self) -> Optional[_Table]:
+        with self._lock:
+            if self._table is None or self._table.version != self.queue_index.version:
+                if (snapshot := self.queue_index.all_memberships()) is None:
+                    return None
+                version, memberships = snapshot
+                self._table = _Table(version, memberships, self.max_cached_searches)
+            return self._table
+
+    def query(self, start: int = 0, length: int = 10, search: str = '', order_column: str = 'agent',
+              descending: bool = False) -> Optional[dict[str, Any]]:
+        """
+        One page of the table
+
+        :param start: index of the first row of the page in the sorted and filtered table
+        :param length: number of rows of the page; -1 for all rows
+        :param search: only rows with all words of the search string in one of the text columns
+        :param order_column: column to sort by; one of :data:`COLUMNS`
+        :param descending: sort in descending order
+        :return: dict with total (number of rows), filtered (number of rows matching the search) and rows; None if
+            the queue index is not ready yet
+        """
+        if order_column not in COLUMNS:
+            raise ValueError(f'unknown column "{order_column}"')
+        if (table := self._current()) is None:
+            return None
+        selected = table.select(search, order_column)
+        count = len(selected)
+        length = count if length < 0 else length
+        start = max(0, start)
+        if descending:
+            end = max(0, count - start)
+            page = selected[max(0, end - length):end][::-1]
+        else:
+            page = selected[start:start + length]
+        return {'total': len(table.rows),
+                'filtered': count,
+                'rows': [table.rows[i] for i in page]}
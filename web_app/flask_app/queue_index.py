@@ -0,0 +1,392 @@
+"""
+Org-wide index of call queues and their agents
+"""
+import logging
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Optional
+
+from wxc_sdk import WebexSimpleApi
+from wxc_sdk.rest import RestError
+from wxc_sdk.telephony.callqueue import CallQueue
+
+from .cache import TTLCache
+from .executor import FanOutExecutor
+from .inventory import InventoryStore, QueueDetails
+from .rate_limit import background_priority, retry_delay
+
+__all__ = ['QueueMembership', 'CallQueueIndex']
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class QueueMembership:
+    """
+    Membership of an agent in a call queue
+    """
+    #: the call queue as returned by the call queue list. Has id, name, extension, location_id, location_name
+    queue: CallQueue
+    #: True if the agent is joined to the queue
+    join_enabled: bool
+    #: True if agents can join/unjoin the queue
+    allow_agent_join_enabled: bool
+
+
+@dataclass
+class _QueueEntry:
+    queue: CallQueue
+    detail: CallQueue
+    # agent id -> membership
+    members: dict[str, QueueMembership]
+    refreshed: float
+
+
+class CallQueueIndex:
+    """
+    In-memory index of all call queues of the org: agent id -> queue memberships.
+
+    The index is built from the list of call queues plus one details request per queue and maintained by a background
+    thread:
+        * every `interval` seconds the call queue list is read again. Details for new queues are read and removed
+          queues are dropped
+        * in each refresh cycle also details for the `batch_size` least recently refreshed queues are read again
+        * :meth:`refresh` forces a full refresh of all queues
+        * :meth:`update_queue` can be used to write through queue details after an update
+
+    With a `store` the index is shared by all worker processes: in each cycle only the process which claims the
+    refresh in the store reads from the Webex APIs and writes the queue details to the store; all other processes load
+    their index from the store. Indexes of other processes lag behind by up to `interval` seconds. Write-through
+    updates are written to the store as well and other processes pick them up within `sync_interval` seconds. Without
+    a store each process reads all queues.
+
+    With a `cache` write-through updates, including the ones picked up from the store, also replace the cached queue
+    details.
+    """
+
+    def __init__(self, api: WebexSimpleApi, executor: FanOutExecutor, interval: float = 300, batch_size: int = 50,
+                 wait_for_token: Callable[[], Any] = None, store: InventoryStore = None, sync_interval: float = 5,
+                 cache: TTLCache = None):
+        """
+        :param api: API used to read call queue information
+        :param executor: executor used to read queue details concurrently
+        :param interval: time between refresh cycles in seconds
+        :param batch_size: number of existing queues to re-read in each refresh cycle
+        :param wait_for_token: called before the first refresh cycle; blocks until the API has an access token
+        :param store: database shared with other processes
+        :param sync_interval: time in seconds between checks for changes of the store by other processes
+        :param cache: cache to write through updated queue details
+        """
+        self.api = api
+        self.executor = executor
+        self.interval = interval
+        self.batch_size = batch_size
+        self.wait_for_token = wait_for_token
+        self.store = store
+        self.sync_interval = sync_interval
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._queues: dict[str, _QueueEntry] = {}
+        # agent id -> queue id -> membership
+        self._agents: dict[str, dict[str, QueueMembership]] = {}
+        # agent id -> name
+        self._agent_names: dict[str, str] = {}
+        #: incremented on each change of queues or memberships
+        self.version = 0
+        self._wakeup = threading.Event()
+        self._force = False
+        self._thread: Optional[threading.Thread] = None
+        self.ready = False
+        self.refreshing = False
+        self.last_refresh: Optional[float] = None
+        self.last_full_refresh: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        """
+        Start background maintenance of the index
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='queue-index', daemon=True)
+            self._thread.start()
+
+    def refresh(self, force: bool = True):
+        """
+        Trigger a refresh cycle in the background
+
+        :param force: re-read details of all queues
+        """
+        self._force = self._force or force
+        self._wakeup.set()
+
+    def memberships(self, agent_id: str) -> Optional[list[QueueMembership]]:
+        """
+        Queue memberships of an agent
+
+        :param agent_id: agent id
+        :return: list of memberships; None if the index is not ready yet
+        """
+        if not self.ready:
+            return None
+        with self._lock:
+            return list(self._agents.get(agent_id, {}).values())
+
+    def all_memberships(self) -> Optional[tuple[int, list[tuple[str, str, QueueMembership]]]]:
+        """
+        Memberships of all agents
+
+        :return: version of the index and list of (agent id, agent name, membership); None if the index is not ready
+            yet
+        """
+        if not self.ready:
+            return None
+        with self._lock:
+            return self.version, [(agent_id, self._agent_names.get(agent_id, ''), membership)
+                                  for agent_id, agent_queues in self._agents.items()
+                                  for membership in agent_queues.values()]
+
+    def update_queue(self, location_id: str, detail: CallQueue):
+        """
+        Write-through of call queue details; for example after the queue has been updated. With a store the details
+        are also written to the store so that the indexes of other processes pick up the update
+
+        :param location_id: location of the queue
+        :param detail: call queue details
+        """
+        entry = self._queues.get(detail.id)
+        queue = entry.queue if entry else CallQueue(id=detail.id, name=detail.name, extension=detail.extension,
+                                                    location_id=location_id)
+        refreshed = time.time()
+        self._set_details(queue, detail, refreshed=refreshed)
+        if self.cache is not None:
+            self.cache.set(detail.id, 'queue_details', detail)
+        if self.store is None:
+            return
+        try:
+            self.store.put('queue_details', [QueueDetails(queue=queue, detail=detail, refreshed=refreshed)])
+        except Exception as e:
+            # the index of this process is up to date; other processes catch up with the next refresh cycle
+            log.warning(f'queue index: failed to write details of queue "{queue.name}" to store: {e}')
+
+    def status(self) -> dict[str, Any]:
+        """
+        Index status:
+            * ready: True if the index has been built
+            * refreshing: True if a refresh cycle is in progress
+            * age: seconds since the last refresh cycle
+            * full_refresh_age: seconds since the last full refresh
+            * oldest_queue_age: seconds since the details of the least recently refreshed queue have been read
+            * queues: number of queues
+            * agents: number of agents
+            * shared: True if the index is shared with other processes
+            * last_error: error of the last refresh cycle, if any
+        """
+        now = time.time()
+        with self._lock:
+            oldest = min((e.refreshed for e in self._queues.values()), default=None)
+            queues = len(self._queues)
+            agents = len(self._agents)
+        return {'ready': self.ready,
+                'refreshing': self.refreshing,
+                'age': self.last_refresh and now - self.last_refresh,
+                'full_refresh_age': self.last_full_refresh and now - self.last_full_refresh,
+                'oldest_queue_age': oldest and now - oldest,
+                'queues': queues,
+                'agents': agents,
+                'shared': self.store is not None,
+                'last_error': self.last_error}
+
+    def _set_details(self, queue: CallQueue, detail: CallQueue, refreshed: float = None):
+        """
+        Update index with queue details
+
+        :param refreshed: time the details have been read; default: now
+        """
+        members = {agent.agent_id: QueueMembership(queue=queue,
+                                                   join_enabled=bool(agent.join_enabled),
+                                                   allow_agent_join_enabled=bool(detail.allow_agent_join_enabled))
+                   for agent in detail.agents or []}
+        names = {agent.agent_id: ' '.join(filter(None, (agent.first_name, agent.last_name)))
+                 for agent in detail.agents or []}
+        with self._lock:
+            old = self._queues.get(queue.id)
+            if old is None or old.members != members:
+                self.version += 1
+            for agent_id in old.members if old else []:
+                if agent_id not in members:
+                    self._remove_membership(agent_id, queue.id)
+            for agent_id, membership in members.items():
+                self._agents.setdefault(agent_id, {})[queue.id] = membership
+            self._agent_names.update(names)
+            self._queues[queue.id] = _QueueEntry(queue=queue, detail=detail, members=members,
+                                                 refreshed=refreshed or time.time())
+
+    def _remove_membership(self, agent_id: str, queue_id: str):
+        # caller holds the lock
+        agent_queues = self._agents[agent_id]
+        agent_queues.pop(queue_id, None)
+        if not agent_queues:
+            del self._agents[agent_id]
+            self._agent_names.pop(agent_id, None)
+
+    def _remove_queue(self, queue_id: str):
+        with self._lock:
+            entry = self._queues.pop(queue_id, None)
+            if entry is not None:
+                self.version += 1
+            for agent_id in entry.members if entry else []:
+                self._remove_membership(agent_id, queue_id)
+
+    def _read_details(self, queue: CallQueue) -> Optional[CallQueue]:
+        try:
+            return self.api.telephony.callqueue.details(location_id=queue.location_id, queue_id=queue.id)
+        except RestError as e:
+            if e.response.status_code == 404:
+                # queue has been deleted in the meantime
+                return None
+            raise
+
+    def _load(self, merge: bool = False) -> bool:
+        """
+        Load the index from the store
+
+        :param merge: only apply newer details of queues already in the index; for example write-through updates of
+            other processes. Queues are neither added nor removed
+        :return: False if there are no queue details in the store
+        """
+        if (stored := self.store.queue_details()) is None:
+            return False
+        stored: list[QueueDetails]
+        with self._lock:
+            known = {queue_id: entry.refreshed for queue_id, entry in self._queues.items()}
+        if not merge:
+            for queue_id in set(known) - {details.queue.id for details in stored}:
+                self._remove_queue(queue_id)
+        for details in stored:
+            if merge and details.queue.id not in known:
+                continue
+            # don't replace newer details; for example from a write-through in this process
+            if known.get(details.queue.id, 0) < details.refreshed:
+                self._set_details(details.queue, details.detail, refreshed=details.refreshed)
+                if merge and self.cache is not None:
+                    # write-through update of another process
+                    self.cache.set(details.queue.id, 'queue_details', details.detail)
+        if not merge:
+            self.last_refresh = time.time()
+        return True
+
+    def _refresh_cycle(self, force: bool) -> bool:
+        """
+        One refresh cycle. With a store only the process which claims the refresh reads from the Webex APIs
+
+        :return: True if the index is complete
+        """
+        if self.store is None:
+            self._read_queues(force)
+            return True
+        # claim with a slightly shorter minimum age: no skipped cycle if timers of two processes are not aligned
+        claimed = self.store.claim('queue_details', min_age=0 if force else self.interval * 0.9)
+        # start from the latest state in the store: the previous cycle might have been done by another process
+        loaded = self._load()
+        if not claimed:
+            log.debug('queue index: refreshed by another process, loaded from store')
+            return loaded
+        start = time.perf_counter()
+        try:
+            self._read_queues(force)
+        except BaseException:
+            self.store.release('queue_details')
+            raise
+        # don't overwrite write-through updates other processes made while the queues were read
+        self._load(merge=True)
+        with self._lock:
+            stored = [QueueDetails(queue=entry.queue, detail=entry.detail, refreshed=entry.refreshed)
+                      for entry in self._queues.values()]
+        self.store.write('queue_details', stored, duration=time.perf_counter() - start)
+        return True
+
+    def _read_queues(self, force: bool):
+        """
+        Read list of queues and then details of new queues and the least recently refreshed queues
+        """
+        start = time.time()
+        queues = {queue.id: queue
+                  for has_cx_essentials in (False, True)
+                  for queue in self.api.telephony.callqueue.list(has_cx_essentials=has_cx_essentials)}
+        with self._lock:
+            known = dict(self._queues)
+        for queue_id in set(known) - set(queues):
+            self._remove_queue(queue_id)
+        if force:
+            to_read = list(queues.values())
+        else:
+            new = [queue for queue_id, queue in queues.items() if queue_id not in known]
+            existing = sorted((entry for queue_id, entry in known.items() if queue_id in queues),
+                              key=lambda e: e.refreshed)
+            to_read = new + [queues[entry.queue.id] for entry in existing[:self.batch_size]]
+        log.debug(f'queue index: reading details for {len(to_read)} of {len(queues)} queues')
+        details = self.executor.map((partial(self._read_details, queue) for queue in to_read),
+                                    user_id='queue-index')
+        for queue, detail in zip(to_read, details):
+            if detail is None:
+                self._remove_queue(queue.id)
+            else:
+                self._set_details(queue, detail)
+        self.last_refresh = time.time()
+        if force:
+            self.last_full_refresh = self.last_refresh
+        log.debug(f'queue index: refresh cycle done in {self.last_refresh - start:.3f} s, {len(self._queues)} queues, '
+                  f'{len(self._agents)} agents')
+
+    def _run(self):
+        if self.wait_for_token is not None:
+            self.wait_for_token()
+        failures = 0
+        while True:
+            # with a store the index is completed from the store; new queues are read in any case
+            force = self._force or not self.ready and self.store is None
+            self._force = False
+            self.refreshing = True
+            complete = False
+            try:
+                with background_priority():
+                    complete = self._refresh_cycle(force=force)
+            except Exception as e:
+                log.error(f'queue index: refresh failed: {e}')
+                self.last_error = f'{e}'
+                failures += 1
+                # try again with a full refresh if we never got to a complete index
+                self._force = self._force or not self.ready and self.store is None
+            else:
+                self.last_error = None
+                failures = 0
+                self.ready = self.ready or complete
+            finally:
+                self.refreshing = False
+            # not ready without failures: another process is building the index, check the store again soon
+            delay = retry_delay(failures, self.interval) if self.ready or failures else min(self.interval, 1)
+            self._wait(delay)
+            self._wakeup.clear()
+
+    def _wait(self, delay: float):
+        """
+        Wait for the next refresh cycle. With a store, write-through updates of other processes are picked up from the
+        store in the meantime
+        """
+        if self.store is None or not self.ready:
+            self._wakeup.wait(timeout=delay)
+            return
+        deadline = time.monotonic() + delay
+        version = self.store.data_version()
+        while (remaining := deadline - time.monotonic()) > 0:
+            if self._wakeup.wait(timeout=min(remaining, self.sync_interval)):
+                return
+            try:
+                if (current := self.store.data_version()) != version:
+                    version = current
+                    self._load(merge=True)
+            except Exception as e:
+                log.warning(f'queue index: sync from store failed: {e}')
@@ -0,0 +1,192 @@
+"""
+Conflict-safe updates of the join state of agents in call queues
+"""
+import logging
+import threading
+from collections.abc import Iterable
+from dataclasses import dataclass
+from typing import Optional
+
+from wxc_sdk import WebexSimpleApi
+from wxc_sdk.telephony.callqueue import CallQueue
+
+from .executor import FanOutExecutor
+from .queue_index import CallQueueIndex
+
+__all__ = ['JoinChange', 'JoinResult', 'QueueJoinUpdater']
+
+log = logging.getLogger(__name__)
+
+#: number of locks serializing updates of queues; each queue id is mapped to one of these locks
+LOCK_STRIPES = 64
+
+
+@dataclass(frozen=True)
+class JoinChange:
+    """
+    Requested join state of an agent in a call queue
+    """
+    location_id: str
+    queue_id: str
+    joined: bool
+
+
+@dataclass
+class JoinResult:
+    """
+    Result of a join state change
+    """
+    location_id: str
+    queue_id: str
+    joined: bool
+    success: bool
+    #: number of read-modify-write attempts
+    attempts: int = 0
+    message: Optional[str] = None
+
+
+class QueueJoinUpdater:
+    """
+    Updates the join state of agents in call queues.
+
+    The Webex API only allows to update a call queue as a whole: details are read, the join state of the agent is
+    modified and the complete queue (including all agents) is written back. Concurrent updates of the same queue can
+    overwrite each other:
+        * within the process read-modify-write cycles of the same queue are serialized. Queues share a fixed number of
+          striped locks: updates of two queues mapped to the same lock are serialized as well
+        * after each update the queue is read again to verify the join state of the agent. If the change has been
+          overwritten by a concurrent update (for example from another worker process) the update is retried
+        * no update is sent if the agent already is in the requested state
+
+    Changes for multiple queues are executed concurrently on the executor, with at most `parallelism` queues being
+    updated at the same time.
+    """
+
+    def __init__(self, api: WebexSimpleApi, executor: FanOutExecutor, queue_index: CallQueueIndex,
+                 parallelism: int = 8, max_attempts: int = 3):
+        """
+        :param api: API used to read and update call queues
+        :param executor: executor used to update multiple queues concurrently
+        :param queue_index: queue index to write through the updated queue details; the index passes them on to the
+            cache and to the indexes of other processes
+        :param parallelism: maximum number of queues updated concurrently
+        :param max_attempts: maximum number of read-modify-write attempts per queue
+        """
+        self.api = api
+        self.executor = executor
+        self.queue_index = queue_index
+        self.parallelism = parallelism
+        self.max_attempts = max_attempts
+        # striped locks: memory doesn't grow with the number of queues ever updated
+        self._queue_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+        # metrics
+        self.updates = 0
+        self.skipped = 0
+        self.retries = 0
+
+    def _queue_lock(self, queue_id: str) -> threading.Lock:
+        # only one queue lock is held at a time: no deadlocks if queues share a lock
+        return self._queue_locks[hash(queue_id) % len(self._queue_locks)]
+
+    @staticmethod
+    def _join_state(detail: CallQueue, agent_id: str) -> Optional[bool]:
+        """
+        Join state of an agent in a queue; None if the user is not an agent of the queue
+        """
+        agent = next((agent for agent in detail.agents or [] if agent.agent_id == agent_id), None)
+        return agent and bool(agent.join_enabled)
+
+    def _update_queue(self, agent_id: str, change: JoinChange) -> JoinResult:
+        """
+        Read-modify-write cycle(s) for one queue
+        """
+        result = JoinResult(location_id=change.location_id, queue_id=change.queue_id, joined=change.joined,
+                            success=False)
+        tapi = self.api.telephony.callqueue
+        with self._queue_lock(change.queue_id):
+            # always read from the API: we don't want to write back stale data
+            detail = tapi.details(location_id=change.location_id, queue_id=change.queue_id)
+            while True:
+                joined = self._join_state(detail, agent_id)
+                if joined is None:
+                    result.message = f'not an agent of queue "{detail.name}"'
+                    return result
+                if joined == change.joined:
+                    if not result.attempts:
+                        self.skipped += 1
+                    result.success = True
+                    break
+                if not detail.allow_agent_join_enabled:
+                    result.message = f'agents can\'t join or unjoin queue "{detail.name}"'
+                    return result
+                if result.attempts == self.max_attempts:
+                    result.message = f'update of queue "{detail.name}" was overwritten by concurrent updates'
+                    return result
+                if result.attempts:
+                    log.warning(f'update of queue "{detail.name}" was overwritten, retrying')
+                    self.retries += 1
+                result.attempts += 1
+                agent = next(agent for agent in detail.agents if agent.agent_id == agent_id)
+                agent.join_enabled = change.joined
+                log.debug('updating join state of agent in queue "%s": %s', detail.name, change.joined)
+                tapi.update(location_id=change.location_id, queue_id=change.queue_id, update=detail)
+                self.updates += 1
+                # verify: read again to detect lost updates
+                detail = tapi.details(location_id=change.location_id, queue_id=change.queue_id)
+        # write-through: the verified queue details are the new state of the queue in all processes
+        self.queue_index.update_queue(location_id=change.location_id, detail=detail)
+        return result
+
+    def _lane(self, agent_id: str, changes: Iterable[JoinChange], changes_lock: threading.Lock) -> list[JoinResult]:
+        """
+        Work through changes from a shared iterator; running `parallelism` lanes bounds the number of concurrent
+        updates
+        """
+        results = []
+        while True:
+            with changes_lock:
+                change = next(changes, None)
+            if change is None:
+                return results
+            try:
+                result = self._update_queue(agent_id, change)
+            except Exception as e:
+                # a failed change must not cost the results of the other changes
+                log.error(f'update of queue {change.queue_id} failed: {e}')
+                result = JoinResult(location_id=change.location_id, queue_id=change.queue_id,
+                                    joined=change.joined, success=False, message=f'{e}')
+            results.append(result)
+
+    def update(self, agent_id: str, changes: Iterable[JoinChange]) -> list[JoinResult]:
+        """
+        Update the join state of an agent in a number of queues
+
+        :param agent_id: id of the agent
+        :param changes: requested join states. If there are multiple changes for the same queue, the last one wins
+        :return: one result per queue in the order of the first change for each queue
+        """
+        # group changes by queue
+        by_queue: dict[str, JoinChange] = {}
+        for change in changes:
+            by_queue[change.queue_id] = change
+        order = {queue_id: i for i, queue_id in enumerate(by_queue)}
+        lanes = min(self.parallelism, len(by_queue))
+        changes_iter = iter(by_queue.values())
+        changes_lock = threading.Lock()
+        lane_results = self.executor.map((lambda: self._lane(agent_id, changes_iter, changes_lock)
+                                          for _ in range(lanes)),
+                                         user_id=agent_id)
+        return sorted((result for results in lane_results for result in results),
+                      key=lambda r: order[r.queue_id])
+
+    def metrics(self) -> dict[str, int]:
+        """
+        Update metrics:
+            * updates: number of queue updates sent
+            * skipped: number of changes without update because the agent already was in the requested state
+            * retries: number of updates repeated because a concurrent update had overwritten the change
+        """
+        return {'updates': self.updates,
+                'skipped': self.skipped,
+                'retries': self.retries}
@@ -0,0 +1,274 @@
+"""
+Rate limiting of Webex API requests
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from functools import wraps
+from typing import TYPE_CHECKING, Any, Optional, Union
+
+from wxc_sdk import WebexSimpleApi
+from wxc_sdk.rest import RestError
+
+if TYPE_CHECKING:
+    # the async API (and aiohttp) is only imported if the async backend is used
+    from wxc_sdk.as_api import AsWebexSimpleApi
+
+__all__ = ['Priority', 'background_priority', 'current_priority', 'retry_delay', 'RateLimiter']
+
+log = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    #: requests on behalf of a user waiting for a response
+    interactive = 0
+    #: background refreshes
+    background = 1
+
+
+_priority: ContextVar[Priority] = ContextVar('webex_request_priority', default=Priority.interactive)
+
+
+@contextmanager
+def background_priority() -> Iterator[None]:
+    """
+    Context manager: Webex API requests sent in this context have background priority. The priority is inherited by
+    tasks submitted to the fan-out executor
+    """
+    token = _priority.set(Priority.background)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> Priority:
+    """
+    Priority of Webex API requests sent in the current context
+    """
+    return _priority.get()
+
+
+def retry_delay(failures: int, interval: float, initial: float = 10) -> float:
+    """
+    Time to wait before the next cycle of a background refresh: the regular interval after a successful cycle,
+    exponential backoff starting at `initial` seconds after failed cycles
+
+    :param failures: number of consecutive failed cycles
+    :param interval: time between regular refresh cycles in seconds
+    :param initial: wait after the first failure in seconds
+    """
+    if not failures:
+        return interval
+    return min(interval, initial * 2 ** (failures - 1))
+
+
+class RateLimiter:
+    """
+    Rate limiter for all Webex API requests sent with one access token.
+
+        * token bucket: on average requests are sent at no more than `rate` requests per second with bursts of up to
+          `burst` requests
+        * interactive requests have priority over background requests: background requests can't use the last
+          `reserve` tokens of the bucket and wait while interactive requests are waiting
+        * a 429 response pauses all requests for the time given in the Retry-After header; then the request is retried.
+          After `max_retries` retries the request is dropped and the 429 error is raised to the caller
+        * requests wait for a token before the request is handed to the SDK; waiting requests don't count against the
+          concurrency limit of the SDK
+
+    :meth:`install` wraps the REST session of a :class:`WebexSimpleApi` or :class:`AsWebexSimpleApi` instance. The same
+    limiter can be installed on multiple API instances using the same access token.
+    """
+
+    def __init__(self, rate: float = 10, burst: int = 20, reserve: int = None, max_retries: int = 3,
+                 max_retry_after: float = 60):
+        """
+        :param rate: sustained number of requests per second. 0: no limit; 429 responses are still handled
+        :param burst: capacity of the token bucket
+        :param reserve: number of tokens reserved for interactive requests; default: a quarter of the burst
+        :param max_retries: maximum number of retries after 429 responses
+        :param max_retry_after: upper limit for waits requested by Retry-After headers in seconds
+        """
+        self.rate = rate
+        self.burst = burst
+        self.reserve = burst // 4 if reserve is None else reserve
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        # no requests before this time; set by 429 responses
+        self._paused_until = 0.0
+        self._waiting_interactive = 0
+
+        # metrics
+        self.requests = 0
+        self.delayed = 0
+        self.wait_total = 0.0
+        self.throttled = 0
+        self.retried = 0
+        self.dropped = 0
+
+    def _try_acquire(self, priority: Priority) -> float:
+        """
+        Try to take a token from the bucket
+
+        :return: 0 if a token was taken; else time to wait before trying again
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            if not self.rate:
+                return 0
+            self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            if priority == Priority.interactive:
+                floor = 0
+            elif self._waiting_interactive:
+                # let waiting interactive requests go first
+                return 1 / self.rate
+            else:
+                floor = self.reserve
+            if self._tokens >= floor + 1:
+                self._tokens -= 1
+                return 0
+            return (floor + 1 - self._tokens) / self.rate
+
+    @contextmanager
+    def _waiting(self, priority: Priority) -> Iterator[None]:
+        interactive = priority == Priority.interactive
+        with self._lock:
+            self.requests += 1
+            self._waiting_interactive += interactive
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._waiting_interactive -= interactive
+
+    def acquire(self):
+        """
+        Wait until a request can be sent
+        """
+        priority = _priority.get()
+        with self._waiting(priority):
+            start = None
+            while wait := self._try_acquire(priority):
+                start = start or time.perf_counter()
+                time.sleep(wait)
+            if start is not None:
+                self._delayed(time.perf_counter() - start)
+
+    async def as_acquire(self):
+        """
+        Async variant of :meth:`acquire`
+        """
+        priority = _priority.get()
+        with self._waiting(priority):
+            start = None
+            while wait := self._try_acquire(priority):
+                start = start or time.perf_counter()
+                await asyncio.sleep(wait)
+            if start is not None:
+                self._delayed(time.perf_counter() - start)
+
+    def _delayed(self, wait: float):
+        with self._lock:
+            self.delayed += 1
+            self.wait_total += wait
+
+    def _throttled(self, retry_after: Optional[str], attempt: int, url: Any) -> bool:
+        """
+        Handle a 429 response: pause all requests
+
+        :return: True if the request should be retried
+        """
+        try:
+            pause = min(float(retry_after), self.max_retry_after)
+        except (TypeError, ValueError):
+            pause = 5
+        with self._lock:
+            self.throttled += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            # start with an empty bucket after the pause
+            self._tokens = 0
+            self._last_refill = self._paused_until
+            if attempt >= self.max_retries:
+                self.dropped += 1
+                retry = False
+            else:
+                self.retried += 1
+                retry = True
+        log.warning(f'429 on {url}: pausing requests for {pause} s, '
+                    f'{"retrying" if retry else "giving up"} after {attempt + 1} attempt(s)')
+        return retry
+
+    def install(self, api: Union[WebexSimpleApi, 'AsWebexSimpleApi']):
+        """
+        Install the rate limiter on the REST session of an API instance. The SDK's own retry on 429 is disabled
+
+        :param api: API instance
+        """
+        session = api.session
+        session.retry_429 = False
+        request = session._request_w_response
+
+        if not isinstance(api, WebexSimpleApi):
+            from wxc_sdk.as_rest import AsRestError
+
+            @wraps(request)
+            async def as_request_w_response(method: str, url: str, *args, **kwargs):
+                attempt = 0
+                while True:
+                    await self.as_acquire()
+                    try:
+                        return await request(method, url, *args, **kwargs)
+                    except AsRestError as e:
+                        if e.status != 429 or not self._throttled(e.headers and e.headers.get('Retry-After'),
+                                                                  attempt, url):
+                            raise
+                    attempt += 1
+
+            session._request_w_response = as_request_w_response
+            return
+
+        @wraps(request)
+        def request_w_response(method: str, url: str, *args, **kwargs):
+            attempt = 0
+            while True:
+                self.acquire()
+                try:
+                    return request(method, url, *args, **kwargs)
+                except RestError as e:
+                    if e.response.status_code != 429 or not self._throttled(e.response.headers.get('Retry-After'),
+                                                                            attempt, url):
+                        raise
+                attempt += 1
+
+        session._request_w_response = request_w_response
+
+    def metrics(self) -> dict[str, Any]:
+        """
+        Rate limiter metrics:
+            * requests: number of requests
+            * delayed: number of requests which had to wait for the rate limit
+            * wait_avg_ms: average wait time of delayed requests
+            * throttled: number of 429 responses
+            * retried: number of requests retried after a 429 response
+            * dropped: number of requests given up after too many 429 responses
+            * paused: remaining time in seconds until requests are sent again after a 429 response
+        """
+        with self._lock:
+            return {'requests': self.requests,
+                    'delayed': self.delayed,
+                    'wait_avg_ms': self.delayed and self.wait_total / self.delayed * 1000,
+                    'throttled': self.throttled,
+                    'retried': self.retried,
+                    'dropped': self.dropped,
+                    'paused': max(0.0, self._paused_until - time.monotonic())}
@@ -0,0 +1,145 @@
+"""
+Logging configuration and sampled logging of request and response bodies
+"""
+import atexit
+import logging
+import os
+import random
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from typing import Optional
+
+from flask import Flask, Response, request
+
+__all__ = ['ProcessQueueHandler', 'configure_logging', 'init_request_logging']
+
+log = logging.getLogger(__name__)
+
+
+class ProcessQueueHandler(QueueHandler):
+    """
+    Queue handler: log records are put on a queue and handled by a listener thread. Request threads never block on log
+    I/O.
+
+    Threads don't survive a fork: the listener is started in each process when the first record is logged in that
+    process; for example in each pre-forked gunicorn worker. Records are formatted in the listener thread; arguments
+    passed to the logger must not be modified after logging.
+    """
+
+    def __init__(self, *handlers: logging.Handler):
+        super().__init__(SimpleQueue())
+        self._handlers = handlers
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._listener: Optional[QueueListener] = None
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # queue and listener of the parent process are useless after a fork
+            self.queue = SimpleQueue()
+            self._listener = QueueListener(self.queue, *self._handlers, respect_handler_level=True)
+            self._listener.start()
+            self._pid = os.getpid()
+            atexit.register(self.stop)
+
+    def stop(self):
+        """
+        Stop the listener after all queued records have been handled
+        """
+        with self._lock:
+            if self._listener is not None and self._pid == os.getpid():
+                self._listener.stop()
+            self._listener = None
+            self._pid = None
+
+    def close(self):
+        # called by logging.shutdown()
+        self.stop()
+        super().close()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # don't format in the calling thread; the listener formats the record
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if self._pid != os.getpid():
+            self._start()
+        super().enqueue(record)
+
+
+def configure_logging(production: bool = False):
+    """
+    Configure logging for the app: all records go through a :class:`ProcessQueueHandler` to stderr.
+
+    Levels can be set with environment variables; defaults differ for production and development:
+        * LOG_LEVEL: level of the root logger, default INFO in production and DEBUG in development
+        * LIBRARY_LOG_LEVEL: level of urllib3 and the wxc_sdk REST logger, default WARNING in production and INFO in
+          development
+        * REQUEST_LOG_LEVEL: level of the request body logger; bodies are logged with level DEBUG. Default WARNING in
+          production (no request bodies) and DEBUG in development
+
+    :param production: production mode
+    """
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(threadName)s %(name)s: %(message)s'))
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.addHandler(ProcessQueueHandler(stream_handler))
+    root.setLevel((os.getenv('LOG_LEVEL') or ('INFO' if production else 'DEBUG')).upper())
+    library_level = (os.getenv('LIBRARY_LOG_LEVEL') or ('WARNING' if production else 'INFO')).upper()
+    logging.getLogger('urllib3').setLevel(library_level)
+    logging.getLogger('wxc_sdk.rest').setLevel(library_level)
+    log.setLevel((os.getenv('REQUEST_LOG_LEVEL') or ('WARNING' if production else 'DEBUG')).upper())
+
+
+class _Body:
+    """
+    Body of a request or response; decoded and truncated only when the log record is formatted
+    """
+
+    def __init__(self, data: bytes, max_size: int):
+        self.data = data
+        self.max_size = max_size
+
+    def __str__(self) -> str:
+        text = self.data[:self.max_size].decode('utf-8', errors='replace')
+        if len(self.data) > self.max_size:
+            text = f'{text}... ({len(self.data)} bytes)'
+        return text
+
+
+def init_request_logging(app: Flask, production: bool = False):
+    """
+    Log request and response bodies of a sample of the requests with level DEBUG.
+
+    Nothing is read or formatted unless the request logger is enabled for DEBUG; see :func:`configure_logging`. These
+    environment variables control what is logged:
+        * REQUEST_LOG_SAMPLE_RATE: fraction of requests for which bodies are logged, default 0.01 in production and 1
+          in development
+        * REQUEST_LOG_MAX_BODY: bodies are truncated to this many bytes, default 1000
+
+    :param app: Flask app
+    :param production: production mode
+    """
+    sample_rate = float(os.getenv('REQUEST_LOG_SAMPLE_RATE') or (0.01 if production else 1))
+    max_body = int(os.getenv('REQUEST_LOG_MAX_BODY') or 1000)
+
+    @app.before_request
+    def log_request():
+        if not log.isEnabledFor(logging.DEBUG) or random.random() >= sample_rate:
+            return
+        request.environ['portal.log_body'] = True
+        if request.content_length:
+            log.debug('%s %s: %s', request.method, request.path, _Body(request.get_data(cache=True), max_body))
+
+    @app.after_request
+    def log_response(response: Response) -> Response:
+        if not request.environ.get('portal.log_body') or response.is_streamed or response.direct_passthrough:
+            return response
+        log.debug('%s %s %s: %s', request.method, request.path, response.status_code,
+                  _Body(response.get_data(), max_body))
+        return response
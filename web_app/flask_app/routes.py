@@ -1,11 +1,12 @@
 import logging
-from urllib.parse import urlparse
 
 from authlib.integrations.flask_client import OAuth
-from flask import Blueprint, session, render_template, url_for, redirect, current_app, request
-from requests import Session
-from wxc_sdk.people import Person
+from authlib.integrations.flask_client.apps import FlaskOAuth2App
+from authlib.integrations.requests_client import OAuth2Session
+from flask import Blueprint, session, render_template, url_for, redirect, current_app, request, abort
 from .app_with_tokens import AppWithTokens
+from .sessions import SessionUser
+from .transport import default_transport
 
 __all__ = ['oauth', 'core']
 
@@ -40,6 +41,22 @@ oauth = OAuth()
 #                                               'code_challenge_method': 'S256',
 #                                               })
 
+
+class PooledOAuth2Session(OAuth2Session):
+    """
+    OAuth 2 session using the shared transport. authlib creates (and closes) a session for each token request; the
+    connections stay in the pool of the transport
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        default_transport().mount(self)
+
+
+class PooledOAuth2App(FlaskOAuth2App):
+    client_cls = PooledOAuth2Session
+
+
 # register Webex OIDC provider used for login via Webex
 # documentation: https://developer.webex.com/docs/login-with-webex
 # endpoint URLs are here: https://developer.webex.com/docs/login-with-webex#oauth-20-and-openid-connect-api-endpoints
@@ -53,41 +70,77 @@ webex = oauth.register('webex',
                        jwks_uri='https://webexapis.com/v1/verification',
                        client_kwargs={'scope': 'openid email profile phone address',
                                       'code_challenge_method': 'S256',
-                                      })
-
-core = Blueprint('core', __name__,
-                 template_folder='templates',
-                 static_folder='static')
+                                      },
+                       client_cls=PooledOAuth2App)
 
+# HTTP session for userinfo requests: connections of the shared transport are reused across logins
+userinfo_session = default_transport().session()
 
-@core.before_request
-def log_request():
-    if request.is_json:
-        log.debug(f'{request.method} {urlparse(request.url).path}: {request.get_json()}')
-
-
-@core.after_request
-def log_response(response):
-    if response.is_json:
-        log.debug(f'{request.method} {urlparse(request.url).path} {response.status}: {response.get_json()}')
-    return response
+# static assets are served by the app; see assets.init_assets()
+core = Blueprint('core', __name__,
+                 template_folder='templates')
 
 
 @core.route('/')
 def index():
-    if not (user := session.get('user')):
+    if not (user := SessionUser.from_session()):
         url = url_for('core.login')
         log.debug(f'"/": redirecting to {url}')
         response = redirect(url_for('core.login'))
         return response
 
-    user: Person
     log.debug(f'"/": rendering index.html')
     return render_template('index.html',
                            title=TITLE,
                            user=user)
 
 
+@core.route('/admin')
+def admin():
+    """
+    Org-wide table of call queue memberships; only for portal admins
+    """
+    if not (user := SessionUser.from_session()):
+        return redirect(url_for('core.login'))
+    ca: AppWithTokens = current_app
+    if not ca.is_admin(user):
+        log.warning(f'"/admin": access denied for {user.display_name}')
+        abort(403)
+    return render_template('admin.html',
+                           title=TITLE,
+                           user=user)
+
+
+@core.app_context_processor
+def admin_context():
+    """
+    Templates show the admin pages in the sidebar only for admins
+    """
+    ca: AppWithTokens = current_app
+    return {'is_admin': ca.is_admin(SessionUser.from_session())}
+
+
+@core.route('/healthz')
+def healthz():
+    """
+    Liveness probe: the worker is up and can serve requests
+    """
+    return {'status': 'ok'}
+
+
+@core.route('/readyz')
+def readyz():
+    """
+    Readiness probe: background threads are running, the service app has a valid access token and the warm-up (if
+    enabled) is done
+    """
+    ca: AppWithTokens = current_app
+    body = {'status': 'ready' if ca.ready else 'not ready'}
+    if ca.warmup is not None:
+        body['warmup'] = ca.warmup.status()
+    return body, 200 if ca.ready else 503
+
+
 @core.route('/login')
 def login():
     # clear user context
@@ -128,27 +181,34 @@ def authorize():
                                          )
     # use access token to get actual user info
     log.debug(f'"/authorize": got id tokens, getting user info')
-    with Session() as r_session:
-        with r_session.get('https://webexapis.com/v1/userinfo',
-                           headers={'Authorization': f'Bearer {token["access_token"]}'}) as r:
-            r.raise_for_status()
-            profile = r.json()
+    with userinfo_session.get('https://webexapis.com/v1/userinfo',
+                              headers={'Authorization': f'Bearer {token["access_token"]}'}) as r:
+        r.raise_for_status()
+        profile = r.json()
     log.debug(f'"/authorize": got user info: {profile}')
 
     # check whether the user exists
     ca: AppWithTokens = current_app
     email = profile['email']
     log.debug(f'"/authorize": verify that user "{email}" exists as calling user')
-    user = next((user
-                 for user in ca.api.people.list(email=email, calling_data=True)
-                 if user.emails[0] == email and user.location_id is not None),
-                None)
+    user = ca.user_directory.lookup(email)
     if user is None:
-        return render_template('login.html',
-                               error=f'user "{email}" not part of target org or not a calling user')
-
-    # save user info to session ...
-    session['user'] = user
+        # not (yet) in the directory: fall back to the live API
+        if not ca.token_manager.wait(timeout=10):
+            return render_template('login.html', error='Service not available, try again later')
+        log.debug(f'"/authorize": user "{email}" not in user directory, getting user from API')
+        person = next((user
+                       for user in ca.api.people.list(email=email, calling_data=True)
+                       if user.emails[0].lower() == email.lower() and user.location_id is not None),
+                      None)
+        if person is None:
+            return render_template('login.html',
+                                   error=f'user "{email}" not part of target org or not a calling user')
+        user = SessionUser.from_person(person)
+        ca.user_directory.add(user)
+
+    # save compact user info to session ...
+    user.save()
 
     # ... and redirect to main page
     url = url_for('core.index')
@@ -156,8 +216,8 @@ def authorize():
     return redirect(url)
 
 
-# This is required to avoid net::ERR_INVALID_HTTP_RESPONSE (304) when client
-# requests the static/js resources from the flask app
+# pages are user specific and must not be cached. API responses are revalidated with ETags (see
+# api.conditional_get) and static assets set their own Cache-Control header
 @core.after_request
 def add_header(response):
     response.headers['Cache-Control'] = 'no-cache, no-store'
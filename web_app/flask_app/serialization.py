@@ -0,0 +1,79 @@
+"""
+Response shaping and fast JSON serialization of API responses
+"""
+import json
+from collections.abc import Iterable
+from enum import Enum
+from typing import Any, Optional
+
+from flask import Response, current_app, make_response
+
+try:
+    import orjson
+except ImportError:
+    # orjson is a dependency; fall back to the standard library if it is not available on a platform
+    orjson = None
+
+__all__ = ['Shape', 'dumps', 'output_json']
+
+
+class Shape:
+    """
+    Declares the fields of an SDK object used by the frontend; only these fields are serialized. Much cheaper than
+    model_dump(), which dumps and validates all fields of a model.
+
+        NUMBER = Shape('phone_number', 'extension', location=Shape('name'))
+        NUMBER.dump(number)  # {'phone_number': '+14085550001', 'extension': '2001', 'location': {'name': 'HQ'}}
+
+    Fields are read as attributes and enums are replaced by their values. Nested shapes are applied to the attribute
+    with the same name.
+    """
+
+    def __init__(self, *fields: str, **nested: 'Shape'):
+        """
+        :param fields: names of attributes to serialize
+        :param nested: attribute name -> shape of the attribute's value
+        """
+        self.fields = fields
+        self.nested = nested
+
+    def dump(self, obj: Any) -> Optional[dict[str, Any]]:
+        """
+        Dictionary with the declared fields of an object; None if the object is None
+        """
+        if obj is None:
+            return None
+        result = {}
+        for name in self.fields:
+            value = getattr(obj, name)
+            result[name] = value.value if isinstance(value, Enum) else value
+        for name, shape in self.nested.items():
+            result[name] = shape.dump(getattr(obj, name))
+        return result
+
+    def dump_list(self, objs: Iterable[Any]) -> list[Optional[dict[str, Any]]]:
+        return [self.dump(obj) for obj in objs]
+
+
+def dumps(data: Any, indent: bool = False) -> bytes:
+    """
+    Serialize to JSON with orjson; with the standard library if orjson is not available
+
+    :param data: data to serialize
+    :param indent: indent nested structures; for debugging
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(data, option=option)
+    if indent:
+        return json.dumps(data, indent=2).encode('utf-8')
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+def output_json(data: Any, code: int, headers: dict = None) -> Response:
+    """
+    JSON representation for flask_restx: the response body is serialized directly to bytes; indented in debug mode
+    """
+    response = make_response(dumps(data, indent=current_app.debug), code)
+    response.headers.extend(headers or {})
+    return response
@@ -0,0 +1,151 @@
+"""
+Server side session store and the compact user projection kept in the session
+"""
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+from cachelib.file import FileSystemCache
+from flask import Flask, session
+from flask_session import Session
+from wxc_sdk.people import Person
+
+__all__ = ['SessionUser', 'SweepingFileSystemCache', 'init_session']
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class SessionUser:
+    """
+    Compact projection of a :class:`wxc_sdk.people.Person` kept in the session.
+
+    Only the attributes needed by the portal are stored. In the session the user is stored as a plain dict so that
+    the session can be serialized by any session backend.
+    """
+    person_id: str
+    location_id: str
+    display_name: str
+    emails: list[str]
+
+    @classmethod
+    def from_person(cls, person: Person) -> 'SessionUser':
+        return cls(person_id=person.person_id,
+                   location_id=person.location_id,
+                   display_name=person.display_name,
+                   emails=list(person.emails or []))
+
+    @classmethod
+    def from_session(cls) -> Optional['SessionUser']:
+        """
+        User of the current session
+
+        :return: user; None if no user is logged in
+        """
+        data = session.get('user')
+        if not data:
+            return None
+        if isinstance(data, Person):
+            # session created before sessions stored the compact projection
+            return cls.from_person(data)
+        return cls(**data)
+
+    def save(self):
+        """
+        Store the user in the current session
+        """
+        session['user'] = asdict(self)
+
+
+class SweepingFileSystemCache(FileSystemCache):
+    """
+    File system session store which periodically removes expired sessions.
+
+    :class:`cachelib.file.FileSystemCache` only removes expired entries once the number of entries exceeds the
+    threshold. :meth:`sweep` removes all expired entries and only reads the expiry header of each file. A background
+    thread calls :meth:`sweep` every `sweep_interval` seconds.
+    """
+
+    def __init__(self, cache_dir: str, threshold: int = 500, sweep_interval: float = 300):
+        """
+        :param cache_dir: directory for the session files
+        :param threshold: maximum number of sessions before the oldest sessions get removed. 0: no limit
+        :param sweep_interval: time between sweeps in seconds. 0: no background sweeps
+        """
+        super().__init__(cache_dir=cache_dir, threshold=threshold)
+        self.sweep_interval = sweep_interval
+        self._thread: Optional[threading.Thread] = None
+
+    def sweep(self):
+        """
+        Remove expired sessions
+        """
+        start = time.perf_counter()
+        self._remove_expired(time.time())
+        log.debug(f'session sweep done in {time.perf_counter() - start:.3f} s')
+
+    def start(self):
+        """
+        Start background sweeps
+        """
+        if self.sweep_interval and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='session-sweep', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            # noinspection PyBroadException
+            try:
+                self.sweep()
+            except Exception as e:
+                log.error(f'session sweep failed: {e}')
+
+
+def init_session(app: Flask, redis_client=None) -> Optional[SweepingFileSystemCache]:
+    """
+    Configure the server side session store and add server side sessions to the app.
+
+    The store is selected by environment variables:
+        * SESSION_BACKEND: "filesystem" (default) or "redis". Redis requires the optional "redis" dependency
+        * SESSION_REDIS_URL: URL of the Redis (or any Redis protocol compatible) server, default
+          redis://localhost:6379/0. Sessions in Redis expire using the native key TTL and can be shared by multiple
+          workers and hosts
+        * SESSION_FILE_THRESHOLD: maximum number of session files, default 500
+        * SESSION_SWEEP_INTERVAL: seconds between sweeps of expired session files, default 300
+
+    :param app: Flask app
+    :param redis_client: Redis client to use instead of a client created from SESSION_REDIS_URL; for example a
+        fakeredis.FakeRedis instance
+    :return: file system session store; None for Redis. Background sweeps have to be started by calling
+        :meth:`SweepingFileSystemCache.start`
+    """
+    backend = (os.getenv('SESSION_BACKEND') or 'filesystem').lower()
+    cache = None
+    app.config['SESSION_KEY_PREFIX'] = 'portal:session:'
+    if backend == 'redis':
+        if redis_client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise ImportError('SESSION_BACKEND=redis requires the "redis" package; install the "redis" '
+                                  'extra') from e
+            redis_client = redis.Redis.from_url(os.getenv('SESSION_REDIS_URL') or 'redis://localhost:6379/0')
+        app.config['SESSION_TYPE'] = 'redis'
+        app.config['SESSION_REDIS'] = redis_client
+    elif backend == 'filesystem':
+        file_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'sessions'))
+        # several workers might try to create the directory at the same time
+        os.makedirs(file_dir, exist_ok=True)
+        cache = SweepingFileSystemCache(cache_dir=file_dir,
+                                        threshold=int(os.getenv('SESSION_FILE_THRESHOLD') or 500),
+                                        sweep_interval=float(os.getenv('SESSION_SWEEP_INTERVAL') or 300))
+        app.config['SESSION_TYPE'] = 'cachelib'
+        app.config['SESSION_CACHELIB'] = cache
+    else:
+        raise ValueError(f'unsupported SESSION_BACKEND: {backend}')
+    Session(app)
+    return cache
@@ -0,0 +1,200 @@
+"""
+Coalescing of identical concurrent Webex API reads
+"""
+import asyncio
+import threading
+from collections import Counter
+from collections.abc import Awaitable, Callable, Hashable
+from copy import deepcopy
+from functools import wraps
+from typing import TYPE_CHECKING, Any, Optional, Union
+
+from wxc_sdk import WebexSimpleApi
+
+from .rate_limit import current_priority
+from .tracing import upstream_endpoint
+
+if TYPE_CHECKING:
+    # the async API (and aiohttp) is only imported if the async backend is used
+    from wxc_sdk.as_api import AsWebexSimpleApi
+
+__all__ = ['SingleFlight']
+
+
+class _Flight:
+    """
+    One request in flight and the callers waiting for its result
+    """
+
+    def __init__(self, future: asyncio.Future = None):
+        self.waiters = 0
+        #: requests sent from threads: set when the result is available
+        self.done = threading.Event()
+        #: requests sent from the event loop of the async backend
+        self.future = future
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Single-flight layer for Webex API reads: while a GET request is in flight, identical GET requests (same URL and
+    parameters) don't go upstream but wait for the result of the request in flight.
+
+        * only GET requests with nothing but URL parameters are coalesced
+        * requests with background priority and interactive requests are never merged: an interactive request doesn't
+          wait for a background request delayed by the rate limiter
+        * each caller gets its own copy of the response body; callers can't see each other's modifications
+        * errors are raised to all callers
+
+    :meth:`install` wraps the REST session of a :class:`WebexSimpleApi` or :class:`AsWebexSimpleApi` instance. Install
+    after the rate limiter and the tracer: merged requests don't take tokens of the rate limiter and aren't traced as
+    upstream calls.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # key -> flight; requests sent from threads and from the event loop of the async backend are never merged
+        self._flights: dict[Hashable, _Flight] = {}
+        self._as_flights: dict[Hashable, _Flight] = {}
+
+        # metrics
+        self.reads = 0
+        self.upstream = 0
+        self.merged = 0
+        self._merged_by_endpoint: Counter[str] = Counter()
+
+    @staticmethod
+    def _key(method: str, url: str, args: tuple, kwargs: dict[str, Any]) -> Optional[Hashable]:
+        """
+        Key of a request; None if the request can't be coalesced
+        """
+        if method != 'GET' or args or any(value is not None for name, value in kwargs.items() if name != 'params'):
+            return None
+        params = kwargs.get('params') or {}
+        return (current_priority(), str(url),
+                tuple(sorted((name, repr(value)) for name, value in params.items() if value is not None)))
+
+    def _join(self, flights: dict[Hashable, _Flight], key: Hashable, url: str,
+              new_flight: Callable[[], _Flight]) -> tuple[_Flight, bool]:
+        """
+        Get the flight for a key; the caller leads a new flight if there is none
+
+        :return: flight and True if the caller is the leader
+        """
+        with self._lock:
+            self.reads += 1
+            if (flight := flights.get(key)) is not None:
+                flight.waiters += 1
+                self.merged += 1
+                self._merged_by_endpoint[upstream_endpoint(url)] += 1
+                return flight, False
+            flight = new_flight()
+            flights[key] = flight
+            self.upstream += 1
+            return flight, True
+
+    def _land(self, flights: dict[Hashable, _Flight], key: Hashable):
+        with self._lock:
+            del flights[key]
+
+    @staticmethod
+    def _copy(result: tuple[Any, Any]) -> tuple[Any, Any]:
+        response, data = result
+        return response, deepcopy(data)
+
+    def do(self, key: Hashable, url: str, func: Callable[[], tuple[Any, Any]]) -> tuple[Any, Any]:
+        """
+        Call func or wait for the result of the call in flight for the same key
+
+        :param key: key of the request
+        :param url: URL of the request; used for metrics
+        :param func: sends the request; returns response and body
+        :return: response and body
+        """
+        flight, leader = self._join(self._flights, key, url, _Flight)
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return self._copy(flight.result)
+        try:
+            flight.result = func()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            self._land(self._flights, key)
+            flight.done.set()
+        # no more waiters after landing. If there were any, they copy the result: the leader gets a copy as well
+        return self._copy(flight.result) if flight.waiters else flight.result
+
+    async def as_do(self, key: Hashable, url: str, func: Callable[[], Awaitable[tuple[Any, Any]]]) -> tuple[Any, Any]:
+        """
+        Async variant of :meth:`do`; only called on the event loop of the async backend
+        """
+        loop = asyncio.get_running_loop()
+        flight, leader = self._join(self._as_flights, key, url, lambda: _Flight(future=loop.create_future()))
+        if not leader:
+            # a cancelled waiter must not cancel the request in flight
+            return self._copy(await asyncio.shield(flight.future))
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            flight.future.cancel()
+            raise
+        except BaseException as e:
+            flight.future.set_exception(e)
+            # the exception is raised here: don't complain about an exception nobody retrieved if there are no waiters
+            flight.future.exception()
+            raise
+        else:
+            flight.future.set_result(result)
+        finally:
+            self._land(self._as_flights, key)
+        return self._copy(result) if flight.waiters else result
+
+    def install(self, api: Union[WebexSimpleApi, 'AsWebexSimpleApi']):
+        """
+        Install the single-flight layer on the REST session of an API instance
+
+        :param api: API instance
+        """
+        session = api.session
+        request = session._request_w_response
+
+        if not isinstance(api, WebexSimpleApi):
+            @wraps(request)
+            async def as_request_w_response(method: str, url: str, *args, **kwargs):
+                if (key := self._key(method, url, args, kwargs)) is None:
+                    return await request(method, url, *args, **kwargs)
+                return await self.as_do(key, url, lambda: request(method, url, *args, **kwargs))
+
+            session._request_w_response = as_request_w_response
+            return
+
+        @wraps(request)
+        def request_w_response(method: str, url: str, *args, **kwargs):
+            if (key := self._key(method, url, args, kwargs)) is None:
+                return request(method, url, *args, **kwargs)
+            return self.do(key, url, lambda: request(method, url, *args, **kwargs))
+
+        session._request_w_response = request_w_response
+
+    def metrics(self) -> dict[str, Any]:
+        """
+        Single-flight metrics:
+            * reads: number of GET requests which could be coalesced
+            * upstream: number of these requests sent to Webex
+            * merged: number of requests answered with the result of an identical request in flight
+            * merge_ratio: merged / reads
+            * in_flight: number of requests in flight
+            * merged_by_endpoint: merged requests per Webex API endpoint; top 10
+        """
+        with self._lock:
+            return {'reads': self.reads,
+                    'upstream': self.upstream,
+                    'merged': self.merged,
+                    'merge_ratio': self.merged / self.reads if self.reads else 0,
+                    'in_flight': len(self._flights) + len(self._as_flights),
+                    'merged_by_endpoint': dict(self._merged_by_endpoint.most_common(10))}
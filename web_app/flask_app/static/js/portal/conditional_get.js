@@ -0,0 +1,27 @@
+// ETag and data of the last response for each URL
+const last_responses = new Map()
+
+/**
+ * GET JSON data from an API endpoint. The request has an If-None-Match header with the ETag of the last response for
+ * the same URL; if nothing has changed the server answers with 304 Not Modified and the data of the last response is
+ * used.
+ *
+ * Returns a promise for the data like $.ajax()
+ */
+function get_json(url) {
+    const last = last_responses.get(url)
+    return $.ajax({
+        type: 'GET',
+        url: url,
+        headers: last ? {'If-None-Match': last.etag} : {}
+    }).then(function (data, text_status, xhr) {
+        if (xhr.status === 304) {
+            return last.data
+        }
+        const etag = xhr.getResponseHeader('ETag')
+        if (etag) {
+            last_responses.set(url, {etag: etag, data: data})
+        }
+        return data
+    })
+}
@@ -0,0 +1,44 @@
+function get_dashboard() {
+    return $.ajax({type: 'GET', url: '/api/dashboard'})
+}
+
+/**
+ * Get data for all cards in one request and update the UI. Used for the first page load.
+ * Sections which couldn't be read are shown with their error message.
+ *
+ * @typedef {Object} section - data for one section
+ * @property {boolean} success - Indicates if the data for the section could be read
+ * @property {Object} data - response of the endpoint for the section
+ * @property {string} message - error message if reading the data failed
+ * @property {number} time_ms - time to read the data for the section
+ * @returns {Promise<boolean>} resolves to true if the queue and phone tables have been shown
+ */
+function load_dashboard() {
+    const error = function (message) {
+        return {success: false, message: message}
+    }
+    document.getElementById("phoneCard").querySelector("#status").textContent = "...getting phone information"
+    document.getElementById("queueCard").querySelector("#status").textContent = "...getting queue information"
+
+    return get_dashboard().then(function (data) {
+        console.log("dashboard read in", data.time_ms, "ms")
+        const sections = data.sections
+        for (const [name, section] of Object.entries(sections)) {
+            console.log(name, section.success, section.time_ms, "ms")
+        }
+        const userphones = sections.userphones
+        show_user_phones(userphones.success ? userphones.data : error(userphones.message))
+        const userqueues = sections.userqueues
+        show_user_queues(userqueues.success ? userqueues.data : error(userqueues.message))
+        const useroptions = sections.useroptions
+        if (useroptions.success) {
+            show_user_options(useroptions.data)
+        }
+        if (sections.userinfo.success) {
+            prefetched_user_info = sections.userinfo.data
+        }
+        return userphones.success && userqueues.success
+    }, function () {
+        return false
+    })
+}
@@ -0,0 +1,72 @@
+// key of a row in the table of each section; same keys as used by the server in "remove" lists
+const live_update_keys = {
+    userqueues: row => row.join_info.location_and_queue_id,
+    userphones: row => row.mac,
+}
+
+const live_update_tables = {
+    userqueues: '#userQueues',
+    userphones: '#userPhones',
+}
+
+/**
+ * Apply changed and removed rows of one section to the section's table
+ *
+ * @typedef {Object} diff - changes of one section
+ * @property {Object[]} upsert - new or changed rows
+ * @property {string[]} remove - keys of removed rows
+ */
+function apply_live_update(section, diff) {
+    const table = $(live_update_tables[section]).DataTable()
+    const key = live_update_keys[section]
+    const upsert = new Map(diff.upsert.map(row => [key(row), row]))
+    const remove = new Set(diff.remove)
+
+    // update existing rows in place, then add new rows
+    table.rows().every(function () {
+        const row_key = key(this.data())
+        if (upsert.has(row_key)) {
+            this.data(upsert.get(row_key))
+            upsert.delete(row_key)
+        }
+    })
+    table.rows(function (idx, data) {
+        return remove.has(key(data))
+    }).remove()
+    table.rows.add(Array.from(upsert.values()))
+    // keep the current page
+    table.draw(false)
+}
+
+/**
+ * Subscribe to live updates of the queue and phone tables pushed by the server.
+ * The first event of each stream is a snapshot of both tables; after that only changed rows are sent. If the tables
+ * have just been loaded from the dashboard the server starts from the dashboard and doesn't send a snapshot.
+ * The browser reconnects automatically if the stream is closed; reconnects always get a snapshot.
+ *
+ * @param {boolean} seeded - the queue and phone tables show the data of the dashboard
+ */
+function start_live_updates(seeded) {
+    if (!window.EventSource) {
+        return
+    }
+    const source = new EventSource(seeded ? '/api/events?seeded=1' : '/api/events')
+    source.addEventListener('snapshot', function (event) {
+        const data = JSON.parse(event.data)
+        show_user_queues(data.userqueues)
+        show_user_phones(data.userphones)
+    })
+    source.addEventListener('diff', function (event) {
+        const data = JSON.parse(event.data)
+        for (const [section, diff] of Object.entries(data)) {
+            console.log("live update", section, diff)
+            apply_live_update(section, diff)
+        }
+    })
+    source.onerror = function () {
+        // no reconnect if the server didn't accept the stream; for example live updates are disabled
+        if (source.readyState === EventSource.CLOSED) {
+            console.log("live updates not available")
+        }
+    }
+}
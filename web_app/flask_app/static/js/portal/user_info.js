@@ -1,7 +1,10 @@
 function get_user_info() {
-    return $.ajax({type: 'GET', url: '/api/userinfo'})
+    return get_json('/api/userinfo')
 }
 
+// user info prefetched by load_dashboard(); used the first time the modal is shown
+let prefetched_user_info = null
+
 function refresh_user_info() {
     const modal = document.getElementById("userinfoModal")
         const table = modal.querySelector("#userInfoNumbers");
@@ -12,37 +15,50 @@ function refresh_user_info() {
             tbody.removeChild(tbody.firstChild);
         }
 
+    if (prefetched_user_info) {
+        show_user_info(prefetched_user_info)
+        prefetched_user_info = null
+        return
+    }
+
     // get user info from server and update modal "userinfoModal" accordingly
-    get_user_info().then(function (data) {
-        console.log(data)
+    get_user_info().then(show_user_info);
+}
+
+/**
+ * Update modal "userinfoModal" with data returned by /api/userinfo
+ */
+function show_user_info(data) {
+    const modal = document.getElementById("userinfoModal")
+    const tbody = modal.querySelector("#userInfoNumbers tbody");
+    console.log(data)
 
-        // create one row for each number
-        const numbers = data["numbers"];
-        numbers.forEach(item => {
-            const newRow = document.createElement("tr");
+    // create one row for each number
+    const numbers = data["numbers"];
+    numbers.forEach(item => {
+        const newRow = document.createElement("tr");
 
-            const cell1 = document.createElement("td");
-            cell1.textContent = item["phone_number"];
-            newRow.appendChild(cell1);
+        const cell1 = document.createElement("td");
+        cell1.textContent = item["phone_number"];
+        newRow.appendChild(cell1);
 
-            const cell2 = document.createElement("td");
-            cell2.textContent = item["extension"];
-            newRow.appendChild(cell2);
+        const cell2 = document.createElement("td");
+        cell2.textContent = item["extension"];
+        newRow.appendChild(cell2);
 
-            const cell3 = document.createElement("td");
-            cell3.textContent = item["location"]["name"];
-            newRow.appendChild(cell3);
+        const cell3 = document.createElement("td");
+        cell3.textContent = item["location"]["name"];
+        newRow.appendChild(cell3);
 
-            const cell4 = document.createElement("td");
-            cell4.textContent = item["phone_number_type"];
-            newRow.appendChild(cell4);
+        const cell4 = document.createElement("td");
+        cell4.textContent = item["phone_number_type"];
+        newRow.appendChild(cell4);
 
 
-            tbody.appendChild(newRow);
-        })
+        tbody.appendChild(newRow);
+    })
 
-        // also update the name of the calling location
-        const location_name = modal.querySelector("#location_name")
-        location_name.textContent = "Location: " + data['location_name']
-    });
+    // also update the name of the calling location
+    const location_name = modal.querySelector("#location_name")
+    location_name.textContent = "Location: " + data['location_name']
 }
\ No newline at end of file
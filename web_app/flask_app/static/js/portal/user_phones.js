@@ -1,5 +1,23 @@
 function get_user_phones() {
-    return $.ajax({type: 'GET', url: '/api/userphones'})
+    return get_json('/api/userphones')
+}
+
+/**
+ * Update table of phones with data returned by /api/userphones
+ */
+function show_user_phones(data) {
+    const card = document.getElementById("phoneCard")
+    const status = card.querySelector("#status")
+    console.log(data)
+
+    if (data["success"] == false) {
+        status.textContent = "Error: " + data["message"]
+    } else {
+        status.textContent = ""
+        $('#userPhones').DataTable().clear()
+        $('#userPhones').DataTable().rows.add(data['rows'])
+        $('#userPhones').DataTable().columns.adjust().draw()
+    }
 }
 
 function update_user_phones() {
@@ -8,17 +26,6 @@ function update_user_phones() {
     status.textContent = "...getting phone information"
 
     // get phones from server and update table
-    get_user_phones().then(function (data) {
-        console.log(data)
-
-        if (data["success"] == false) {
-            status.textContent = "Error: " + data["message"]
-        } else {
-            status.textContent = ""
-            $('#userPhones').DataTable().clear()
-            $('#userPhones').DataTable().rows.add(data['rows'])
-            $('#userPhones').DataTable().columns.adjust().draw()
-        }
-    })
+    get_user_phones().then(show_user_phones)
 }
 
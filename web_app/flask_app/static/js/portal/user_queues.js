@@ -1,5 +1,24 @@
 function get_user_queues() {
-    return $.ajax({type: 'GET', url: '/api/userqueues'})
+    return get_json('/api/userqueues')
+}
+
+/**
+ * Update table of queues with data returned by /api/userqueues
+ */
+function show_user_queues(data) {
+    const card = document.getElementById('queueCard')
+    const status = card.querySelector("#status")
+    console.log(data)
+
+    if (data["success"] == false) {
+        status.textContent = "Error: " + data["message"]
+    } else {
+        // clear the table and add new rows
+        status.textContent = ""
+        $('#userQueues').DataTable().clear()
+        $('#userQueues').DataTable().rows.add(data['rows'])
+        $('#userQueues').DataTable().columns.adjust().draw()
+    }
 }
 
 function update_user_queues() {
@@ -8,18 +27,6 @@ function update_user_queues() {
     status.textContent = "...getting queue information"
 
     // get queue information from server and update table
-    get_user_queues().then(function (data) {
-        console.log(data)
-
-        if (data["success"] == false) {
-            status.textContent = "Error: " + data["message"]
-        } else {
-            // clear the table and add new rows
-            status.textContent = ""
-            $('#userQueues').DataTable().clear()
-            $('#userQueues').DataTable().rows.add(data['rows'])
-            $('#userQueues').DataTable().columns.adjust().draw()
-        }
-    })
+    get_user_queues().then(show_user_queues)
 }
 
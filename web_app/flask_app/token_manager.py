@@ -0,0 +1,229 @@
+"""
+Service app token management shared by threads and processes
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections.abc import Callable
+from contextlib import contextmanager
+from os.path import dirname, basename, isfile
+from typing import Any, Optional
+
+from wxc_sdk.tokens import Tokens
+from yaml import safe_load, safe_dump
+
+try:
+    import fcntl
+except ImportError:
+    # no inter-process locking on Windows
+    fcntl = None
+
+__all__ = ['TokenManager']
+
+log = logging.getLogger(__name__)
+
+
+class TokenManager:
+    """
+    Maintains service app tokens cached in a YML file.
+
+        * a background thread refreshes the access token `refresh_margin` seconds before it expires
+        * refreshes are single-flight: a thread lock serializes refreshes within the process and an exclusive lock on
+          "<path>.lock" serializes refreshes across processes (for example pre-forked workers). After obtaining the
+          lock the token file is read again; if another process has refreshed the tokens in the meantime these tokens
+          are used instead of refreshing again
+        * the token file is written to a temporary file first and then atomically renamed. Readers never see a
+          partially written file
+        * new tokens are copied into the :attr:`tokens` instance. All API instances using that instance immediately
+          use the new access token
+        * :meth:`load` only reads the token file. Missing or expiring tokens are then obtained by the background
+          thread right after :meth:`start`; callers which need an access token use :meth:`wait`
+    """
+
+    def __init__(self, path: str, get_new_tokens: Callable[[], Tokens], refresh_margin: float = 24 * 60 * 60):
+        """
+        :param path: path of the YML file
+        :param get_new_tokens: callable to obtain new tokens from Webex; typically using a refresh token
+        :param refresh_margin: refresh access token when the remaining lifetime is less than this many seconds
+        """
+        self.path = path
+        self.get_new_tokens = get_new_tokens
+        self.refresh_margin = refresh_margin
+        #: tokens used by the app. Updated in place when tokens are refreshed
+        self.tokens = Tokens()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        # set as soon as we have an access token which hasn't expired
+        self._usable = threading.Event()
+
+        # metrics
+        self.refreshes = 0
+        self.failures = 0
+        self.adopted = 0
+        self.last_refresh_latency: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    @contextmanager
+    def _file_lock(self):
+        """
+        Exclusive lock across processes
+        """
+        if fcntl is None:
+            yield
+            return
+        with open(f'{self.path}.lock', mode='a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def read_tokens_from_file(self) -> Optional[Tokens]:
+        if not isfile(self.path):
+            return None
+        # noinspection PyBroadException
+        try:
+            with open(self.path, mode='r') as f:
+                data = safe_load(f)
+            tokens = Tokens.model_validate(data)
+        except Exception:
+            return None
+        return tokens
+
+    def write_tokens_to_file(self, tokens: Tokens):
+        """
+        Write tokens to a temporary file and then atomically replace the token file
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=dirname(self.path), prefix=f'.{basename(self.path)}.')
+        try:
+            with os.fdopen(fd, mode='w') as f:
+                safe_dump(tokens.model_dump(mode='json', exclude_none=True), f)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _valid(self, tokens: Optional[Tokens]) -> bool:
+        return tokens is not None and tokens.access_token and tokens.expires_at and \
+            tokens.remaining >= self.refresh_margin
+
+    def _use(self, tokens: Tokens):
+        self.tokens.update(tokens)
+        self._usable.set()
+
+    def load(self) -> bool:
+        """
+        Use the tokens from the token file if the access token hasn't expired yet; no network calls. Tokens within the
+        refresh margin are refreshed by the background thread
+
+        :return: True if there is an access token which can be used
+        """
+        tokens = self.read_tokens_from_file()
+        if tokens is not None and tokens.access_token and tokens.expires_at and tokens.remaining > 0:
+            self._use(tokens)
+        return self._usable.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Wait until there is an access token which can be used
+
+        :param timeout: maximum time to wait in seconds
+        :return: False if no access token was available within the timeout
+        """
+        return self._usable.wait(timeout=timeout)
+
+    def get_tokens(self) -> Tokens:
+        """
+        Get valid tokens: from the token file or by refreshing them
+
+        :return: :attr:`tokens`
+        """
+        if self._valid(self.tokens):
+            return self.tokens
+        tokens = self.read_tokens_from_file()
+        if self._valid(tokens):
+            self._use(tokens)
+            return self.tokens
+        return self.refresh()
+
+    def refresh(self, force: bool = False) -> Tokens:
+        """
+        Single-flight refresh of the tokens
+
+        :param force: refresh even if the tokens in the token file are still valid
+        :return: :attr:`tokens`
+        """
+        with self._lock, self._file_lock():
+            # another thread or process might have refreshed the tokens while we were waiting for the lock
+            tokens = self.read_tokens_from_file()
+            if not force and self._valid(tokens):
+                if tokens.access_token != self.tokens.access_token:
+                    log.info(f'using tokens refreshed by another process, remaining lifetime {tokens.remaining} s')
+                    self.adopted += 1
+                self._use(tokens)
+                return self.tokens
+            start = time.perf_counter()
+            try:
+                tokens = self.get_new_tokens()
+                self.write_tokens_to_file(tokens)
+            except Exception as e:
+                self.failures += 1
+                self.last_error = f'{e}'
+                log.error(f'token refresh failed: {e}')
+                raise
+            self.last_refresh_latency = time.perf_counter() - start
+            self.last_error = None
+            self.refreshes += 1
+            log.info(f'refreshed access token in {self.last_refresh_latency:.3f} s, '
+                     f'remaining lifetime {tokens.remaining} s')
+            self._use(tokens)
+            return self.tokens
+
+    def start(self):
+        """
+        Start background refresh
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='token-manager', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        # tokens from load() might be missing or expiring: get valid tokens right away
+        first = True
+        while True:
+            # wake up when the remaining lifetime drops below the refresh margin; but don't spin if the lifetime of new
+            # tokens is shorter than the refresh margin
+            remaining = self.tokens.remaining if self.tokens.expires_at else 0
+            wait = 0 if first and not self._valid(self.tokens) else max(remaining - self.refresh_margin, 60)
+            first = False
+            if self._stop.wait(timeout=wait):
+                return
+            try:
+                self.refresh()
+            except Exception:
+                # retry in a minute; the old token is still valid for a while
+                if self._stop.wait(timeout=60):
+                    return
+
+    def metrics(self) -> dict[str, Any]:
+        """
+        Token metrics:
+            * remaining: remaining lifetime of the access token in seconds
+            * refreshes: number of successful refreshes by this process
+            * adopted: number of times tokens refreshed by another process have been picked up
+            * failures: number of failed refreshes
+            * last_refresh_latency: duration of the last successful refresh in seconds
+            * last_error: error of the last failed refresh, if any
+        """
+        return {'remaining': self.tokens.expires_at and self.tokens.remaining,
+                'refreshes': self.refreshes,
+                'adopted': self.adopted,
+                'failures': self.failures,
+                'last_refresh_latency': self.last_refresh_latency,
+                'last_error': self.last_error}
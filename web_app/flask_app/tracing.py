@@ -0,0 +1,298 @@
+"""
+Tracing of Webex API calls: timing breakdown per portal request and latency histograms
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import wraps
+from typing import TYPE_CHECKING, Optional, Union
+from urllib.parse import urlparse
+
+from flask import Flask, Response, request
+from wxc_sdk import WebexSimpleApi
+from wxc_sdk.rest import RestError
+
+if TYPE_CHECKING:
+    # the async API (and aiohttp) is only imported if the async backend is used
+    from wxc_sdk.as_api import AsWebexSimpleApi
+
+__all__ = ['UpstreamCall', 'RequestTrace', 'Histogram', 'Tracer', 'upstream_endpoint', 'init_tracing']
+
+log = logging.getLogger(__name__)
+
+# Webex ids are base64 encoded "ciscospark://..." URIs; some APIs also use plain UUIDs
+_ID_RE = re.compile(r'^(Y2lzY29zcGFyazovL[\w=+-]*|[0-9a-fA-F]{8}-[0-9a-fA-F-]{27})$')
+
+
+def upstream_endpoint(url: str) -> str:
+    """
+    Endpoint of a Webex API URL with ids replaced by "{id}"; for example "/people/{id}/features/intercept". Used as
+    low cardinality label for metrics and in traces
+    """
+    path = urlparse(url).path.removeprefix('/v1')
+    return '/'.join('{id}' if _ID_RE.match(segment) else segment for segment in path.split('/'))
+
+
+@dataclass
+class UpstreamCall:
+    """
+    One Webex API request
+    """
+    method: str
+    endpoint: str
+    #: HTTP status; 0 if no response was received
+    status: int
+    seconds: float
+
+
+class RequestTrace:
+    """
+    Webex API requests sent while handling one portal request. Requests are added from all threads and tasks working
+    on behalf of the portal request
+    """
+
+    def __init__(self, start: float = None, session_seconds: float = 0):
+        """
+        :param start: start of the request (time.perf_counter()); default: now
+        :param session_seconds: time it took to load the session
+        """
+        self.start = start or time.perf_counter()
+        self.session_seconds = session_seconds
+        self._lock = threading.Lock()
+        self.calls: list[UpstreamCall] = []
+
+    def add(self, call: UpstreamCall):
+        with self._lock:
+            self.calls.append(call)
+
+    def breakdown(self) -> list[dict]:
+        """
+        Webex API requests grouped by method and endpoint in order of the first request:
+            * call: method and endpoint
+            * count: number of requests
+            * ms: total duration of the requests in milliseconds. Requests can be concurrent: the total can be longer
+              than the portal request
+            * max_ms: duration of the slowest request
+            * errors: number of failed requests, not counting 429 responses
+            * retries: number of 429 responses; these requests get retried by the rate limiter
+        """
+        groups: dict[str, dict] = {}
+        with self._lock:
+            calls = list(self.calls)
+        for call in calls:
+            group = groups.setdefault(f'{call.method} {call.endpoint}',
+                                      {'call': f'{call.method} {call.endpoint}', 'count': 0, 'ms': 0.0,
+                                       'max_ms': 0.0, 'errors': 0, 'retries': 0})
+            ms = call.seconds * 1000
+            group['count'] += 1
+            group['ms'] += ms
+            group['max_ms'] = max(group['max_ms'], ms)
+            if call.status == 429:
+                group['retries'] += 1
+            elif not 200 <= call.status < 400:
+                group['errors'] += 1
+        return list(groups.values())
+
+    def server_timing(self, total: float, breakdown: list[dict]) -> str:
+        """
+        Value for a Server-Timing header: total, session and Webex API time with one entry per Webex API endpoint
+        """
+        entries = [f'total;dur={total * 1000:.1f}',
+                   f'session;dur={self.session_seconds * 1000:.1f}',
+                   f'webex;dur={sum(group["ms"] for group in breakdown):.1f};'
+                   f'desc="{sum(group["count"] for group in breakdown)} calls"']
+        for i, group in enumerate(breakdown):
+            desc = f'{group["call"]} x{group["count"]}'
+            if group['retries']:
+                desc = f'{desc}, {group["retries"]} retried'
+            entries.append(f'webex-{i};dur={group["ms"]:.1f};desc="{desc}"')
+        return ', '.join(entries)
+
+
+class Histogram:
+    """
+    Thread-safe histogram with labels; rendered in the Prometheus text format
+    """
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._lock = threading.Lock()
+        # labels -> [counts per bucket (last one is +Inf), sum]
+        self._series: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, labels: tuple[str, ...], value: float):
+        bucket = bisect_left(self.BUCKETS, value)
+        with self._lock:
+            counts, total = self._series.setdefault(labels, ([0] * (len(self.BUCKETS) + 1), [0.0]))
+            counts[bucket] += 1
+            total[0] += value
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.help_text}',
+                 f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = [(labels, list(counts), total[0]) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in sorted(series):
+            label_str = ','.join(f'{name}="{value}"' for name, value in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip((*self.BUCKETS, '+Inf'), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_str},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label_str}}} {total}')
+            lines.append(f'{self.name}_count{{{label_str}}} {cumulative}')
+        return lines
+
+
+_trace: ContextVar[Optional[RequestTrace]] = ContextVar('portal_request_trace', default=None)
+
+
+class Tracer:
+    """
+    Records all Webex API requests.
+
+        * :meth:`install` wraps the REST session of an API instance. Each HTTP request is recorded, including requests
+          answered with 429 and retried by the rate limiter
+        * requests sent on behalf of a portal request are added to the trace of that request. The trace is kept in a
+          context variable; the fan-out executor and the async backend pass it on to their threads and tasks
+        * latency histograms per Webex API endpoint and per portal endpoint
+    """
+
+    def __init__(self):
+        self.upstream = Histogram('webex_api_request_duration_seconds', 'Duration of Webex API requests',
+                                  ('method', 'endpoint', 'status'))
+        self.requests = Histogram('portal_request_duration_seconds', 'Duration of portal requests',
+                                  ('method', 'endpoint', 'status'))
+
+    def record(self, method: str, url: str, status: int, seconds: float):
+        call = UpstreamCall(method=method, endpoint=upstream_endpoint(url), status=status, seconds=seconds)
+        self.upstream.observe((call.method, call.endpoint, str(call.status)), call.seconds)
+        if (trace := _trace.get()) is not None:
+            trace.add(call)
+
+    def install(self, api: Union[WebexSimpleApi, 'AsWebexSimpleApi']):
+        """
+        Install the tracer on the REST session of an API instance. Has to be installed before the rate limiter so that
+        each attempt is recorded
+
+        :param api: API instance
+        """
+        session = api.session
+        request_w_response = session._request_w_response
+
+        if not isinstance(api, WebexSimpleApi):
+            from wxc_sdk.as_rest import AsRestError
+
+            @wraps(request_w_response)
+            async def as_traced(method: str, url: str, *args, **kwargs):
+                start = time.perf_counter()
+                status = 0
+                try:
+                    response, data = await request_w_response(method, url, *args, **kwargs)
+                    status = response.status
+                    return response, data
+                except AsRestError as e:
+                    status = e.status
+                    raise
+                finally:
+                    self.record(method, url, status, time.perf_counter() - start)
+
+            session._request_w_response = as_traced
+            return
+
+        @wraps(request_w_response)
+        def traced(method: str, url: str, *args, **kwargs):
+            start = time.perf_counter()
+            status = 0
+            try:
+                response, data = request_w_response(method, url, *args, **kwargs)
+                status = response.status_code
+                return response, data
+            except RestError as e:
+                status = e.response.status_code
+                raise
+            finally:
+                self.record(method, url, status, time.perf_counter() - start)
+
+        session._request_w_response = traced
+
+    def metrics_text(self) -> str:
+        """
+        Histograms in the Prometheus text format
+        """
+        return '\n'.join(self.upstream.render() + self.requests.render()) + '\n'
+
+
+def init_tracing(app: Flask, tracer: Tracer):
+    """
+    Trace all requests of the app. Has to be called after the session interface has been set up.
+
+        * each response has a Server-Timing header with the time spent loading the session and in Webex API requests
+        * for each request a log line with a JSON object is logged with level INFO: method, path, status, duration and
+          the Webex API requests grouped by endpoint
+        * METRICS_ENDPOINT: "1" enables /metrics with histograms of the durations of Webex API requests and portal
+          requests in the Prometheus text format, default 0. Each worker process has its own metrics
+
+    :param app: Flask app
+    :param tracer: tracer installed on the API instances used by the app
+    """
+    interface = app.session_interface
+    open_session = interface.open_session
+
+    @wraps(open_session)
+    def timed_open_session(app_: Flask, request_):
+        # session is opened before any request handler is called: start of the request
+        start = time.perf_counter()
+        try:
+            return open_session(app_, request_)
+        finally:
+            request_.environ['portal.request_start'] = start
+            request_.environ['portal.session_seconds'] = time.perf_counter() - start
+
+    interface.open_session = timed_open_session
+
+    @app.before_request
+    def start_trace():
+        _trace.set(RequestTrace(start=request.environ.get('portal.request_start'),
+                                session_seconds=request.environ.get('portal.session_seconds', 0)))
+
+    @app.after_request
+    def end_trace(response: Response) -> Response:
+        if (trace := _trace.get()) is None:
+            return response
+        total = time.perf_counter() - trace.start
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        tracer.requests.observe((request.method, endpoint, str(response.status_code)), total)
+        breakdown = trace.breakdown()
+        response.headers['Server-Timing'] = trace.server_timing(total, breakdown)
+        if not log.isEnabledFor(logging.INFO) or (request.endpoint and request.endpoint.endswith('static')):
+            return response
+        log.info(json.dumps({'method': request.method,
+                             'path': request.path,
+                             'status': response.status_code,
+                             'ms': round(total * 1000, 1),
+                             'session_ms': round(trace.session_seconds * 1000, 1),
+                             'webex_calls': sum(group['count'] for group in breakdown),
+                             'webex_ms': round(sum(group['ms'] for group in breakdown), 1),
+                             'webex': [group | {'ms': round(group['ms'], 1), 'max_ms': round(group['max_ms'], 1)}
+                                       for group in breakdown]},
+                            separators=(',', ':')))
+        return response
+
+    @app.teardown_request
+    def clear_trace(exc: Optional[BaseException]):
+        # threads are reused for other requests
+        _trace.set(None)
+
+    if (os.getenv('METRICS_ENDPOINT') or '0') not in ('0', 'false', 'no'):
+        @app.route('/metrics')
+        def metrics():
+            return Response(tracer.metrics_text(), mimetype='text/plain; version=0.0.4')
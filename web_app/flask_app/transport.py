@@ -0,0 +1,145 @@
+"""
+Pooled keep-alive HTTP transport shared by all synchronous HTTP clients: the Webex SDK, the OIDC client used for login
+and the scripts
+"""
+import os
+import ssl
+import threading
+from typing import Any, Optional
+
+import certifi
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.ssl_ import create_urllib3_context
+
+__all__ = ['SharedAdapter', 'Transport', 'default_transport']
+
+
+class SharedAdapter(HTTPAdapter):
+    """
+    An :class:`HTTPAdapter` which can be mounted in any number of sessions:
+        * all connections are created with one preloaded TLS context. By default urllib3 creates a TLS context and
+          loads the CA bundle for each new connection
+        * closing a session doesn't close the pooled connections; they are owned by the :class:`Transport`
+    """
+
+    def __init__(self, ssl_context: ssl.SSLContext, ca_bundle: str, **kwargs):
+        self.ssl_context = ssl_context
+        self.ca_bundle = ca_bundle
+        super().__init__(**kwargs)
+
+    def _shared_context(self, verify, cert) -> bool:
+        # urllib3 sets the verify mode and loads client certificates on the context it is given: only connections
+        # verified with the preloaded CA bundle and without client certificate use the shared context
+        return cert is None and (verify is True or verify == self.ca_bundle)
+
+    def build_connection_pool_key_attributes(self, request, verify, cert=None):
+        host_params, pool_kwargs = super().build_connection_pool_key_attributes(request, verify, cert)
+        if self._shared_context(verify, cert):
+            pool_kwargs['ssl_context'] = self.ssl_context
+        return host_params, pool_kwargs
+
+    def cert_verify(self, conn, url: str, verify, cert):
+        super().cert_verify(conn, url, verify, cert)
+        if self._shared_context(verify, cert):
+            # the CA bundle is already loaded in the shared TLS context; don't load it again for each connection
+            conn.ca_certs = None
+            conn.ca_cert_dir = None
+
+    def close(self):
+        # sessions using the adapter are closed all the time: see Transport.close()
+        pass
+
+    def shutdown(self):
+        """
+        Close all pooled connections
+        """
+        super().close()
+
+
+class Transport:
+    """
+    One pool of keep-alive connections used by all sessions the transport is mounted in. Requests from any of these
+    sessions to the same host reuse idle connections; TCP and TLS handshakes (and DNS lookups) are only needed for
+    additional concurrent connections.
+
+        * pool_connections: number of hosts for which connection pools are kept
+        * pool_maxsize: maximum number of idle connections kept per host. Should be at least the number of concurrent
+          requests to a host; connections beyond that are closed after each request
+        * pool_block: if True, requests wait for a free connection instead of opening connections beyond pool_maxsize
+    """
+
+    def __init__(self, pool_connections: int = 10, pool_maxsize: int = 32, pool_block: bool = False,
+                 ca_bundle: str = None):
+        """
+        :param pool_connections: number of hosts for which connection pools are kept
+        :param pool_maxsize: maximum number of idle connections per host
+        :param pool_block: block when all connections to a host are in use
+        :param ca_bundle: CA bundle used to verify servers; default: the bundle requests uses
+        """
+        self.ca_bundle = ca_bundle or os.getenv('REQUESTS_CA_BUNDLE') or os.getenv('CURL_CA_BUNDLE') or certifi.where()
+        self.ssl_context = create_urllib3_context()
+        self.ssl_context.load_verify_locations(self.ca_bundle)
+        self.adapter = SharedAdapter(ssl_context=self.ssl_context, ca_bundle=self.ca_bundle,
+                                     pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                     pool_block=pool_block)
+
+    def mount(self, session: Session) -> Session:
+        """
+        Use the transport for all HTTP and HTTPS requests of a session, for example the REST session of a
+        :class:`wxc_sdk.WebexSimpleApi` instance (api.session)
+
+        :return: the session
+        """
+        session.mount('http://', self.adapter)
+        session.mount('https://', self.adapter)
+        return session
+
+    def session(self) -> Session:
+        """
+        A new session using the transport
+        """
+        return self.mount(Session())
+
+    def status(self) -> dict[str, Any]:
+        """
+        Pooled connections per host: number of idle connections, connections created and requests sent
+        """
+        result = {}
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            if (pool := pools.get(key)) is None:
+                continue
+            result[f'{key.key_scheme}://{key.key_host}:{key.key_port or ""}'.rstrip(':')] = {
+                # the queue of a pool is filled with None placeholders for connections not created yet
+                'idle': sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool is not None else 0,
+                'connections': pool.num_connections,
+                'requests': pool.num_requests}
+        return result
+
+    def close(self):
+        """
+        Close all pooled connections
+        """
+        self.adapter.shutdown()
+
+
+_default: Optional[Transport] = None
+_default_lock = threading.Lock()
+
+
+def default_transport() -> Transport:
+    """
+    The transport of the process; created on first use. Configured by these environment variables:
+        * HTTP_POOL_CONNECTIONS: number of hosts for which connection pools are kept, default 10
+        * HTTP_POOL_MAXSIZE: maximum number of idle connections per host, default 32
+        * HTTP_POOL_BLOCK: 1: requests wait for a free connection if all connections to a host are in use, default 0
+    """
+    global _default
+    with _default_lock:
+        if _default is None:
+            pool_block = (os.getenv('HTTP_POOL_BLOCK') or '0').lower() not in ('0', 'false', 'no')
+            _default = Transport(pool_connections=int(os.getenv('HTTP_POOL_CONNECTIONS') or 10),
+                                 pool_maxsize=int(os.getenv('HTTP_POOL_MAXSIZE') or 32),
+                                 pool_block=pool_block)
+        return _default
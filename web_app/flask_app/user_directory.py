@@ -0,0 +1,188 @@
+"""
+Directory of calling users of the org indexed by email
+"""
+import logging
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from typing import Any, Optional
+
+from wxc_sdk import WebexSimpleApi
+from wxc_sdk.people import Person
+
+from .inventory import InventoryStore
+from .rate_limit import background_priority, retry_delay
+from .sessions import SessionUser
+
+__all__ = ['UserDirectory']
+
+log = logging.getLogger(__name__)
+
+
+class UserDirectory:
+    """
+    In-memory directory of all calling users of the org: email (lowercase) -> user.
+
+    Used to look up users at login without having to list people with calling data. The directory is maintained by a
+    background thread:
+        * every `interval` seconds all people are listed with calling data. Entries are updated page by page while
+          the list is read; users not seen in a complete listing are removed at the end of the cycle
+        * :meth:`add` can be used to add users found by a live lookup
+
+    With a `store` the directory is shared by all worker processes: in each cycle only the process which claims the
+    refresh in the store lists people and writes them to the store; all other processes load their directory from the
+    store and lag behind by up to `interval` seconds. Without a store each process lists all people.
+    """
+
+    def __init__(self, api: WebexSimpleApi, interval: float = 900, wait_for_token: Callable[[], Any] = None,
+                 store: InventoryStore = None):
+        """
+        :param api: API used to list people
+        :param interval: time between refresh cycles in seconds
+        :param wait_for_token: called before the first refresh cycle; blocks until the API has an access token
+        :param store: database shared with other processes
+        """
+        self.api = api
+        self.interval = interval
+        self.wait_for_token = wait_for_token
+        self.store = store
+        self._lock = threading.Lock()
+        self._users: dict[str, SessionUser] = {}
+        self._thread: Optional[threading.Thread] = None
+        self.ready = False
+        self.refreshing = False
+        self.last_refresh: Optional[float] = None
+        self.last_refresh_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+
+    def start(self):
+        """
+        Start background maintenance of the directory
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='user-directory', daemon=True)
+            self._thread.start()
+
+    def lookup(self, email: str) -> Optional[SessionUser]:
+        """
+        Look up a calling user by email
+
+        :param email: email address; case-insensitive
+        :return: user; None if the user is not in the directory
+        """
+        user = self._users.get(email.lower())
+        if user is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return user
+
+    def add(self, user: SessionUser):
+        """
+        Add a user to the directory; for example after a successful live lookup
+        """
+        with self._lock:
+            self._users[user.emails[0].lower()] = user
+
+    def status(self) -> dict[str, Any]:
+        """
+        Directory status:
+            * ready: True if the directory has been built
+            * refreshing: True if a refresh cycle is in progress
+            * age: seconds since the last refresh cycle
+            * last_refresh_duration: duration of the last refresh cycle in seconds
+            * users: number of users
+            * hits, misses: lookup counters
+            * shared: True if the directory is shared with other processes
+            * last_error: error of the last refresh cycle, if any
+        """
+        return {'ready': self.ready,
+                'refreshing': self.refreshing,
+                'age': self.last_refresh and time.time() - self.last_refresh,
+                'last_refresh_duration': self.last_refresh_duration,
+                'users': len(self._users),
+                'hits': self.hits,
+                'misses': self.misses,
+                'shared': self.store is not None,
+                'last_error': self.last_error}
+
+    def _update(self, people: Iterable[Person]):
+        """
+        Update the directory from a complete list of people
+        """
+        start = time.perf_counter()
+        seen = set()
+        for person in people:
+            if not person.emails or person.location_id is None:
+                continue
+            email = person.emails[0].lower()
+            seen.add(email)
+            user = SessionUser.from_person(person)
+            if self._users.get(email) != user:
+                with self._lock:
+                    self._users[email] = user
+        with self._lock:
+            for email in set(self._users) - seen:
+                del self._users[email]
+        self.last_refresh = time.time()
+        self.last_refresh_duration = time.perf_counter() - start
+        log.debug(f'user directory: refresh cycle done in {self.last_refresh_duration:.3f} s, '
+                  f'{len(self._users)} users')
+
+    def _refresh_cycle(self) -> bool:
+        """
+        One refresh cycle. With a store only the process which claims the refresh lists people
+
+        :return: True if the directory is complete
+        """
+        if self.store is None:
+            self._update(self.api.people.list(calling_data=True))
+            return True
+        # claim with a slightly shorter minimum age: no skipped cycle if timers of two processes are not aligned
+        if not self.store.claim('people', min_age=self.interval * 0.9):
+            if (people := self.store.people()) is None:
+                # the first listing is still in progress in another process
+                return False
+            log.debug('user directory: refreshed by another process, loading from store')
+            self._update(people)
+            return True
+        people = []
+
+        def listed() -> Iterator[Person]:
+            # the directory is updated while the list is read: collect the people for the store on the way
+            for person in self.api.people.list(calling_data=True):
+                people.append(person)
+                yield person
+
+        try:
+            self._update(listed())
+        except BaseException:
+            self.store.release('people')
+            raise
+        self.store.write('people', people, duration=self.last_refresh_duration)
+        return True
+
+    def _run(self):
+        if self.wait_for_token is not None:
+            self.wait_for_token()
+        failures = 0
+        while True:
+            self.refreshing = True
+            complete = False
+            try:
+                with background_priority():
+                    complete = self._refresh_cycle()
+            except Exception as e:
+                log.error(f'user directory: refresh failed: {e}')
+                self.last_error = f'{e}'
+                failures += 1
+            else:
+                self.last_error = None
+                failures = 0
+                self.ready = self.ready or complete
+            finally:
+                self.refreshing = False
+            # not ready without failures: another process is building the directory, check the store again soon
+            time.sleep(retry_delay(failures, self.interval) if self.ready or failures else min(self.interval, 1))
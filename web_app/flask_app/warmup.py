@@ -0,0 +1,123 @@
+"""
+Warm-up of a worker before it reports ready
+"""
+import logging
+import threading
+import time
+from collections.abc import Callable
+from typing import Any, Optional
+
+from flask import Flask
+
+from .rate_limit import background_priority
+
+__all__ = ['WarmUp']
+
+log = logging.getLogger(__name__)
+
+
+class WarmUp:
+    """
+    Prepares a worker for its first requests; the worker only reports ready (/readyz) when the warm-up is done:
+        * compile the page templates
+        * wait for the service app access token
+        * open `connections` pooled connections to the Webex APIs with concurrent cheap requests. The first requests of
+          users don't pay for TCP and TLS handshakes
+        * wait for the first build of the queue index, the user directory and the inventory snapshot (if enabled). The
+          first requests are answered from these instead of the Webex APIs
+
+    After `timeout` seconds the remaining steps are skipped and the worker reports ready anyway.
+    """
+
+    def __init__(self, app: Flask, timeout: float = 60, connections: int = 4):
+        """
+        :param app: the portal app (:class:`AppWithTokens`)
+        :param timeout: maximum duration of the warm-up in seconds
+        :param connections: number of connections to open
+        """
+        self.app = app
+        self.timeout = timeout
+        self.connections = connections
+        self._thread: Optional[threading.Thread] = None
+        self.done = False
+        #: step name -> duration in seconds; None if the step was skipped or timed out
+        self.steps: dict[str, Optional[float]] = {}
+        self.duration: Optional[float] = None
+
+    def start(self):
+        """
+        Start the warm-up in the background
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='warm-up', daemon=True)
+            self._thread.start()
+
+    def status(self) -> dict[str, Any]:
+        """
+        Warm-up status:
+            * done: True if the warm-up is done
+            * duration: duration of the warm-up in seconds
+            * steps: step name -> duration in seconds; null if the step didn't finish within the timeout
+        """
+        return {'done': self.done,
+                'duration': self.duration,
+                'steps': dict(self.steps)}
+
+    def _compile_templates(self, deadline: float) -> bool:
+        env = self.app.jinja_env
+        for name in env.list_templates(extensions=['html']):
+            env.get_template(name)
+        return True
+
+    def _wait_for_tokens(self, deadline: float) -> bool:
+        return self.app.token_manager.wait(timeout=max(0.0, deadline - time.monotonic()))
+
+    def _open_connections(self, deadline: float) -> bool:
+        api = self.app.api
+
+        def first_location():
+            # one page with a single location
+            return next(iter(api.locations.list(max=1)), None)
+
+        self.app.executor.map([first_location] * self.connections, user_id='warm-up',
+                              timeout=max(0.0, deadline - time.monotonic()))
+        return True
+
+    def _wait_for_indexes(self, deadline: float) -> bool:
+        app = self.app
+        checks: list[Callable[[], bool]] = []
+        if app.queue_index.interval > 0:
+            checks.append(lambda: app.queue_index.ready)
+        if app.user_directory.interval > 0:
+            checks.append(lambda: app.user_directory.ready)
+        if app.inventory is not None:
+            checks.append(lambda: app.inventory.ready)
+        while not all(check() for check in checks):
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.1)
+        return True
+
+    def _run(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        steps: dict[str, Callable[[float], bool]] = {'templates': self._compile_templates,
+                                                     'tokens': self._wait_for_tokens,
+                                                     'connections': self._open_connections,
+                                                     'indexes': self._wait_for_indexes}
+        with background_priority():
+            for name, step in steps.items():
+                if time.monotonic() > deadline:
+                    log.warning(f'warm-up: timeout, skipping {name}')
+                    self.steps[name] = None
+                    continue
+                step_start = time.monotonic()
+                try:
+                    finished = step(deadline)
+                except Exception as e:
+                    log.warning(f'warm-up: {name} failed: {e}')
+                    finished = False
+                self.steps[name] = time.monotonic() - step_start if finished else None
+        self.duration = time.monotonic() - start
+        self.done = True
+        log.info(f'warm-up done in {self.duration:.3f} s: {self.steps}')
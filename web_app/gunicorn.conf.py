@@ -0,0 +1,35 @@
+"""
+gunicorn configuration for production mode
+
+Settings can be overridden using these environment variables:
+    * PORT: port to listen on, default 5010
+    * WEB_CONCURRENCY: number of worker processes, default: number of CPUs
+    * GUNICORN_THREADS: number of threads per worker, default 8
+    * GUNICORN_PRELOAD: preload the app in the master process before forking workers, default 1. Workers start faster
+      and share memory, but a graceful reload (SIGHUP) then doesn't load new application code
+    * GUNICORN_MAX_REQUESTS: recycle a worker after this many requests, default 0 (never)
+    * GUNICORN_TIMEOUT: kill workers silent for more than this many seconds, default 60
+
+Send SIGHUP to the master process for a graceful reload: new workers are started and old workers finish their current
+requests before they are stopped.
+"""
+import os
+
+bind = f'0.0.0.0:{os.getenv("PORT") or 5010}'
+workers = int(os.getenv('WEB_CONCURRENCY') or os.cpu_count() or 1)
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS') or 8)
+preload_app = (os.getenv('GUNICORN_PRELOAD') or '1') not in ('0', 'false', 'no')
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS') or 0)
+max_requests_jitter = max_requests // 10
+timeout = int(os.getenv('GUNICORN_TIMEOUT') or 60)
+graceful_timeout = 30
+accesslog = '-'
+
+
+def post_worker_init(worker):
+    """
+    Threads don't survive a fork: start background threads of the app in each worker. worker.wsgi is the app instance
+    preloaded in the master or loaded in the worker
+    """
+    worker.wsgi.start_background()
@@ -0,0 +1,100 @@
+"""
+Tests of the TTL cache: expiry, LRU eviction, write-through updates and cache statistics
+"""
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+from flask_app import cache as cache_module
+from flask_app.api import apib
+from flask_app.cache import TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, 'monotonic', clock)
+    return clock
+
+
+def test_entries_expire(clock: Clock):
+    cache = TTLCache(ttl=60)
+    cache.set('p1', 'devices', ['d1'])
+    clock.now += 59
+    assert cache.get('p1', 'devices') == ['d1']
+    clock.now += 2
+    assert cache.get('p1', 'devices') is None
+    assert cache.stats() == {'entries': 0, 'hits': 1, 'misses': 1, 'evictions': 0}
+
+
+def test_least_recently_used_entry_is_evicted(clock: Clock):
+    cache = TTLCache(ttl=60, max_entries=2)
+    cache.set('p1', 'devices', 1)
+    cache.set('p2', 'devices', 2)
+    # p1 is now the most recently used entry
+    assert cache.get('p1', 'devices') == 1
+    cache.set('p3', 'devices', 3)
+    assert cache.get('p2', 'devices') is None
+    assert cache.get('p1', 'devices') == 1
+    assert cache.stats()['evictions'] == 1
+
+
+def test_get_or_load_calls_loader_once(clock: Clock):
+    cache = TTLCache(ttl=60)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return 'value'
+
+    assert cache.get_or_load('q1', 'queue_details', loader) == 'value'
+    assert cache.get_or_load('q1', 'queue_details', loader) == 'value'
+    assert len(calls) == 1
+
+
+def test_update_does_not_extend_lifetime(clock: Clock):
+    cache = TTLCache(ttl=60)
+    cache.set('p1', 'call_waiting', False)
+    clock.now += 30
+    cache.update('p1', 'call_waiting', lambda value: not value)
+    assert cache.get('p1', 'call_waiting') is True
+    clock.now += 31
+    assert cache.get('p1', 'call_waiting') is None
+    # nothing is cached by an update of a missing entry
+    cache.update('p1', 'call_waiting', lambda value: not value)
+    assert cache.get('p1', 'call_waiting') is None
+
+
+def test_invalidate_all_entries_of_owner(clock: Clock):
+    cache = TTLCache(ttl=60)
+    cache.set('p1', 'devices', 1)
+    cache.set('p1', 'call_waiting', 2)
+    cache.set('p2', 'devices', 3)
+    cache.invalidate('p1')
+    assert cache.stats()['entries'] == 1
+    assert cache.get('p2', 'devices') == 3
+
+
+def test_stats_endpoint(clock: Clock):
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.token_manager = SimpleNamespace(wait=lambda timeout=None: True)
+    app.cache = TTLCache(ttl=60)
+    app.register_blueprint(apib)
+    app.cache.set('p1', 'devices', 1)
+    assert app.cache.get('p1', 'devices') == 1
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user'] = {'person_id': 'p1'}
+    response = client.get('/api/cache')
+    assert response.status_code == 200
+    assert response.json == {'entries': 1, 'hits': 1, 'misses': 0, 'evictions': 0}
@@ -0,0 +1,64 @@
+"""
+Tests of conditional GET on the portal API: ETags, 304 Not Modified and caching headers of per-user responses
+"""
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+from flask_app.api import apib
+
+
+class FakeExecutor:
+    def __init__(self):
+        self.completed = 0
+
+    def metrics(self) -> dict[str, int]:
+        return {'completed': self.completed}
+
+
+@pytest.fixture
+def app() -> Flask:
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.token_manager = SimpleNamespace(wait=lambda timeout=None: True)
+    app.executor = FakeExecutor()
+    app.register_blueprint(apib)
+    return app
+
+
+@pytest.fixture
+def client(app: Flask):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user'] = {'person_id': 'p1'}
+    return client
+
+
+def test_not_modified_with_matching_etag(client):
+    response = client.get('/api/executor')
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+    etag = response.headers['ETag']
+
+    response = client.get('/api/executor', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+
+
+def test_changed_body_gets_new_etag(app: Flask, client):
+    etag = client.get('/api/executor').headers['ETag']
+    app.executor.completed += 1
+    response = client.get('/api/executor', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json == {'completed': 1}
+    assert response.headers['ETag'] != etag
+
+
+def test_no_etag_on_errors(client):
+    with client.session_transaction() as session:
+        session.clear()
+    response = client.get('/api/executor')
+    assert response.status_code == 401
+    assert 'ETag' not in response.headers
@@ -0,0 +1,73 @@
+"""
+Tests of the fan-out executor: nested fan-out can't deadlock, even if all workers are busy
+"""
+import threading
+from functools import partial
+
+import pytest
+
+from flask_app.executor import FanOutExecutor
+
+
+@pytest.fixture
+def executor():
+    executor = FanOutExecutor(max_workers=2)
+    yield executor
+    executor.shutdown(wait=False)
+
+
+def test_nested_map_with_all_workers_busy(executor: FanOutExecutor):
+    """
+    More outer tasks than workers, each fanning out further: all workers block in nested maps
+    """
+
+    def inner(i: int, j: int) -> int:
+        return i * 10 + j
+
+    def outer(i: int) -> list[int]:
+        # a deadlock would surface as a TimeoutError instead of hanging the test
+        return executor.map([partial(inner, i, j) for j in range(4)], user_id=f'user-{i}', timeout=5)
+
+    results = executor.map([partial(outer, i) for i in range(6)], user_id='test', timeout=10)
+    assert results == [[i * 10 + j for j in range(4)] for i in range(6)]
+
+
+def test_three_levels_on_single_worker():
+    executor = FanOutExecutor(max_workers=1)
+    try:
+        def level(depth: int) -> int:
+            if depth == 0:
+                return 1
+            return sum(executor.map([partial(level, depth - 1)] * 3, timeout=5))
+
+        assert executor.map([partial(level, 3)], timeout=10) == [27]
+    finally:
+        executor.shutdown(wait=False)
+
+
+def test_nested_map_with_blocked_sibling(executor: FanOutExecutor):
+    """
+    A nested map completes while the other worker is blocked by a task waiting for it
+    """
+    done = threading.Event()
+
+    def blocker() -> bool:
+        return done.wait(timeout=5)
+
+    def fan_out() -> list[int]:
+        result = executor.map([partial(int, j) for j in range(3)], timeout=5)
+        done.set()
+        return result
+
+    assert executor.map([blocker, fan_out], timeout=10) == [True, [0, 1, 2]]
+
+
+def test_nested_error_propagates(executor: FanOutExecutor):
+    def fail():
+        raise ValueError('nested task failed')
+
+    def outer():
+        return executor.map([fail, partial(int, 1)], timeout=5)
+
+    with pytest.raises(ValueError, match='nested task failed'):
+        executor.map([outer, outer, outer], timeout=10)
@@ -0,0 +1,66 @@
+"""
+Tests of live updates: streams opened right after the dashboard start from the dashboard's sections
+"""
+import threading
+
+import pytest
+
+from flask_app.live_updates import LiveUpdates
+from flask_app.sessions import SessionUser
+
+USER = SessionUser(person_id='p1', location_id='loc1', display_name='Alice', emails=['alice@example.com'])
+
+
+def sections(*macs: str) -> dict[str, dict]:
+    return {'userphones': {'success': True, 'rows': [{'mac': mac} for mac in macs]},
+            'userqueues': {'success': True, 'rows': []}}
+
+
+@pytest.fixture
+def live() -> LiveUpdates:
+    live = LiveUpdates(app=None)
+    # no background poller: events are published by the tests
+    live._thread = threading.current_thread()
+    reads = []
+
+    def read_sections(user: SessionUser) -> dict[str, dict]:
+        reads.append(user.person_id)
+        return sections('AA')
+
+    live.read_sections = read_sections
+    live.reads = reads
+    return live
+
+
+def first_event(live: LiveUpdates, seeded: bool) -> str:
+    subscription = live.subscribe(USER, seeded=seeded)
+    stream = live.stream(subscription)
+    assert next(stream) == 'retry: 5000\n\n'
+    # the poller finds a new phone
+    threading.Timer(0.1, subscription.publish, args=(sections('AA', 'BB'),)).start()
+    event = next(stream)
+    stream.close()
+    return event
+
+
+def test_seeded_stream_starts_with_diff(live: LiveUpdates):
+    live.seed(USER, sections('AA'))
+    event = first_event(live, seeded=True)
+    assert event.startswith('event: diff\n')
+    assert '"upsert":[{"mac":"BB"}]' in event
+    assert live.reads == []
+    assert live.status()['seeded'] == 1
+
+
+def test_reconnect_gets_snapshot(live: LiveUpdates):
+    live.seed(USER, sections('AA'))
+    first_event(live, seeded=True)
+    # the seed is used only once
+    assert first_event(live, seeded=True).startswith('event: snapshot\n')
+    assert live.reads == ['p1']
+
+
+def test_expired_seed_is_not_used(live: LiveUpdates):
+    live.seed_ttl = -1
+    live.seed(USER, sections('AA'))
+    assert first_event(live, seeded=True).startswith('event: snapshot\n')
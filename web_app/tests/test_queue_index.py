@@ -0,0 +1,87 @@
+"""
+Tests of the call queue index: write-through updates are shared with the indexes of other processes through the
+store
+"""
+from os.path import join
+from types import SimpleNamespace
+
+import pytest
+from wxc_sdk.telephony.callqueue import CallQueue
+from wxc_sdk.telephony.hg_and_cq import Agent
+
+from flask_app.executor import FanOutExecutor
+from flask_app.inventory import InventoryStore
+from flask_app.queue_index import CallQueueIndex
+
+QUEUE = CallQueue(id='q1', name='Support', location_id='loc1')
+
+
+def queue_detail(join_enabled: bool) -> CallQueue:
+    return CallQueue(id=QUEUE.id, name=QUEUE.name, allow_agent_join_enabled=True,
+                     agents=[Agent(agent_id='a1', first_name='Alice', last_name='Agent',
+                                   join_enabled=join_enabled)])
+
+
+def fake_api(detail: CallQueue) -> SimpleNamespace:
+    """
+    API with a single call queue
+    """
+    callqueue = SimpleNamespace(list=lambda has_cx_essentials=None: [] if has_cx_essentials else [QUEUE],
+                                details=lambda location_id, queue_id: detail)
+    return SimpleNamespace(telephony=SimpleNamespace(callqueue=callqueue))
+
+
+@pytest.fixture
+def executor():
+    executor = FanOutExecutor(max_workers=2)
+    yield executor
+    executor.shutdown(wait=False)
+
+
+def joined(index: CallQueueIndex) -> bool:
+    return index.memberships('a1')[0].join_enabled
+
+
+def test_write_through_seen_by_other_process(tmp_path, executor: FanOutExecutor):
+    path = join(tmp_path, 'inventory.db')
+    leader = CallQueueIndex(api=fake_api(queue_detail(join_enabled=True)), executor=executor,
+                            store=InventoryStore(path=path))
+    assert leader._refresh_cycle(force=True)
+    leader.ready = True
+
+    # second process: loads the index from the store
+    follower = CallQueueIndex(api=fake_api(queue_detail(join_enabled=True)), executor=executor,
+                              store=InventoryStore(path=path))
+    assert follower._refresh_cycle(force=False)
+    follower.ready = True
+    assert joined(follower)
+
+    version = follower.store.data_version()
+    leader.update_queue(location_id=QUEUE.location_id, detail=queue_detail(join_enabled=False))
+    assert not joined(leader)
+    # the follower sees the change of the store and merges the update
+    assert follower.store.data_version() != version
+    assert follower._load(merge=True)
+    assert not joined(follower)
+
+
+def test_refresh_keeps_write_through_of_other_process(tmp_path, executor: FanOutExecutor):
+    path = join(tmp_path, 'inventory.db')
+    # the leader reads stale details: the queue is updated by another process while the leader reads
+    leader = CallQueueIndex(api=fake_api(queue_detail(join_enabled=True)), executor=executor,
+                            store=InventoryStore(path=path))
+    other = CallQueueIndex(api=fake_api(queue_detail(join_enabled=True)), executor=executor,
+                           store=InventoryStore(path=path))
+    assert leader._refresh_cycle(force=True)
+    read_queues = leader._read_queues
+
+    def read_and_update(force: bool):
+        read_queues(force)
+        other.update_queue(location_id=QUEUE.location_id, detail=queue_detail(join_enabled=False))
+
+    leader._read_queues = read_and_update
+    assert leader._refresh_cycle(force=True)
+    leader.ready = True
+    assert not joined(leader)
+    details = InventoryStore(path=path).queue_details()
+    assert [d.detail.agents[0].join_enabled for d in details] == [False]
@@ -0,0 +1,99 @@
+"""
+Tests of the queue join updater: read-modify-write with verification, no-op changes and failures of single changes
+"""
+from types import SimpleNamespace
+
+import pytest
+from wxc_sdk.telephony.callqueue import CallQueue
+from wxc_sdk.telephony.hg_and_cq import Agent
+
+from flask_app.executor import FanOutExecutor
+from flask_app.queue_updates import JoinChange, QueueJoinUpdater
+
+AGENT_ID = 'a1'
+
+
+class FakeCallQueueApi:
+    """
+    Call queues with one agent each. `lost_updates` updates of a queue are overwritten by a concurrent update
+    """
+
+    def __init__(self, joined: dict[str, bool], lost_updates: int = 0, failing: set[str] = None):
+        self.joined = dict(joined)
+        self.lost_updates = lost_updates
+        self.failing = failing or set()
+        self.updates: list[tuple[str, bool]] = []
+
+    def details(self, location_id: str, queue_id: str) -> CallQueue:
+        if queue_id in self.failing:
+            raise RuntimeError(f'details of {queue_id} failed')
+        return CallQueue(id=queue_id, name=f'queue {queue_id}', location_id=location_id,
+                         allow_agent_join_enabled=True,
+                         agents=[Agent(agent_id=AGENT_ID, join_enabled=self.joined[queue_id])])
+
+    def update(self, location_id: str, queue_id: str, update: CallQueue):
+        self.updates.append((queue_id, update.agents[0].join_enabled))
+        if self.lost_updates:
+            self.lost_updates -= 1
+            return
+        self.joined[queue_id] = update.agents[0].join_enabled
+
+
+class RecordingIndex:
+    def __init__(self):
+        self.updated: list[CallQueue] = []
+
+    def update_queue(self, location_id: str, detail: CallQueue):
+        self.updated.append(detail)
+
+
+@pytest.fixture
+def executor():
+    executor = FanOutExecutor(max_workers=2)
+    yield executor
+    executor.shutdown(wait=False)
+
+
+def updater(executor: FanOutExecutor, callqueue: FakeCallQueueApi) -> QueueJoinUpdater:
+    api = SimpleNamespace(telephony=SimpleNamespace(callqueue=callqueue))
+    return QueueJoinUpdater(api=api, executor=executor, queue_index=RecordingIndex())
+
+
+def test_no_update_if_agent_already_in_state(executor: FanOutExecutor):
+    callqueue = FakeCallQueueApi(joined={'q1': True})
+    qu = updater(executor, callqueue)
+    [result] = qu.update(AGENT_ID, [JoinChange(location_id='loc1', queue_id='q1', joined=True)])
+    assert result.success and result.attempts == 0
+    assert callqueue.updates == []
+    assert qu.metrics() == {'updates': 0, 'skipped': 1, 'retries': 0}
+
+
+def test_overwritten_update_is_retried(executor: FanOutExecutor):
+    callqueue = FakeCallQueueApi(joined={'q1': True}, lost_updates=1)
+    qu = updater(executor, callqueue)
+    [result] = qu.update(AGENT_ID, [JoinChange(location_id='loc1', queue_id='q1', joined=False)])
+    assert result.success and result.attempts == 2
+    assert callqueue.updates == [('q1', False), ('q1', False)]
+    assert qu.metrics() == {'updates': 2, 'skipped': 0, 'retries': 1}
+    # the verified details are written through to the index
+    assert [detail.agents[0].join_enabled for detail in qu.queue_index.updated] == [False]
+
+
+def test_gives_up_after_max_attempts(executor: FanOutExecutor):
+    callqueue = FakeCallQueueApi(joined={'q1': True}, lost_updates=10)
+    qu = updater(executor, callqueue)
+    [result] = qu.update(AGENT_ID, [JoinChange(location_id='loc1', queue_id='q1', joined=False)])
+    assert not result.success
+    assert result.attempts == qu.max_attempts
+    assert 'overwritten' in result.message
+    assert qu.queue_index.updated == []
+
+
+def test_failed_change_keeps_other_results(executor: FanOutExecutor):
+    callqueue = FakeCallQueueApi(joined={'q1': True, 'q2': True, 'q3': True}, failing={'q2'})
+    qu = updater(executor, callqueue)
+    results = qu.update(AGENT_ID, [JoinChange(location_id='loc1', queue_id=queue_id, joined=False)
+                                   for queue_id in ('q1', 'q2', 'q3')])
+    assert [(r.queue_id, r.success) for r in results] == [('q1', True), ('q2', False), ('q3', True)]
+    assert 'details of q2 failed' in results[1].message
+    assert callqueue.joined == {'q1': False, 'q2': True, 'q3': False}
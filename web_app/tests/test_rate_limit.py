@@ -0,0 +1,61 @@
+"""
+Tests of the rate limiter: tokens reserved for interactive requests and pauses requested by 429 responses
+"""
+import pytest
+
+from flask_app import rate_limit
+from flask_app.rate_limit import Priority, RateLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, 'monotonic', clock)
+    return clock
+
+
+def test_reserve_is_kept_for_interactive_requests(clock: Clock):
+    limiter = RateLimiter(rate=1, burst=4, reserve=2)
+    assert limiter._try_acquire(Priority.background) == 0
+    assert limiter._try_acquire(Priority.background) == 0
+    # the last two tokens are reserved
+    assert limiter._try_acquire(Priority.background) == pytest.approx(1)
+    assert limiter._try_acquire(Priority.interactive) == 0
+    assert limiter._try_acquire(Priority.interactive) == 0
+    assert limiter._try_acquire(Priority.interactive) == pytest.approx(1)
+
+
+def test_background_waits_while_interactive_requests_wait(clock: Clock):
+    limiter = RateLimiter(rate=1, burst=4, reserve=0)
+    with limiter._waiting(Priority.interactive):
+        assert limiter._try_acquire(Priority.background) > 0
+    assert limiter._try_acquire(Priority.background) == 0
+
+
+def test_retry_after_pauses_all_requests(clock: Clock):
+    limiter = RateLimiter(rate=1, burst=4, max_retries=1)
+    assert limiter._throttled('7', attempt=0, url='url')
+    assert limiter._try_acquire(Priority.interactive) == pytest.approx(7)
+    # after the pause the bucket refills from empty
+    clock.now += 7
+    assert limiter._try_acquire(Priority.interactive) == pytest.approx(1)
+    clock.now += 1
+    assert limiter._try_acquire(Priority.interactive) == 0
+    # no retry after max_retries
+    assert not limiter._throttled('1', attempt=1, url='url')
+    assert (limiter.throttled, limiter.retried, limiter.dropped) == (2, 1, 1)
+
+
+@pytest.mark.parametrize('retry_after, pause', [('120', 60), ('soon', 5), (None, 5)])
+def test_retry_after_limits(clock: Clock, retry_after, pause):
+    limiter = RateLimiter(rate=0, max_retry_after=60)
+    limiter._throttled(retry_after, attempt=0, url='url')
+    assert limiter._try_acquire(Priority.interactive) == pytest.approx(pause)
@@ -0,0 +1,47 @@
+"""
+Tests of response shaping and JSON serialization: orjson and the standard library fallback produce the same JSON
+"""
+import json
+from enum import Enum
+from types import SimpleNamespace
+
+import pytest
+
+from flask_app import serialization
+from flask_app.serialization import Shape, dumps
+
+NUMBER = Shape('phone_number', 'extension', location=Shape('name'))
+
+
+class Color(str, Enum):
+    red = 'RED'
+
+
+DATA = {'numbers': [{'phone_number': '+14085550001', 'extension': None, 'ok': True, 'ratio': 0.5}],
+        'nested': {'name': 'Zoë', 'items': [1, 2, 3]},
+        1: 'int key'}
+
+
+@pytest.mark.skipif(serialization.orjson is None, reason='orjson not installed')
+@pytest.mark.parametrize('indent', [False, True])
+def test_orjson_and_json_fallback_agree(monkeypatch, indent: bool):
+    fast = dumps(DATA, indent=indent)
+    monkeypatch.setattr(serialization, 'orjson', None)
+    fallback = dumps(DATA, indent=indent)
+    assert json.loads(fast) == json.loads(fallback)
+    if not indent:
+        # both compact
+        assert b', ' not in fast and b', ' not in fallback
+
+
+def test_shape_dumps_declared_fields():
+    number = SimpleNamespace(phone_number='+14085550001', extension='2001', owner='not declared',
+                             location=SimpleNamespace(id='loc1', name='HQ'))
+    assert NUMBER.dump(number) == {'phone_number': '+14085550001', 'extension': '2001', 'location': {'name': 'HQ'}}
+    assert NUMBER.dump_list([None]) == [None]
+
+
+def test_shape_replaces_enums_by_values():
+    obj = SimpleNamespace(color=Color.red)
+    assert Shape('color').dump(obj) == {'color': 'RED'}
+    assert json.loads(dumps(Shape('color').dump(obj))) == {'color': 'RED'}
@@ -0,0 +1,71 @@
+"""
+Tests of the session store selection: file system sessions by default, Redis with SESSION_BACKEND=redis
+"""
+import sys
+
+import pytest
+from flask import Flask, session
+
+from flask_app import sessions
+from flask_app.sessions import SweepingFileSystemCache, init_session
+
+
+@pytest.fixture
+def app() -> Flask:
+    app = Flask(__name__)
+    app.secret_key = 'test'
+
+    @app.route('/login')
+    def login():
+        session['user'] = {'person_id': 'p1'}
+        return 'ok'
+
+    @app.route('/user')
+    def user():
+        return session.get('user') or {}
+
+    return app
+
+
+def test_filesystem_is_default(app: Flask, tmp_path, monkeypatch):
+    monkeypatch.delenv('SESSION_BACKEND', raising=False)
+    # keep session files out of the source tree
+    monkeypatch.setattr(sessions, '__file__', str(tmp_path / 'flask_app' / 'sessions.py'))
+    cache = init_session(app)
+    assert isinstance(cache, SweepingFileSystemCache)
+    assert cache._path == str(tmp_path / 'sessions')
+    assert app.config['SESSION_TYPE'] == 'cachelib'
+
+    client = app.test_client()
+    client.get('/login')
+    assert client.get('/user').json == {'person_id': 'p1'}
+
+
+def test_redis_backend(app: Flask, monkeypatch):
+    fakeredis = pytest.importorskip('fakeredis')
+    monkeypatch.setenv('SESSION_BACKEND', 'redis')
+    redis_client = fakeredis.FakeRedis()
+    assert init_session(app, redis_client=redis_client) is None
+    assert app.config['SESSION_TYPE'] == 'redis'
+
+    client = app.test_client()
+    client.get('/login')
+    assert client.get('/user').json == {'person_id': 'p1'}
+    [key] = redis_client.keys('*')
+    assert key.startswith(b'portal:session:')
+    # sessions expire using the native key TTL
+    assert 0 < redis_client.ttl(key) <= app.permanent_session_lifetime.total_seconds()
+
+
+def test_redis_backend_requires_redis_package(app: Flask, monkeypatch):
+    monkeypatch.setenv('SESSION_BACKEND', 'redis')
+    # import of redis fails
+    monkeypatch.setitem(sys.modules, 'redis', None)
+    with pytest.raises(ImportError, match='requires the "redis" package'):
+        init_session(app)
+
+
+def test_unsupported_backend(app: Flask, monkeypatch):
+    monkeypatch.setenv('SESSION_BACKEND', 'memcached')
+    with pytest.raises(ValueError, match='unsupported SESSION_BACKEND'):
+        init_session(app)
@@ -0,0 +1,121 @@
+"""
+Tests of the single-flight layer: results and errors of a request in flight are shared with identical requests
+"""
+import asyncio
+import threading
+import time
+
+from flask_app.single_flight import SingleFlight
+
+URL = 'https://webexapis.com/v1/people'
+KEY = ('interactive', URL, ())
+
+
+def wait_for(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timeout'
+        time.sleep(0.01)
+
+
+def concurrent_calls(flight: SingleFlight, func, waiters: int) -> list:
+    """
+    Call func through the single-flight layer from a leader and `waiters` threads which join while the leader's call is
+    in flight
+
+    :param func: called by the leader with an event; has to wait for the event before returning
+    :return: results or exceptions of all callers
+    """
+    release = threading.Event()
+    outcomes = []
+
+    def call():
+        try:
+            outcomes.append(flight.do(KEY, URL, lambda: func(release)))
+        except Exception as e:
+            outcomes.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(waiters + 1)]
+    threads[0].start()
+    wait_for(lambda: flight.upstream == 1)
+    for thread in threads[1:]:
+        thread.start()
+    wait_for(lambda: flight.merged == waiters)
+    release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+    return outcomes
+
+
+def test_result_shared_with_waiters():
+    flight = SingleFlight()
+
+    def read(release: threading.Event):
+        release.wait(timeout=5)
+        return 'response', {'items': [{'id': 'p1'}]}
+
+    outcomes = concurrent_calls(flight, read, waiters=3)
+    assert [data for _, data in outcomes] == [{'items': [{'id': 'p1'}]}] * 4
+    # each caller gets its own copy of the body
+    assert len({id(data) for _, data in outcomes}) == 4
+    assert flight.metrics()['upstream'] == 1
+
+
+def test_error_raised_to_all_callers():
+    flight = SingleFlight()
+    error = RuntimeError('upstream failed')
+
+    def read(release: threading.Event):
+        release.wait(timeout=5)
+        raise error
+
+    outcomes = concurrent_calls(flight, read, waiters=3)
+    assert outcomes == [error] * 4
+    assert flight.metrics()['in_flight'] == 0
+    # the failed flight has landed: the next request goes upstream again
+    assert flight.do(KEY, URL, lambda: ('response', {'items': []})) == ('response', {'items': []})
+    assert flight.upstream == 2
+
+
+def test_async_error_raised_to_all_callers():
+    async def main() -> list:
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def read():
+            await release.wait()
+            raise RuntimeError('upstream failed')
+
+        tasks = [asyncio.create_task(flight.as_do(KEY, URL, read)) for _ in range(4)]
+        while flight.merged < 3:
+            await asyncio.sleep(0)
+        release.set()
+        outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+        assert flight.metrics()['in_flight'] == 0
+        return outcomes
+
+    outcomes = asyncio.run(main())
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+    assert len(outcomes) == 4
+
+
+def test_cancelled_waiter_does_not_cancel_flight():
+    async def main():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def read():
+            await release.wait()
+            return 'response', {'items': []}
+
+        leader = asyncio.create_task(flight.as_do(KEY, URL, read))
+        waiter = asyncio.create_task(flight.as_do(KEY, URL, read))
+        while flight.merged < 1:
+            await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await leader == ('response', {'items': []})
+        assert waiter.cancelled()
+
+    asyncio.run(main())
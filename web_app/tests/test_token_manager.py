@@ -0,0 +1,129 @@
+"""
+Tests of the token manager: refreshes are serialized across threads and processes and the token file is replaced
+atomically
+"""
+import multiprocessing
+import os
+import threading
+import time
+from os.path import join
+
+import pytest
+import yaml
+from wxc_sdk.tokens import Tokens
+
+from flask_app import token_manager
+from flask_app.token_manager import TokenManager
+
+REFRESH_MARGIN = 60 * 60
+
+
+def new_tokens(access_token: str, expires_in: int) -> Tokens:
+    tokens = Tokens(access_token=access_token, refresh_token='refresh', expires_in=expires_in)
+    tokens.set_expiration()
+    return tokens
+
+
+@pytest.fixture
+def token_path(tmp_path) -> str:
+    """
+    Token file with an access token within the refresh margin
+    """
+    path = join(tmp_path, 'tokens.yml')
+    TokenManager(path, get_new_tokens=None).write_tokens_to_file(new_tokens('old', expires_in=60))
+    return path
+
+
+def counting_refresh(counter: str, access_token: str):
+    """
+    get_new_tokens callable which records each call in a counter file
+    """
+
+    def get_new_tokens() -> Tokens:
+        with open(counter, mode='a') as f:
+            f.write('.')
+        # wide window for concurrent refreshes
+        time.sleep(0.3)
+        return new_tokens(access_token, expires_in=14 * 24 * 60 * 60)
+
+    return get_new_tokens
+
+
+def refresh_in_process(path: str, counter: str, name: str, results: multiprocessing.Queue):
+    manager = TokenManager(path, get_new_tokens=counting_refresh(counter, f'new-{name}'),
+                           refresh_margin=REFRESH_MARGIN)
+    results.put(manager.refresh().access_token)
+
+
+def refreshes(counter: str) -> int:
+    with open(counter) as f:
+        return len(f.read())
+
+
+def test_refresh_single_flight_across_threads(token_path: str, tmp_path):
+    counter = join(tmp_path, 'counter')
+    manager = TokenManager(token_path, get_new_tokens=counting_refresh(counter, 'new'),
+                           refresh_margin=REFRESH_MARGIN)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(manager.get_tokens().access_token))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert results == ['new'] * 4
+    assert refreshes(counter) == 1
+    assert manager.refreshes == 1
+
+
+@pytest.mark.skipif(token_manager.fcntl is None, reason='no inter-process locking on this platform')
+def test_refresh_single_flight_across_processes(token_path: str, tmp_path):
+    counter = join(tmp_path, 'counter')
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = [context.Process(target=refresh_in_process, args=(token_path, counter, f'{i}', results))
+                 for i in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=10)
+    access_tokens = {results.get(timeout=1) for _ in processes}
+    # one process refreshed, the others picked up the tokens from the file
+    assert refreshes(counter) == 1
+    assert len(access_tokens) == 1
+    with open(token_path) as f:
+        assert yaml.safe_load(f)['access_token'] in access_tokens
+
+
+def test_write_replaces_file_atomically(token_path: str, tmp_path, monkeypatch):
+    manager = TokenManager(token_path, get_new_tokens=None)
+    with open(token_path) as f:
+        before = f.read()
+
+    def failing_dump(data, stream):
+        stream.write('access_token: partial')
+        raise OSError('disk full')
+
+    monkeypatch.setattr(token_manager, 'safe_dump', failing_dump)
+    with pytest.raises(OSError):
+        manager.write_tokens_to_file(new_tokens('new', expires_in=3600))
+    # the token file is untouched and the temporary file is removed
+    with open(token_path) as f:
+        assert f.read() == before
+    assert sorted(os.listdir(tmp_path)) == ['tokens.yml']
+
+    monkeypatch.undo()
+    manager.write_tokens_to_file(new_tokens('new', expires_in=3600))
+    assert manager.read_tokens_from_file().access_token == 'new'
+    assert sorted(os.listdir(tmp_path)) == ['tokens.yml']
+
+
+def test_failed_refresh_keeps_tokens(token_path: str):
+    def fail() -> Tokens:
+        raise RuntimeError('token service unavailable')
+
+    manager = TokenManager(token_path, get_new_tokens=fail, refresh_margin=REFRESH_MARGIN)
+    with pytest.raises(RuntimeError):
+        manager.refresh()
+    assert manager.failures == 1
+    assert manager.read_tokens_from_file().access_token == 'old'
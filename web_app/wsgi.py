@@ -0,0 +1,12 @@
+"""
+WSGI entry point for production. Run with gunicorn:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from flask_app import create_app
+from flask_app.request_logging import configure_logging
+
+configure_logging(production=True)
+
+# background threads are started in each worker after the fork; see post_worker_init() in gunicorn.conf.py
+app = create_app(production=True, start_background=False)